@@ -0,0 +1,274 @@
+from dqn_agent import DeepQNetwork
+from envs.shooterEnv import ShooterEnv
+from policy import NumpyPolicy
+from replay_buffer import MemmapReplayBuffer
+
+import queue
+import time
+import numpy as np
+import torch as T
+import torch.multiprocessing as mp
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+
+
+def actor(index, transitions, weights, version, epsilon, lock, stop, input_dims, n_actions, chunk_size, seed,
+          env_kwargs):
+    """
+    Actor process loop, playing ShooterEnv with the latest weights published by the learner
+
+    :param index: The actor index
+    :param transitions: The queue the transitions are sent through
+    :param weights: The shared flat vector of network weights
+    :param version: The shared version of the weights, incremented by every broadcast
+    :param epsilon: The shared exploration rate
+    :param lock: The lock protecting the weights
+    :param stop: The event telling the actor to stop
+    :param input_dims: The size of an observation
+    :param n_actions: The number of actions
+    :param chunk_size: The number of transitions sent at once
+    :param seed: Base random seed, each actor uses seed + its index
+    :param env_kwargs: Keyword arguments of ShooterEnv
+    """
+    # several actors share the cores, and the forwards are too small to gain from intra-op threads
+    T.set_num_threads(1)
+    T.manual_seed(seed + index)
+    np.random.seed(seed + index)
+    transitions.cancel_join_thread()
+
+    network = DeepQNetwork(0, input_dims, n_actions).to('cpu')
+    local_version = -1
+    env = ShooterEnv(render_mode=None, **env_kwargs)
+    env.seed(seed + index)
+
+    states = np.zeros((chunk_size, input_dims), dtype=np.float32)
+    new_states = np.zeros((chunk_size, input_dims), dtype=np.float32)
+    actions = np.zeros(chunk_size, dtype=np.int64)
+    rewards = np.zeros(chunk_size, dtype=np.float32)
+    terminals = np.zeros(chunk_size, dtype=np.bool_)
+    scores = []
+    n = 0
+
+    observation = env.reset().astype(np.float32)
+    try:
+        while not stop.is_set():
+            if version.value != local_version:
+                with lock:
+                    local_version = version.value
+                    vector_to_parameters(weights, network.parameters())
+
+            if np.random.random() > epsilon.value:
+                with T.no_grad():
+                    action = T.argmax(network(T.from_numpy(observation)[None])).item()
+            else:
+                action = np.random.randint(n_actions)
+            observation_, reward, done, _ = env.step(action)
+            observation_ = observation_.astype(np.float32)
+
+            states[n], actions[n], rewards[n], new_states[n], terminals[n] = \
+                observation, action, reward, observation_, done
+            n += 1
+            if done:
+                scores.append(reward)
+                observation_ = env.reset().astype(np.float32)
+            observation = observation_
+
+            if n == chunk_size:
+                chunk = (states.copy(), actions.copy(), rewards.copy(), new_states.copy(), terminals.copy(), scores)
+                # blocks while the learner is behind, but keeps watching the stop event
+                while not stop.is_set():
+                    try:
+                        transitions.put(chunk, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                scores = []
+                n = 0
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+
+
+def check_memory(agent):
+    """
+    Refuse a replay memory on disk, whose layout needs the transitions of a single sequential stream
+
+    :param agent: The dqn_agent.Agent to train
+    """
+    if isinstance(agent.memory, MemmapReplayBuffer):
+        raise ValueError("the replay memory on disk (memory_dir) needs a single stream of transitions, "
+                         "create the agent without memory_dir to train with several actors or environments")
+
+
+def train(agent, num_episodes, num_actors=2, update_to_data=1.0, broadcast_interval=100, chunk_size=64,
+          queue_size=64, checkpoint_interval=None, report_interval=10.0, policy_path=None, metrics=None, seed=42,
+          start_method='spawn', **env_kwargs):
+    """
+    Train a DQN agent with actor processes collecting transitions while the learner trains on them.
+
+    The actors play with a copy of the network, refreshed every broadcast_interval updates, and send their
+    transitions in chunks through a bounded queue: when the learner is behind, the actors wait.
+    The chunks of the actors interleave, so the agent must keep its replay memory in RAM: the memory on disk
+    only stores each observation once for a single sequential stream of transitions.
+
+    :param agent: The dqn_agent.Agent trained by the learner, without memory_dir
+    :param num_episodes: The number of episodes to play, over all the actors
+    :param num_actors: The number of actor processes
+    :param update_to_data: The number of learner updates per collected transition
+    :param broadcast_interval: The number of updates between two weight broadcasts
+    :param chunk_size: The number of transitions an actor sends at once
+    :param queue_size: The number of chunks the queue can hold
+    :param checkpoint_interval: Save the agent every checkpoint_interval episodes, never if None
+    :param report_interval: The number of seconds between two throughput reports
+    :param policy_path: Also publish the broadcast weights to this NumpyPolicy file, e.g. for an InferenceServer
+    :param metrics: Optional metrics.MetricsLogger, logging the score, epsilon and loss of every episode
+    :param seed: Base random seed, each actor uses seed + its index
+    :param start_method: The multiprocessing start method, spawn as torch thread pools are not fork safe
+    :param env_kwargs: Keyword arguments of ShooterEnv
+    :return: A tuple with the episode scores, and the epsilon at the end of each episode
+    """
+    check_memory(agent)
+    ctx = mp.get_context(start_method)
+    network = agent.Q_eval
+    weights = parameters_to_vector(network.parameters()).detach().cpu().share_memory_()
+    version = ctx.Value('l', 0, lock=False)
+    epsilon = ctx.Value('d', agent.epsilon, lock=False)
+    lock = ctx.Lock()
+    stop = ctx.Event()
+    transitions = ctx.Queue(queue_size)
+
+    def broadcast():
+        with lock:
+            weights.copy_(parameters_to_vector(network.parameters()).detach())
+            version.value += 1
+        epsilon.value = agent.epsilon
+        if policy_path is not None:
+            NumpyPolicy.from_state_dict(network.state_dict()).save(policy_path)
+
+    processes = []
+    for i in range(num_actors):
+        process = ctx.Process(target=actor, daemon=True,
+                              args=(i, transitions, weights, version, epsilon, lock, stop, network.input_dims,
+                                    network.n_actions, chunk_size, seed, env_kwargs))
+        process.start()
+        processes.append(process)
+
+    scores, eps_history = [], []
+    steps = updates = 0
+    # updates owed to the collected transitions
+    budget = 0.0
+    start = last_report = time.time()
+    report_steps, report_updates = 0, 0
+    try:
+        while len(scores) < num_episodes:
+            can_learn = budget >= 1 and agent.mem_cntr >= agent.batch_size
+            try:
+                # wait for data only when there is nothing to learn
+                chunk = transitions.get_nowait() if can_learn else transitions.get(timeout=1.0)
+            except queue.Empty:
+                chunk = None
+
+            if chunk is not None:
+                states, actions, rewards, new_states, terminals, chunk_scores = chunk
+                for transition in zip(states, actions, rewards, new_states, terminals):
+                    agent.store_transition(*transition)
+                steps += len(actions)
+                budget += update_to_data * len(actions)
+                for score in chunk_scores:
+                    scores.append(score)
+                    eps_history.append(agent.epsilon)
+                    if metrics is not None:
+                        metrics.log(score=score, epsilon=agent.epsilon, loss=agent.loss)
+                    if checkpoint_interval and len(scores) % checkpoint_interval == 0:
+                        agent.save_models()
+
+            if budget >= 1 and agent.mem_cntr >= agent.batch_size:
+                agent.learn()
+                updates += 1
+                budget -= 1
+                if updates % broadcast_interval == 0:
+                    broadcast()
+
+            now = time.time()
+            if now - last_report >= report_interval:
+                elapsed = now - last_report
+                print('episodes %d' % len(scores),
+                      ' average score %.1f' % np.mean(scores[-100:] or [0]),
+                      ' actor steps/s %.0f' % ((steps - report_steps) / elapsed),
+                      ' learner updates/s %.0f' % ((updates - report_updates) / elapsed),
+                      ' queued chunks %d' % transitions.qsize(),
+                      ' epsilon %.2f' % agent.epsilon)
+                last_report, report_steps, report_updates = now, steps, updates
+    finally:
+        stop.set()
+        # empty the queue so that no actor stays blocked on it
+        while any(process.is_alive() for process in processes):
+            try:
+                transitions.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in processes:
+            process.join()
+
+    elapsed = time.time() - start
+    print('total: actor steps/s %.0f' % (steps / elapsed), ' learner updates/s %.0f' % (updates / elapsed))
+    return scores[:num_episodes], eps_history[:num_episodes]
+
+
+def train_vectorized(agent, num_episodes, num_envs=8, num_workers=None, update_to_data=1.0,
+                     checkpoint_interval=None, metrics=None, seed=42, start_method='spawn', **env_kwargs):
+    """
+    Train a DQN agent on environments stepped by SubprocShooterEnv workers while the agent learns.
+
+    The actions of a step are chosen with the current network, then the workers simulate the step while the
+    agent learns on the transitions stored so far, and the new transitions are stored once the step is done.
+    The agent thus learns one step behind the environments instead of waiting for them.
+    The transitions of the environments interleave, so the agent must keep its replay memory in RAM, see train.
+
+    :param agent: The dqn_agent.Agent to train, without memory_dir
+    :param num_episodes: The number of episodes to play, over all the environments
+    :param num_envs: The number of environments
+    :param num_workers: The number of worker processes, one per CPU by default
+    :param update_to_data: The number of updates per collected transition
+    :param checkpoint_interval: Save the agent every checkpoint_interval episodes, never if None
+    :param metrics: Optional metrics.MetricsLogger, logging the score, length, epsilon and loss of every episode
+    :param seed: Base random seed, each environment uses seed + its index
+    :param start_method: The multiprocessing start method of the workers
+    :param env_kwargs: Keyword arguments of ShooterEnv
+    :return: A tuple with the episode scores, and the epsilon at the end of each episode
+    """
+    from envs.subprocShooterEnv import SubprocShooterEnv
+
+    check_memory(agent)
+    env = SubprocShooterEnv(num_envs, num_workers, seed=seed, start_method=start_method, **env_kwargs)
+    scores, eps_history = [], []
+    lengths = np.zeros(num_envs, dtype=np.int64)
+    # updates owed to the collected transitions
+    budget = 0.0
+    try:
+        observations = env.reset().astype(np.float32)
+        while len(scores) < num_episodes:
+            actions = agent.choose_actions(observations)
+            env.step_async(actions)
+            while budget >= 1 and agent.mem_cntr >= agent.batch_size:
+                agent.learn()
+                budget -= 1
+            observations_, rewards, dones, info = env.step_wait()
+            terminal_observations = info['terminal_observation'].astype(np.float32)
+            for transition in zip(observations, actions, rewards, terminal_observations, dones.astype(np.int64)):
+                agent.store_transition(*transition)
+            budget += update_to_data * num_envs
+            observations = observations_.astype(np.float32)
+
+            lengths += 1
+            for score, length in zip(rewards[dones].tolist(), lengths[dones].tolist()):
+                scores.append(score)
+                eps_history.append(agent.epsilon)
+                if metrics is not None:
+                    metrics.log(score=score, length=length, epsilon=agent.epsilon, loss=agent.loss)
+                if checkpoint_interval and len(scores) % checkpoint_interval == 0:
+                    agent.save_models()
+            lengths[dones] = 0
+    finally:
+        env.close()
+    return scores[:num_episodes], eps_history[:num_episodes]
@@ -0,0 +1,371 @@
+"""
+Benchmarks of the environment and agent hot paths.
+
+Every scenario is seeded and timed call by call, after a warm-up, for at least --min-time seconds. Its result
+holds the operations per second, the p50/p99 latency of one operation and the peak memory traced while
+setting it up and running a few calls. Results are written as JSON, and can be compared with a baseline:
+    python3 benchmark.py --output bench/baseline.json
+    python3 benchmark.py --compare bench/baseline.json
+The comparison exits with status 1 when a scenario got slower than the baseline by more than --threshold.
+
+--imports checks instead the import time of the modules loaded by short-lived worker and evaluation processes,
+in fresh interpreters, against IMPORT_BUDGETS, and that they do not load heavy dependencies they do not need.
+"""
+
+from envs.collision import bullet_enemy_collisions
+from envs.entities import Bullet, Enemy, border_distance, entity_intersection, line_entity_intersection
+from envs.grid import grid_bullet_enemy_collisions
+from envs.param import *
+from envs.shooterEnv import ShooterEnv
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# import time budget in milliseconds, and heavy dependencies allowed, of the modules workers import
+IMPORT_BUDGETS = {
+    'envs': (50, ()),
+    'envs.observations': (250, ()),
+    'envs.grid': (250, ()),
+    'envs.raster': (250, ()),
+    'envs.shooterEnv': (400, ('gym',)),
+    'envs.vectorShooterEnv': (400, ('gym',)),
+    'tabular': (250, ()),
+    'policy': (250, ()),
+    'checkpoint': (250, ()),
+    'metrics': (250, ()),
+    'utils': (250, ()),
+    'recorder': (250, ()),
+}
+# dependencies only loaded when rendering, recording, plotting or training a DQN
+HEAVY_MODULES = ('gym', 'torch', 'matplotlib', 'imageio', 'pyglet', 'PIL')
+# fresh interpreters started per module, the fastest import is kept
+IMPORT_REPEAT = 3
+# number of calls run before timing, and under tracemalloc
+WARMUP_CALLS = 5
+# operations per call of the microbenchmarks
+MICRO_BATCH = 256
+
+
+def populate(env, rng, n_enemies, n_bullets, clearance=150):
+    """
+    Add enemies and bullets at random positions to the scene of an env, keeping the enemies away from the player
+
+    :param env: A reset ShooterEnv
+    :param rng: The NumPy generator of the positions
+    :param n_enemies: The number of enemies to add
+    :param n_bullets: The number of bullets to add
+    :param clearance: The smallest distance between the player and an enemy
+    """
+    env.enemy_limit = max(env.enemy_limit, n_enemies)
+    while len(env.enemies) < n_enemies:
+        x, y = rng.uniform(0, env.width), rng.uniform(0, env.height)
+        if math.hypot(x - env.player.x, y - env.player.y) < clearance:
+            continue
+        enemy = env.pools['enemy'].acquire((x, y))
+        env.enemies.append(enemy)
+    for _ in range(n_bullets):
+        position = rng.uniform(0, env.width), rng.uniform(0, env.height)
+        env.bullets.append(env.pools['bullet'].acquire(position, DIRECTIONS[rng.integers(len(DIRECTIONS))]))
+
+
+def scene(seed, n_enemies, n_bullets, **env_kwargs):
+    env = ShooterEnv(render_mode=None, **env_kwargs)
+    env.seed(seed)
+    env.reset()
+    rng = np.random.default_rng(seed)
+    populate(env, rng, n_enemies, n_bullets)
+    return env, rng
+
+
+def env_step(seed, enemies, bullets, arena=SCREEN_WIDTH):
+    """
+    ShooterEnv.step from the same scene every call, restored with set_state before it
+    """
+    env, rng = scene(seed, enemies, bullets, width=arena, height=arena)
+    snapshot = env.get_state()
+    actions = itertools.cycle(rng.integers(8, size=1024).tolist())
+    return lambda: env.step(next(actions)), lambda: env.set_state(snapshot)
+
+
+def make_observations(seed, enemies):
+    """
+    ShooterEnv.make_observations alone
+    """
+    env, _ = scene(seed, enemies, 0)
+    return lambda: env.make_observations(0), None
+
+
+def collisions(seed, arena, entities, broad_phase):
+    """
+    Bullet-enemy collisions of as many enemies as bullets spread over a square arena, testing every pair or
+    through the grid, to find the entity count from which the grid pays off (grid.GRID_THRESHOLD)
+    """
+    rng = np.random.default_rng(seed)
+    enemy_x, enemy_y, bullet_x, bullet_y = rng.uniform(0, arena, size=(4, entities // 2))
+    if broad_phase == 'grid':
+        return lambda: grid_bullet_enemy_collisions(enemy_x, enemy_y, bullet_x, bullet_y), None
+    return lambda: bullet_enemy_collisions(enemy_x, enemy_y, bullet_x, bullet_y), None
+
+
+def random_entities(rng, cls, n, *args):
+    return [cls((rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT)), *args) for _ in range(n)]
+
+
+def entity_intersection_micro(seed):
+    rng = np.random.default_rng(seed)
+    pairs = list(zip(random_entities(rng, Bullet, MICRO_BATCH, (1, 0)), random_entities(rng, Enemy, MICRO_BATCH)))
+    return lambda: [entity_intersection(bullet, enemy) for bullet, enemy in pairs], None
+
+
+def line_entity_intersection_micro(seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, SCREEN_WIDTH, size=(MICRO_BATCH, 4)).tolist()
+    cases = [((x1, y1), (x2, y2), enemy)
+             for (x1, y1, x2, y2), enemy in zip(points, random_entities(rng, Enemy, MICRO_BATCH))]
+    return lambda: [line_entity_intersection(p1, p2, enemy) for p1, p2, enemy in cases], None
+
+
+def border_distance_micro(seed):
+    rng = np.random.default_rng(seed)
+    cases = np.column_stack([rng.uniform(0, SCREEN_WIDTH, MICRO_BATCH), rng.uniform(0, SCREEN_HEIGHT, MICRO_BATCH),
+                             rng.integers(N_OBSERVATIONS, size=MICRO_BATCH) * 2 * math.pi / N_OBSERVATIONS]).tolist()
+    return lambda: [border_distance(x, y, theta) for x, y, theta in cases], None
+
+
+def agent(seed, max_mem_size=100000, batch_size=64, filled=0):
+    """
+    Create a greedy DQN agent, with a replay memory holding filled random transitions
+    """
+    import torch as T
+    from dqn_agent import Agent
+
+    T.manual_seed(seed)
+    np.random.seed(seed)
+    agent = Agent(gamma=0.99, epsilon=0.0, lr=1e-3, input_dims=19, batch_size=batch_size, n_actions=8,
+                  max_mem_size=max_mem_size, eps_end=0.0)
+    rng = np.random.default_rng(seed)
+    observations = rng.integers(0, SCREEN_WIDTH, size=(filled + 1, 19)).astype(np.float32)
+    for i in range(filled):
+        agent.store_transition(observations[i], rng.integers(8), KILLED_ENEMY, observations[i + 1], False)
+    return agent, rng
+
+
+def choose_action(seed):
+    agent_, rng = agent(seed)
+    observations = itertools.cycle(rng.integers(0, SCREEN_WIDTH, size=(256, 19)).astype(np.float32))
+    return lambda: agent_.choose_action(next(observations)), None
+
+
+def store_transition(seed, max_mem_size):
+    agent_, rng = agent(seed, max_mem_size)
+    observations = rng.integers(0, SCREEN_WIDTH, size=(257, 19)).astype(np.float32)
+    steps = itertools.cycle(range(256))
+
+    def run():
+        i = next(steps)
+        agent_.store_transition(observations[i], i % 8, 0, observations[i + 1], False)
+    return run, None
+
+
+def learn(seed, max_mem_size, batch_size):
+    agent_, _ = agent(seed, max_mem_size, batch_size, filled=max_mem_size)
+    return agent_.learn, None
+
+
+# scenarios of the DQN agent, a small agent is created before tracing their memory, so that torch and the
+# modules it loads on first use are not counted
+AGENT_SCENARIOS = ('choose_action', 'store_transition', 'learn')
+# name, scenario factory, parameters and operations per call
+SCENARIOS = [('env_step', env_step, {'enemies': enemies, 'bullets': bullets}, 1)
+             for enemies, bullets in [(0, 0), (5, 5), (20, 20), (ENEMY_LIMIT, 40)]] + \
+            [('env_step', env_step, {'enemies': 1000, 'bullets': 1000, 'arena': 2400}, 1)] + \
+            [('collisions', collisions, {'arena': arena, 'entities': entities, 'broad_phase': broad_phase}, 1)
+             for arena in (SCREEN_WIDTH, 2400) for entities in (50, 100, 200, 400, 1600)
+             for broad_phase in ('pairs', 'grid')] + \
+            [('make_observations', make_observations, {'enemies': enemies}, 1) for enemies in (0, 5, 20, ENEMY_LIMIT)] + \
+            [('entity_intersection', entity_intersection_micro, {}, MICRO_BATCH),
+             ('line_entity_intersection', line_entity_intersection_micro, {}, MICRO_BATCH),
+             ('border_distance', border_distance_micro, {}, MICRO_BATCH),
+             ('choose_action', choose_action, {}, 1)] + \
+            [('store_transition', store_transition, {'max_mem_size': size}, 1) for size in (10000, 100000)] + \
+            [('learn', learn, {'max_mem_size': size, 'batch_size': batch}, 1)
+             for size, batch in [(10000, 64), (100000, 64), (100000, 256)]]
+
+
+def scenario_key(name, params):
+    return name + ''.join('[%s=%s]' % item for item in params.items())
+
+
+def measure(run, prepare=None, batch=1, min_time=0.5, min_calls=20, max_calls=100000):
+    """
+    Time the calls of a scenario one by one
+
+    :param run: The timed function
+    :param prepare: An optional function called before every call, not timed
+    :param batch: The number of operations per call
+    :param min_time: The least time spent in the timed calls, in seconds
+    :param min_calls: The least number of timed calls
+    :param max_calls: The largest number of timed calls
+    :return: A dict with the number of calls, the operations per second, and the mean, p50 and p99 latency of
+        one operation in microseconds
+    """
+    for _ in range(WARMUP_CALLS):
+        if prepare is not None:
+            prepare()
+        run()
+    samples, total = [], 0.0
+    while (total < min_time or len(samples) < min_calls) and len(samples) < max_calls:
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed)
+        total += elapsed
+    latencies = np.array(samples) / batch * 1e6
+    return {'calls': len(samples), 'ops_per_sec': len(samples) * batch / total, 'mean_us': latencies.mean(),
+            'p50_us': np.percentile(latencies, 50), 'p99_us': np.percentile(latencies, 99)}
+
+
+def run_scenario(factory, params, batch=1, seed=0, min_time=0.5):
+    """
+    Set a scenario up and measure it
+
+    :param factory: The scenario factory, returning the timed function and the optional function preparing it
+    :param params: The keyword arguments of the factory
+    :param batch: The number of operations per call
+    :param seed: The random seed of the scenario
+    :param min_time: The least time spent in the timed calls, in seconds
+    :return: The measure() dict, with the peak traced memory in KiB
+    """
+    # the memory is traced apart from the timed calls, tracemalloc slowing allocations down
+    tracemalloc.start()
+    run, prepare = factory(seed, **params)
+    for _ in range(WARMUP_CALLS):
+        if prepare is not None:
+            prepare()
+        run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = measure(run, prepare, batch, min_time)
+    result['peak_kib'] = peak / 1024
+    return result
+
+
+def run_all(pattern=None, seed=0, min_time=0.5):
+    """
+    :param pattern: Only run the scenarios whose key contains it
+    :param seed: The random seed of the scenarios
+    :param min_time: The least time spent in the timed calls of each scenario, in seconds
+    :return: The report, a dict with the environment description and the results of each scenario
+    """
+    results = {}
+    for name, factory, params, batch in SCENARIOS:
+        key = scenario_key(name, params)
+        if pattern is None or pattern in key:
+            if name in AGENT_SCENARIOS:
+                agent(seed, max_mem_size=64, filled=64)[0].learn()
+            results[key] = result = run_scenario(factory, params, batch, seed, min_time)
+            print('%-55s %12.0f ops/s  p50 %9.2f us  p99 %9.2f us  peak %9.0f KiB'
+                  % (key, result['ops_per_sec'], result['p50_us'], result['p99_us'], result['peak_kib']))
+    return {'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                     'cpus': os.cpu_count(), 'seed': seed, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+def import_time(module):
+    """
+    Import a module in fresh interpreters
+
+    :param module: The module name
+    :return: A tuple with the fastest import time in milliseconds, and the heavy modules it loaded
+    """
+    code = ('import sys, time; start = time.perf_counter(); import %s; elapsed = time.perf_counter() - start; '
+            'print(elapsed * 1e3); print(",".join(m for m in %r if m in sys.modules))' % (module, HEAVY_MODULES))
+    times = []
+    for _ in range(IMPORT_REPEAT):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.splitlines()
+        times.append(float(output[-2]))
+    return min(times), [name for name in output[-1].split(',') if name]
+
+
+def check_imports():
+    """
+    Measure the import time of the modules of IMPORT_BUDGETS, printing them against their budget
+
+    :return: The modules over budget or loading heavy dependencies they are not allowed
+    """
+    failures = []
+    for module, (budget, allowed) in IMPORT_BUDGETS.items():
+        elapsed, heavy = import_time(module)
+        unexpected = [name for name in heavy if name not in allowed]
+        failed = elapsed > budget or unexpected
+        if failed:
+            failures.append(module)
+        print('%-25s %8.1f ms  budget %5d ms  heavy: %-20s%s'
+              % (module, elapsed, budget, ','.join(heavy) or '-', '  OVER BUDGET' if failed else ''))
+    return failures
+
+
+def compare(baseline, report, threshold=0.1):
+    """
+    Compare the results of two runs, printing the speed ratio of every scenario they share
+
+    :param baseline: The reference report
+    :param report: The new report
+    :param threshold: The relative slowdown of the operations per second counted as a regression
+    :return: The keys of the regressed scenarios
+    """
+    regressions = []
+    for key, result in report['results'].items():
+        reference = baseline['results'].get(key)
+        if reference is None:
+            continue
+        ratio = result['ops_per_sec'] / reference['ops_per_sec']
+        regressed = ratio < 1 - threshold
+        if regressed:
+            regressions.append(key)
+        print('%-55s %6.2fx  p99 %9.2f -> %9.2f us%s'
+              % (key, ratio, reference['p99_us'], result['p99_us'], '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the environment and agent hot paths')
+    parser.add_argument('--output', help='the JSON file the results are written to')
+    parser.add_argument('--compare', help='a JSON file of baseline results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown counted as a regression')
+    parser.add_argument('--filter', help='only run the scenarios whose name contains this string')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds of timed calls per scenario')
+    parser.add_argument('--imports', action='store_true', help='check the import time budgets instead')
+    args = parser.parse_args()
+
+    if args.imports:
+        failures = check_imports()
+        if failures:
+            print('%d module(s) over their import budget' % len(failures))
+            raise SystemExit(1)
+        raise SystemExit(0)
+
+    report = run_all(args.filter, args.seed, args.min_time)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print('%d regression(s) above %.0f%%' % (len(regressions), args.threshold * 100))
+            raise SystemExit(1)
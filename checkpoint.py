@@ -0,0 +1,146 @@
+"""
+Binary checkpoints of the tabular and DQN agents.
+
+A checkpoint file is laid out as:
+    MAGIC | header size (uint64, little endian) | JSON header | padding | arrays
+The header holds the format version, the agent kind, its hyperparameters and counters, and the dtype, shape
+and offset of every array. Arrays start on ALIGNMENT byte boundaries, so they are memory mapped in place.
+"""
+
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b'SHOOTCKP'
+VERSION = 1
+ALIGNMENT = 64
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save(path, kind, arrays, meta):
+    """
+    Write a checkpoint, replacing the file atomically
+
+    :param path: The checkpoint file
+    :param kind: The agent kind, 'tabular' or 'dqn'
+    :param arrays: A dict of NumPy arrays
+    :param meta: A dict of JSON serializable hyperparameters and counters
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    entries, offset = [], 0
+    for name, array in arrays.items():
+        offset = align(offset)
+        entries.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        offset += array.nbytes
+    header = json.dumps({'version': VERSION, 'kind': kind, 'meta': meta, 'arrays': entries}).encode()
+    data_start = align(len(MAGIC) + 8 + len(header))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for entry, array in zip(entries, arrays.values()):
+            f.seek(data_start + entry['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(path + '.tmp', path)
+
+
+def load(path, mmap=True):
+    """
+    Read a checkpoint
+
+    :param path: The checkpoint file
+    :param mmap: Whether to map the arrays read-only instead of reading them
+    :return: A tuple with the agent kind, the dict of arrays and the dict of hyperparameters and counters
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a checkpoint" % path)
+        size, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(size))
+    if header['version'] > VERSION:
+        raise ValueError("%s has format version %d, newer than %d" % (path, header['version'], VERSION))
+
+    data_start = align(len(MAGIC) + 8 + size)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r') if mmap else np.fromfile(path, dtype=np.uint8)
+    arrays = {}
+    for entry in header['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        start = data_start + entry['offset']
+        count = int(np.prod(entry['shape']))
+        arrays[entry['name']] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+    return header['kind'], arrays, header['meta']
+
+
+def save_agent(agent, path):
+    """
+    Write the checkpoint of an agent
+
+    :param agent: A tabular.QLearner or a dqn_agent.Agent
+    :param path: The checkpoint file
+    """
+    if hasattr(agent, 'q_table'):
+        meta = {'alpha': agent.alpha, 'gamma': agent.gamma, 'epsilon': agent.epsilon,
+                'eps_decay': agent.eps_decay, 'min_epsilon': agent.min_epsilon}
+        save(path, 'tabular', {'q_table': agent.q_table}, meta)
+    else:
+        network = agent.Q_eval
+        meta = {'gamma': agent.gamma, 'epsilon': agent.epsilon, 'lr': agent.lr, 'input_dims': network.input_dims,
+                'n_actions': network.n_actions, 'batch_size': agent.batch_size, 'max_mem_size': agent.mem_size,
+                'eps_end': agent.eps_min, 'eps_dec': agent.eps_dec,
+                'iter_cntr': agent.iter_cntr, 'mem_cntr': agent.mem_cntr}
+        arrays = {name: value.detach().cpu().numpy() for name, value in network.state_dict().items()}
+        save(path, 'dqn', arrays, meta)
+
+
+def load_agent(path, mmap=False):
+    """
+    Rebuild an agent from its checkpoint, ready to act and to resume training.
+    A DQN agent starts with an empty replay memory, its mem_cntr is only recorded in the checkpoint.
+
+    :param path: The checkpoint file
+    :param mmap: Whether to map the Q-table read-only instead of reading it, which is enough to act but not to
+    train
+    :return: A tabular.QLearner or a dqn_agent.Agent
+    """
+    kind, arrays, meta = load(path, mmap)
+    if kind == 'tabular':
+        from tabular import QLearner
+
+        learner = QLearner(*arrays['q_table'].shape, **meta)
+        learner.q_table = arrays['q_table']
+        return learner
+
+    import torch as T
+    from dqn_agent import Agent
+
+    agent = Agent(meta['gamma'], meta['epsilon'], meta['lr'], meta['input_dims'], meta['batch_size'],
+                  meta['n_actions'], max_mem_size=meta['max_mem_size'], eps_end=meta['eps_end'],
+                  eps_dec=meta['eps_dec'])
+    agent.Q_eval.load_state_dict({name: T.from_numpy(np.array(array)) for name, array in arrays.items()})
+    agent.iter_cntr = meta['iter_cntr']
+    return agent
+
+
+def load_policy(path):
+    """
+    Load the greedy policy of a checkpoint, without torch
+
+    :param path: The checkpoint file
+    :return: A callable mapping a batch of observations to actions
+    """
+    kind, arrays, meta = load(path)
+    if kind == 'tabular':
+        from tabular import TabularPolicy
+
+        return TabularPolicy(arrays['q_table'])
+
+    from policy import NumpyPolicy
+
+    return NumpyPolicy.from_state_dict(arrays)
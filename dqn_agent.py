@@ -3,6 +3,10 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 import numpy as np
+import os
+from replay_buffer import MemmapReplayBuffer, PrioritizedReplayBuffer, ReplayBuffer
+
+CHECKPOINT = 'checkpoints/dqn_agent.ckpt'
 
 
 class DeepQNetwork(nn.Module):
@@ -29,7 +33,7 @@ class DeepQNetwork(nn.Module):
 
 class Agent:
     def __init__(self, gamma, epsilon, lr, input_dims, batch_size, n_actions,
-                 max_mem_size=100000, eps_end=0.05, eps_dec=5e-4):
+                 max_mem_size=100000, eps_end=0.05, eps_dec=5e-4, prioritized=False, memory_dir=None):
         self.gamma = gamma
         self.epsilon = epsilon
         self.eps_min = eps_end
@@ -38,59 +42,65 @@ class Agent:
         self.action_space = [i for i in range(n_actions)]
         self.mem_size = max_mem_size
         self.batch_size = batch_size
-        self.mem_cntr = 0
         self.iter_cntr = 0
         self.replace_target = 100
+        # loss of the last update, kept on the device until it is logged
+        self.loss = None
 
         self.Q_eval = DeepQNetwork(lr, n_actions=n_actions,
                                    input_dims=input_dims)
-        self.state_memory = np.zeros((self.mem_size, input_dims),
-                                     dtype=np.float32)
-        self.new_state_memory = np.zeros((self.mem_size, input_dims),
-                                         dtype=np.float32)
-        self.action_memory = np.zeros(self.mem_size, dtype=np.int32)
-        self.reward_memory = np.zeros(self.mem_size, dtype=np.float32)
-        self.terminal_memory = np.zeros(self.mem_size, dtype=np.bool_)
+        if memory_dir is not None and prioritized:
+            raise ValueError("the replay memory on disk (memory_dir) is not prioritized")
+        if memory_dir is not None:
+            # on disk, kept across runs
+            self.memory = MemmapReplayBuffer(self.mem_size, input_dims, memory_dir)
+        elif prioritized:
+            self.memory = PrioritizedReplayBuffer(self.mem_size, input_dims)
+        else:
+            self.memory = ReplayBuffer(self.mem_size, input_dims)
 
-    def store_transition(self, state, action, reward, state_, terminal):
-        index = self.mem_cntr % self.mem_size
-        self.state_memory[index] = state
-        self.new_state_memory[index] = state_
-        self.reward_memory[index] = reward
-        self.action_memory[index] = action
-        self.terminal_memory[index] = terminal
+    @property
+    def mem_cntr(self):
+        return self.memory.mem_cntr
 
-        self.mem_cntr += 1
+    def store_transition(self, state, action, reward, state_, terminal):
+        self.memory.store_transition(state, action, reward, state_, terminal)
 
     def choose_action(self, observation):
         if np.random.random() > self.epsilon:
-            state = T.tensor([observation]).to(self.Q_eval.device)
-            actions = self.Q_eval.forward(state)
+            state = T.from_numpy(np.asarray(observation, dtype=np.float32)[None]).to(self.Q_eval.device)
+            with T.inference_mode():
+                actions = self.Q_eval.forward(state)
             action = T.argmax(actions).item()
         else:
             action = np.random.choice(self.action_space)
 
         return action
 
+    def choose_actions(self, observations):
+        """
+        Epsilon-greedy actions of a batch of observations, with a single forward pass
+
+        :param observations: The (N, input_dims) observations, not copied when already float32
+        :return: The (N,) actions
+        """
+        observations = np.asarray(observations, dtype=np.float32)
+        states = T.from_numpy(observations).to(self.Q_eval.device)
+        with T.inference_mode():
+            greedy = T.argmax(self.Q_eval.forward(states), dim=1).cpu().numpy()
+        n = len(observations)
+        explore = np.random.random(n) <= self.epsilon
+        return np.where(explore, np.random.randint(len(self.action_space), size=n), greedy)
+
     def learn(self):
         if self.mem_cntr < self.batch_size:
             return
 
         self.Q_eval.optimizer.zero_grad()
 
-        max_mem = min(self.mem_cntr, self.mem_size)
-
-        batch = np.random.choice(max_mem, self.batch_size, replace=False)
-        batch_index = np.arange(self.batch_size, dtype=np.int32)
-
-        state_batch = T.tensor(self.state_memory[batch]).to(self.Q_eval.device)
-        new_state_batch = T.tensor(
-                self.new_state_memory[batch]).to(self.Q_eval.device)
-        action_batch = self.action_memory[batch]
-        reward_batch = T.tensor(
-                self.reward_memory[batch]).to(self.Q_eval.device)
-        terminal_batch = T.tensor(
-                self.terminal_memory[batch]).to(self.Q_eval.device)
+        state_batch, action_batch, reward_batch, new_state_batch, terminal_batch, weights, batch = \
+            self.memory.sample_buffer(self.batch_size, self.Q_eval.device)
+        batch_index = T.arange(self.batch_size, device=self.Q_eval.device)
 
         q_eval = self.Q_eval.forward(state_batch)[batch_index, action_batch]
         q_next = self.Q_eval.forward(new_state_batch)
@@ -98,13 +108,49 @@ class Agent:
 
         q_target = reward_batch + self.gamma*T.max(q_next, dim=1)[0]
 
-        loss = self.Q_eval.loss(q_target, q_eval).to(self.Q_eval.device)
+        if weights is None:
+            loss = self.Q_eval.loss(q_target, q_eval).to(self.Q_eval.device)
+        else:
+            # importance sampling correction of the prioritized replay
+            loss = (weights * (q_target - q_eval) ** 2).mean()
+            self.memory.update_priorities(batch, (q_target - q_eval).detach().cpu().numpy())
         loss.backward()
         self.Q_eval.optimizer.step()
+        self.loss = loss.detach()
 
         self.iter_cntr += 1
         self.epsilon = self.epsilon - self.eps_dec \
             if self.epsilon > self.eps_min else self.eps_min
         
     def save_model(self):
-        T.save(self.Q_eval.state_dict(), 'pretrained_model/dqn_agent.pth')
\ No newline at end of file
+        T.save(self.Q_eval.state_dict(), 'pretrained_model/dqn_agent.pth')
+
+    def save_models(self, path=CHECKPOINT):
+        """
+        Save everything needed to resume the training: network, optimizer, counters and replay memory.
+        A memory on disk is flushed and only its counters are saved.
+        The file is replaced atomically, an interrupted save leaves the previous checkpoint intact.
+
+        :param path: The checkpoint file
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        checkpoint = {'model': self.Q_eval.state_dict(),
+                      'optimizer': self.Q_eval.optimizer.state_dict(),
+                      'epsilon': self.epsilon,
+                      'iter_cntr': self.iter_cntr,
+                      'memory': self.memory.state_dict()}
+        T.save(checkpoint, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def load_models(self, path=CHECKPOINT):
+        """
+        Resume from a checkpoint written by save_models
+
+        :param path: The checkpoint file
+        """
+        checkpoint = T.load(path, map_location=self.Q_eval.device, weights_only=False)
+        self.Q_eval.load_state_dict(checkpoint['model'])
+        self.Q_eval.optimizer.load_state_dict(checkpoint['optimizer'])
+        self.epsilon = checkpoint['epsilon']
+        self.iter_cntr = checkpoint['iter_cntr']
+        self.memory.load_state_dict(checkpoint['memory'])
@@ -1,11 +1,13 @@
 import gym
 from gym.envs.registration import register
-import imageio
 import os 
-import torch 
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 from dqn_agent import Agent
+from actor_learner import train, train_vectorized
+from checkpoint import save_agent
+from metrics import MetricsLogger
+from recorder import EpisodeRecorder
 from utils import *
 
 if __name__ == '__main__':
@@ -14,14 +16,27 @@ if __name__ == '__main__':
         entry_point='envs:ShooterEnv',
     )
 
-    env = gym.make('Shooter-v0').env
+    # number of frames each action of the agent is repeated for
+    frame_skip = 1
+    # set to watch the agent train in a window, recorded episodes are rendered in any case
+    render = False
+    # recorded episodes are drawn by the NumPy rasterizer, so that training needs no display unless watched
+    env = gym.make('Shooter-v0', render_mode=None, renderer='opengl' if render else 'numpy',
+                   frame_skip=frame_skip).env
     env.reset()
     num_epochs = 5000 
     load_checkpoint = False
+    # set to collect the transitions in actor processes while the learner trains
+    num_actors = 0
+    # set to step that many environments in worker processes (SubprocShooterEnv) while the agent learns
+    num_envs = 0
+    # replay memory kept on disk, so that a checkpoint can resume with it, only for a single stream of
+    # transitions: the actors and environments interleave theirs, and keep the memory in RAM
+    memory_dir = None if num_actors or num_envs else 'checkpoints/replay'
 
     agent = Agent(gamma=0.99, epsilon=1.0, lr=1e-3,
                   input_dims=19, n_actions=8, eps_end=0.01,
-                  batch_size=64)
+                  batch_size=64, memory_dir=memory_dir)
 
     if load_checkpoint:
         agent.load_models()
@@ -30,49 +45,64 @@ if __name__ == '__main__':
     scores = []
     eps_history = []
     n_steps = 0
-    frames = []
+    recorder = EpisodeRecorder('videos/dqn_agent')
+    # per episode metrics, appended to a CSV file that can be plotted live with metrics.py
+    metrics = MetricsLogger('metrics/dqn_agent.csv')
+    print_interval = 10
 
-    for i in range(num_epochs):
-        done = False
-        observation = env.reset()
-        observation = observation.astype(np.float32)
-
-        while not done:
+    if num_actors:
+        scores, eps_history = train(agent, num_epochs, num_actors=num_actors, checkpoint_interval=10,
+                                    metrics=metrics, frame_skip=frame_skip)
+    elif num_envs:
+        scores, eps_history = train_vectorized(agent, num_epochs, num_envs=num_envs, checkpoint_interval=10,
+                                               metrics=metrics, frame_skip=frame_skip)
+    else:
+        for i in range(num_epochs):
+            done = False
+            observation = env.reset()
+            episode_start = time.perf_counter()
+            episode_steps = 0
+            observation = observation.astype(np.float32)
             if 0 <= i % 1000 <= 5: # record the agent for few trials every 1000 epochs 
-                frame = env.render(mode='rgb_array')
-                frames.append(label_with_episode(frame, i))
-            else:
-                env.render()
+                recorder.start_episode(i)
 
-            action = agent.choose_action(observation)
-            observation_, reward, done, info = env.step(action)
-            n_steps += 1
-            observation = observation.astype(np.float32)
-            observation_ = observation_.astype(np.float32)
-            agent.store_transition(observation, action,
-                                    reward, observation_, int(done))
-            agent.learn()
+            while not done:
+                if recorder.wants_frame():
+                    recorder.add_frame(env.render(mode='rgb_array'))
+                elif render and not recorder.recording:
+                    env.render(mode='human')
 
-            observation = observation_
+                action = agent.choose_action(observation)
+                observation_, reward, done, info = env.step(action)
+                n_steps += 1
+                episode_steps += 1
+                observation = observation.astype(np.float32)
+                observation_ = observation_.astype(np.float32)
+                agent.store_transition(observation, action,
+                                        reward, observation_, int(done))
+                agent.learn()
 
-        scores.append(reward)
-        avg_score = np.mean(scores[max(0, i-100):(i+1)])
-        print('episode: ', i,'score %.1f ' % reward,
-             ' average score %.1f' % avg_score,
-            'epsilon %.2f' % agent.epsilon)
-        #if i > 0 and i % 10 == 0:
-        #    agent.save_models()
+                observation = observation_
 
-        eps_history.append(agent.epsilon)
+            recorder.end_episode()
+            scores.append(reward)
+            metrics.log(score=reward, length=episode_steps, epsilon=agent.epsilon, loss=agent.loss,
+                        steps_per_sec=episode_steps / (time.perf_counter() - episode_start))
+            if i % print_interval == 0:
+                print(metrics.summary())
+            if i > 0 and i % 10 == 0:
+                agent.save_models()
 
-    env.close()
+            eps_history.append(agent.epsilon)
 
-    # save the loaded frames 
-    imageio.mimwrite(os.path.join('./videos/', 'dqn_agent.gif'), frames, fps=60)
+    env.close()
+    recorder.close()
+    metrics.close()
 
     # plotting the graph 
     x = [i+1 for i in range(num_epochs)]
     plotLearning(x, scores, filename)
 
     # saving the agent 
-    agent.save_model()
\ No newline at end of file
+    agent.save_model()
+    save_agent(agent, 'pretrained_model/dqn_agent.bin')
\ No newline at end of file
@@ -1 +1,27 @@
-from envs.shooterEnv import ShooterEnv
+"""
+The environments are imported on first access, so that importing the simulation core (e.g. envs.observations,
+envs.grid) only loads NumPy, and gym only when an environment is used.
+"""
+
+import importlib
+
+# exported name -> module defining it
+EXPORTS = {
+    'ShooterEnv': 'envs.shooterEnv',
+    'SubprocShooterEnv': 'envs.subprocShooterEnv',
+    'VectorShooterEnv': 'envs.vectorShooterEnv',
+}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError("module 'envs' has no attribute %r" % name)
+    value = getattr(importlib.import_module(EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
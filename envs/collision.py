@@ -0,0 +1,141 @@
+from envs.param import *
+
+import math
+import numpy as np
+
+
+def entity_radius(type):
+    """
+    Radius of the circle hitbox of an entity type
+
+    :param type: The entity type, a key of ENTITIES
+    :return: The hitbox radius
+    """
+    rect = ENTITIES.get(type).get('rect')
+    return math.sqrt(pow(rect[0], 2) + pow(rect[1], 2))
+
+
+# hitbox radius of each entity type, computed once
+RADII = {type: entity_radius(type) for type in ENTITIES}
+# below this many bullet-enemy pairs, testing the entities one by one beats building arrays
+SCAN_PAIRS = 256
+
+
+def reach(type1, type2):
+    """
+    Largest distance along each axis at which two entities still touch, see entities.entity_intersection
+
+    :param type1: The type of the first entity
+    :param type2: The type of the second entity
+    :return: The collision reach
+    """
+    return max(RADII[type1], RADII[type2])
+
+
+def overlaps(x1, y1, x2, y2, reach):
+    """
+    Element-wise hitbox test between two sets of entities, broadcasting like NumPy
+
+    :param x1: X coordinates of the first entities
+    :param y1: Y coordinates of the first entities
+    :param x2: X coordinates of the second entities
+    :param y2: Y coordinates of the second entities
+    :param reach: The collision reach of the two entity types
+    :return: The intersection mask
+    """
+    return (np.fabs(x1 - x2) < reach) & (np.fabs(y1 - y2) < reach)
+
+
+def bullet_enemy_collisions(enemy_x, enemy_y, bullet_x, bullet_y, enemy_alive=None, bullet_alive=None):
+    """
+    Resolve every bullet-enemy collision at once.
+    Enemies are processed in order, each one is killed by the first bullet (in order) touching it that did not
+    kill an enemy before, so the result does not depend on how the pairs are enumerated.
+    Arrays may carry leading batch dimensions, e.g. (num_envs, capacity).
+
+    :param enemy_x: X coordinates of the enemies
+    :param enemy_y: Y coordinates of the enemies
+    :param bullet_x: X coordinates of the bullets
+    :param bullet_y: Y coordinates of the bullets
+    :param enemy_alive: Optional mask of the enemy slots in use
+    :param bullet_alive: Optional mask of the bullet slots in use
+    :return: A tuple with the masks of the killed enemies and of the bullets that hit them
+    """
+    enemy_x, enemy_y = np.asarray(enemy_x), np.asarray(enemy_y)
+    bullet_x, bullet_y = np.asarray(bullet_x), np.asarray(bullet_y)
+    hits = overlaps(enemy_x[..., :, None], enemy_y[..., :, None], bullet_x[..., None, :], bullet_y[..., None, :],
+                    reach('enemy', 'bullet'))
+    if enemy_alive is not None:
+        hits &= enemy_alive[..., :, None]
+    if bullet_alive is not None:
+        hits &= bullet_alive[..., None, :]
+
+    killed = np.zeros(hits.shape[:-1], dtype=np.bool_)
+    used = np.zeros(hits.shape[:-2] + hits.shape[-1:], dtype=np.bool_)
+    # hits are rare, only the touching pairs need the sequential pass, in (batch, enemy, bullet) order
+    pairs = np.nonzero(hits)
+    if len(pairs[0]):
+        dead, spent = set(), set()
+        for index in zip(*(axis.tolist() for axis in pairs)):
+            enemy, bullet = index[:-1], index[:-2] + index[-1:]
+            if enemy not in dead and bullet not in spent:
+                dead.add(enemy)
+                spent.add(bullet)
+        killed[tuple(zip(*dead))] = True
+        used[tuple(zip(*spent))] = True
+    return killed, used
+
+
+def scan_bullet_enemy_collisions(enemies, bullets):
+    """
+    Scalar version of bullet_enemy_collisions over entities, for the few pairs of a typical scene
+
+    :param enemies: The enemies, in order
+    :param bullets: The bullets, in order
+    :return: A tuple with the lists of the killed enemies and of the bullets that hit them
+    """
+    r = reach('enemy', 'bullet')
+    killed, used = [], []
+    for enemy in enemies:
+        x, y = enemy.x, enemy.y
+        for bullet in bullets:
+            if math.fabs(x - bullet.x) < r and math.fabs(y - bullet.y) < r and bullet not in used:
+                killed.append(enemy)
+                used.append(bullet)
+                break
+    return killed, used
+
+
+def player_enemy_collisions(player_x, player_y, enemy_x, enemy_y, enemy_alive=None):
+    """
+    Find the enemies touching the player.
+    Enemy arrays may carry leading batch dimensions, matching the shape of the player coordinates.
+
+    :param player_x: X coordinate of the player
+    :param player_y: Y coordinate of the player
+    :param enemy_x: X coordinates of the enemies
+    :param enemy_y: Y coordinates of the enemies
+    :param enemy_alive: Optional mask of the enemy slots in use
+    :return: The mask of the enemies touching the player
+    """
+    touching = overlaps(np.asarray(player_x)[..., None], np.asarray(player_y)[..., None],
+                        np.asarray(enemy_x), np.asarray(enemy_y), reach('player', 'enemy'))
+    if enemy_alive is not None:
+        touching &= enemy_alive
+    return touching
+
+
+def scan_player_enemy_collisions(player, enemies):
+    """
+    Scalar version of player_enemy_collisions over entities
+
+    :param player: The player
+    :param enemies: The enemies
+    :return: True if an enemy touches the player
+    """
+    r = reach('player', 'enemy')
+    x, y = player.x, player.y
+    for enemy in enemies:
+        if math.fabs(x - enemy.x) < r and math.fabs(y - enemy.y) < r:
+            return True
+    return False
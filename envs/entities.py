@@ -1,34 +1,114 @@
 import math
+import numpy as np
 from typing import Tuple
 
-from gym.envs.classic_control import rendering
-from gym.envs.classic_control.rendering import Geom
-
+from envs.collision import RADII, reach
 from envs.param import *
 
 
+def load_rendering():
+    """
+    Import gym's pyglet renderer on first use, so that headless simulations never touch OpenGL
+
+    :return: The gym.envs.classic_control.rendering module
+    """
+    from gym.envs.classic_control import rendering
+    return rendering
+
+
+class Pool:
+    """
+    Free list of entities of one class, recycled (with their render geometry) instead of reallocated
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+
+    def acquire(self, *args):
+        """
+        Get an entity, reusing a released one if possible
+
+        :param args: The constructor arguments of the entity class
+        :return: The entity
+        """
+        if self.free:
+            entity = self.free.pop()
+            entity.reset(*args)
+            return entity
+        return self.cls(*args)
+
+    def release(self, entity):
+        """
+        Give back an entity removed from the scene
+
+        :param entity: The entity to recycle
+        """
+        self.free.append(entity)
+
+    def release_all(self, entities):
+        """
+        Give back several entities removed from the scene
+
+        :param entities: The entities to recycle
+        """
+        self.free.extend(entities)
+
+
 class Entity:
+    __slots__ = ('x', 'y', 'type', 'rect', 'velocity', 'trans', '_shape')
+
     def __init__(self, pos, type):
-        self.x = pos[0]
-        self.y = pos[1]
         self.type = type
         self.rect = ENTITIES.get(type).get('rect')
         self.velocity = ENTITIES.get(type).get('initial_velocity') 
-        self.trans = rendering.Transform(translation=pos)
-        self.shape = self.build_shape()
+        # render geometry is only built once a viewer asks for it
+        self.trans = None
+        self._shape = None
+        self.place(pos)
+
+    def place(self, pos):
+        """
+        Move the entity to its initial position, forgetting its previous life in the scene
+        :param pos: The initial position
+        """
+        self.x = pos[0]
+        self.y = pos[1]
 
-    def build_shape(self) -> Geom:
-        img = rendering.Image(ENTITIES.get(self.type).get('shape'), self.rect[0], self.rect[1])
+    @property
+    def shape(self):
+        if self._shape is None:
+            self.trans = load_rendering().Transform(translation=(self.x, self.y))
+            self._shape = self.build_shape()
+        return self._shape
+
+    def build_shape(self):
+        from envs.sprites import Sprite
+        img = Sprite(ENTITIES.get(self.type).get('shape'), self.rect[0], self.rect[1])
         img.set_color(1., 1., 1.)
         img.add_attr(self.trans)
         return img
 
+    def sync_shape(self):
+        """
+        Move the render geometry (if any) to the simulated position
+        """
+        if self.trans is not None:
+            self.trans.set_translation(self.x, self.y)
+
 class Player(Entity):
-    def __init__(self, pos):
-        super().__init__(pos, 'player')
-        self.direction = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1)]
+    __slots__ = ('direction', 'width', 'height')
 
-    def shoot(self, choice):
+    def __init__(self, pos, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        super().__init__(pos, 'player')
+        self.direction = DIRECTIONS
+        # size of the arena the player is kept in
+        self.width = width
+        self.height = height
+
+    def shoot(self, choice, pool=None):
+        if pool is not None:
+            return pool.acquire((self.x, self.y), self.direction[choice])
         return Bullet((self.x, self.y), self.direction[choice])
 
     def advance(self, choice):
@@ -36,20 +116,24 @@ class Player(Entity):
         self.y += self.direction[choice][1] * self.velocity
         # to check if the character go out of bound 
         if self.x < 0: self.x = 0 
-        if self.x > 600: self.x = 600
+        if self.x > self.width: self.x = self.width
         if self.y < 0: self.y = 0 
-        if self.y > 600: self.y = 600
-        self.trans.set_translation(self.x, self.y)
+        if self.y > self.height: self.y = self.height
         
 class Bullet(Entity):
+    __slots__ = ('direction',)
+
     def __init__(self, pos, direction):
         super().__init__(pos, 'bullet')
         self.direction = direction
+
+    def reset(self, pos, direction):
+        self.place(pos)
+        self.direction = direction
     
     def advance(self):
         self.x += self.direction[0] * self.velocity
         self.y += self.direction[1] * self.velocity
-        self.trans.set_translation(self.x, self.y)
 
     """
     # checks collision between bullet and enemy
@@ -73,8 +157,15 @@ class Bullet(Entity):
     """ 
 
 class Enemy(Entity):
+    __slots__ = ('isleft',)
+
     def __init__(self, pos):
         super().__init__(pos, 'enemy')
+        self.isleft = 0
+
+    def reset(self, pos):
+        self.place(pos)
+        self.isleft = 0
 
     def advance(self, target_x, target_y):
         #compute directional normal vector (dx, dy)
@@ -84,7 +175,6 @@ class Enemy(Entity):
         if abs_dist > 0:
             self.x += (dx/abs_dist) * self.velocity
             self.y += (dy/abs_dist) * self.velocity
-        self.trans.set_translation(self.x, self.y)
 
     """ 
     def animation(self):
@@ -95,6 +185,18 @@ class Enemy(Entity):
         self.animation()
     """
 
+def positions(entities):
+    """
+    Gather the coordinates of entities into arrays
+
+    :param entities: A list of entities
+    :return: A tuple with the X and Y coordinates arrays
+    """
+    x = np.fromiter((e.x for e in entities), dtype=np.float64, count=len(entities))
+    y = np.fromiter((e.y for e in entities), dtype=np.float64, count=len(entities))
+    return x, y
+
+
 def entity_intersection(e1, e2):
     """
     Check if two entities are intersecting.
@@ -106,9 +208,8 @@ def entity_intersection(e1, e2):
     """
     d1 = math.fabs(e1.x - e2.x) # fabs: float absolute 
     d2 = math.fabs(e1.y - e2.y)
-    e1.radius = math.sqrt(pow(e1.rect[0], 2) + pow(e1.rect[1], 2))
-    e2.radius = math.sqrt(pow(e2.rect[0], 2) + pow(e2.rect[1], 2))
-    return (d1 < e1.radius or d1 < e2.radius) and (d2 < e1.radius or d2 < e2.radius)
+    r = reach(e1.type, e2.type)
+    return d1 < r and d2 < r
 
 
 def line_entity_intersection(p1, p2, e):
@@ -122,7 +223,7 @@ def line_entity_intersection(p1, p2, e):
     """
     x1, y1 = p1
     x2, y2 = p2
-    r = math.sqrt(pow(e.rect[0], 2) + pow(e.rect[1], 2))
+    r = RADII[e.type]
     # entity center
     x0 = e.x
     y0 = e.y
@@ -137,28 +238,30 @@ def line_entity_intersection(p1, p2, e):
     return 0, 0
 
 
-def border_distance(x, y, theta):
+def border_distance(x, y, theta, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
     """
     Computes the closest distance from a point (x,y) to the window borders given the angle theta (in radians)
 
     :param x: The X point coordinate
     :param y:  The Y point coordinate
     :param theta: The angle (in radians)
+    :param width: The width of the window
+    :param height: The height of the window
     :return: The closest distance to the window borders
     """
-    x1 = x + max(SCREEN_HEIGHT, SCREEN_WIDTH) * math.cos(theta)
-    y1 = y + max(SCREEN_HEIGHT, SCREEN_WIDTH) * math.sin(theta)
+    x1 = x + max(height, width) * math.cos(theta)
+    y1 = y + max(height, width) * math.sin(theta)
     # intersection with borders
-    left_x, left_y = line_line_intersection(x, y, x1, y1, 0, 0, 0, SCREEN_HEIGHT)
+    left_x, left_y = line_line_intersection(x, y, x1, y1, 0, 0, 0, height)
     if included(x, x1, left_x) and included(y, y1, left_y):
         return math.sqrt(math.pow(x - left_x, 2) + math.pow(y - left_y, 2))
-    right_x, right_y = line_line_intersection(x, y, x1, y1, SCREEN_WIDTH, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    right_x, right_y = line_line_intersection(x, y, x1, y1, width, 0, width, height)
     if included(x, x1, right_x) and included(y, y1, right_y):
         return math.sqrt(math.pow(x - right_x, 2) + math.pow(y - right_y, 2))
-    down_x, down_y = line_line_intersection(x, y, x1, y1, 0, 0, SCREEN_WIDTH, 0)
+    down_x, down_y = line_line_intersection(x, y, x1, y1, 0, 0, width, 0)
     if included(x, x1, down_x) and included(y, y1, down_y):
         return math.sqrt(math.pow(x - down_x, 2) + math.pow(y - down_y, 2))
-    up_x, up_y = line_line_intersection(x, y, x1, y1, 0, SCREEN_HEIGHT, SCREEN_WIDTH, SCREEN_HEIGHT)
+    up_x, up_y = line_line_intersection(x, y, x1, y1, 0, height, width, height)
     if included(x, x1, up_x) and included(y, y1, up_y):
         return math.sqrt(math.pow(x - up_x, 2) + math.pow(y - up_y, 2))
     # this should never happen
@@ -0,0 +1,107 @@
+from envs.collision import RADII, overlaps, reach
+
+import numpy as np
+
+# any two touching entities are at most one cell apart
+CELL_SIZE = max(RADII.values())
+# from this many enemies and bullets on, the grid broad phase beats testing every pair, see benchmark.py
+GRID_THRESHOLD = 150
+# cell coordinates packed in a single key, X in the high bits
+STRIDE = 1 << 32
+# key offsets of a cell and the eight cells around it
+NEIGHBOURHOOD = np.array([i * STRIDE + j for i in (-1, 0, 1) for j in (-1, 0, 1)], dtype=np.int64)
+
+
+def cell_keys(x, y, cell_size=CELL_SIZE):
+    """
+    Compute the key of the cell containing every point
+
+    :param x: The X point coordinates
+    :param y: The Y point coordinates
+    :param cell_size: The side of a cell
+    :return: The int64 keys
+    """
+    cx = np.floor(np.asarray(x, dtype=np.float64) / cell_size).astype(np.int64)
+    cy = np.floor(np.asarray(y, dtype=np.float64) / cell_size).astype(np.int64)
+    return cx * STRIDE + cy
+
+
+class SpatialGrid:
+    """
+    Uniform grid of points, sorted by cell so that the points of a cell are a contiguous range.
+
+    The grid is built from scratch for a snapshot of the positions, in O(n log n) array operations, which is
+    cheaper than keeping the cells up to date from Python as the entities move.
+    """
+
+    def __init__(self, x, y, cell_size: float = CELL_SIZE):
+        """
+        Sort the points by cell
+
+        :param x: The X point coordinates
+        :param y: The Y point coordinates
+        :param cell_size: The side of a cell, must be at least the largest query reach
+        """
+        self.cell_size = cell_size
+        keys = cell_keys(x, y, cell_size)
+        # stable, the points of a cell stay in order
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def pairs(self, x, y):
+        """
+        Enumerate the points in the neighbourhood of every query, the candidates of a test within one cell
+
+        :param x: The X query coordinates
+        :param y: The Y query coordinates
+        :return: A tuple with the indices of the points and of the queries of the candidate pairs
+        """
+        keys = cell_keys(x, y, self.cell_size)[:, None] + NEIGHBOURHOOD
+        start = np.searchsorted(self.keys, keys, side='left').ravel()
+        counts = np.searchsorted(self.keys, keys, side='right').ravel() - start
+        total = int(counts.sum())
+        if not total:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        # expand each [start, start + count) range, then map the sorted positions back to the points
+        first = np.cumsum(counts) - counts
+        ranks = np.repeat(start - first, counts) + np.arange(total)
+        queries = np.repeat(np.arange(len(counts)) // len(NEIGHBOURHOOD), counts)
+        return self.order[ranks], queries
+
+
+def grid_bullet_enemy_collisions(enemy_x, enemy_y, bullet_x, bullet_y, cell_size: float = CELL_SIZE):
+    """
+    Version of collision.bullet_enemy_collisions for a single scene that only tests the bullets in the
+    neighbourhood of each enemy, with the same result
+
+    :param enemy_x: X coordinates of the enemies
+    :param enemy_y: Y coordinates of the enemies
+    :param bullet_x: X coordinates of the bullets
+    :param bullet_y: Y coordinates of the bullets
+    :param cell_size: The side of a cell, must be at least the bullet-enemy reach
+    :return: A tuple with the masks of the killed enemies and of the bullets that hit them, and the number of
+        pairs tested
+    """
+    enemy_x, enemy_y = np.asarray(enemy_x), np.asarray(enemy_y)
+    bullet_x, bullet_y = np.asarray(bullet_x), np.asarray(bullet_y)
+    killed = np.zeros(len(enemy_x), dtype=np.bool_)
+    used = np.zeros(len(bullet_x), dtype=np.bool_)
+    bullets, enemies = SpatialGrid(bullet_x, bullet_y, cell_size).pairs(enemy_x, enemy_y)
+    tested = len(bullets)
+    hits = overlaps(enemy_x[enemies], enemy_y[enemies], bullet_x[bullets], bullet_y[bullets],
+                    reach('enemy', 'bullet'))
+    if hits.any():
+        enemies, bullets = enemies[hits], bullets[hits]
+        # the sequential pass of bullet_enemy_collisions, in (enemy, bullet) order
+        order = np.lexsort((bullets, enemies))
+        spent = set()
+        for enemy, bullet in zip(enemies[order].tolist(), bullets[order].tolist()):
+            if not killed[enemy] and bullet not in spent:
+                killed[enemy] = True
+                spent.add(bullet)
+        used[list(spent)] = True
+    return killed, used, tested
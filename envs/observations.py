@@ -0,0 +1,258 @@
+from envs.collision import RADII
+from envs.entities import border_distance
+from envs.param import *
+
+import math
+import numpy as np
+
+# scanning the enemies ray by ray for a single origin beats the array kernel up to this many rays, and this many
+# ray-enemy tests, or without enemies (see RayCaster.scan)
+SCAN_RAYS = 16
+SCAN_TESTS = 256
+# border distances of the integer positions of the arena computed so far, and their mask, per number of rays
+# and arena size
+TABLES = {}
+# largest number of integer positions of an arena whose border distances are kept in a table
+TABLE_POSITIONS = 1 << 22
+
+
+def border_segments(width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """
+    The borders of an arena as segments, in the order entities.border_distance tests them: left, right, down, up
+
+    :param width: The width of the arena
+    :param height: The height of the arena
+    :return: The tuple of (x1, y1, x2, y2) segments
+    """
+    return (0, 0, 0, height), (width, 0, width, height), (0, 0, width, 0), (0, height, width, height)
+
+
+class RayCaster:
+    """
+    Vectorized version of the ray observations of ShooterEnv.make_observations.
+
+    The ray directions are computed once, then every ray is tested against every enemy, and against the four
+    borders, with array expressions. Positions may carry leading batch dimensions, e.g. (num_envs,).
+
+    The arithmetic follows entities.line_entity_intersection and entities.border_distance operation by operation,
+    so the observations are the ones the pretrained agents were trained on. The players move on the integer
+    positions of the arena, the border distances of these positions are computed once and kept in a table
+    shared by the casters with the same number of rays and arena size. Arenas with more than TABLE_POSITIONS
+    positions compute them on every call instead.
+    """
+
+    def __init__(self, n_rays: int = N_OBSERVATIONS, width: int = SCREEN_WIDTH, height: int = SCREEN_HEIGHT):
+        """
+        Precompute the ray directions
+
+        :param n_rays: The number of rays, evenly spread over 360 degrees
+        :param width: The width of the arena
+        :param height: The height of the arena
+        """
+        self.n_rays = n_rays
+        self.width = width
+        self.height = height
+        self.segments = border_segments(width, height)
+        self.dtheta = math.radians(360 / n_rays)
+        self.length = max(height, width)
+        # offset from the origin to the end of each ray
+        self.offsets = [(self.length * math.cos(alpha * self.dtheta), self.length * math.sin(alpha * self.dtheta))
+                        for alpha in range(n_rays)]
+        self.dx = np.array([dx for dx, _ in self.offsets])
+        self.dy = np.array([dy for _, dy in self.offsets])
+        self.table = self.known = None
+        if (width + 1) * (height + 1) <= TABLE_POSITIONS and math.hypot(width, height) <= np.iinfo(np.int16).max:
+            key = (n_rays, width, height)
+            if key not in TABLES:
+                # distances are below the diagonal, zeroed pages are only committed once written to
+                TABLES[key] = (np.zeros((width + 1, height + 1, n_rays), dtype=np.int16),
+                               np.zeros((width + 1, height + 1), dtype=np.bool_))
+            self.table, self.known = TABLES[key]
+
+    def enemies(self, x, y, enemy_x, enemy_y, enemy_alive=None):
+        """
+        Test every ray against every enemy, see entities.line_entity_intersection
+
+        :param x: The X coordinates of the rays origin, of shape (...)
+        :param y: The Y coordinates of the rays origin, of shape (...)
+        :param enemy_x: The (..., n_enemies) X coordinates of the enemies
+        :param enemy_y: The (..., n_enemies) Y coordinates of the enemies
+        :param enemy_alive: Optional mask of the enemy slots in use
+        :return: The (..., n_rays, n_enemies) intersection mask
+        """
+        x, y = np.asarray(x, dtype=np.float64)[..., None], np.asarray(y, dtype=np.float64)[..., None]
+        x2, y2 = x + self.dx, y + self.dy
+        x0 = np.asarray(enemy_x, dtype=np.float64)[..., None, :]
+        y0 = np.asarray(enemy_y, dtype=np.float64)[..., None, :]
+        a, b = (y2 - y)[..., None], (x2 - x)[..., None]
+        # distance from the enemy centers to the ray lines, updated in place
+        dist = a * x0
+        dist -= b * y0
+        dist += (x2 * y)[..., None]
+        dist -= (y2 * x)[..., None]
+        np.fabs(dist, out=dist)
+        dist /= np.sqrt(a * a + b * b)
+        seen = dist <= RADII['enemy']
+        # the centers must also be in the bounding box of the rays
+        seen &= np.minimum(x, x2)[..., None] <= x0
+        seen &= x0 <= np.maximum(x, x2)[..., None]
+        seen &= np.minimum(y, y2)[..., None] <= y0
+        seen &= y0 <= np.maximum(y, y2)[..., None]
+        if enemy_alive is not None:
+            seen &= np.asarray(enemy_alive)[..., None, :]
+        return seen
+
+    def borders(self, x, y):
+        """
+        Distance from the origin to the borders along every ray, see entities.border_distance
+
+        :param x: The X coordinates of the rays origin, of shape (...)
+        :param y: The Y coordinates of the rays origin, of shape (...)
+        :return: The (..., n_rays) distances, 0 if no border passes the inclusion tests
+        """
+        x, y = np.asarray(x, dtype=np.float64)[..., None], np.asarray(y, dtype=np.float64)[..., None]
+        x1, y1 = x + self.dx, y + self.dy
+        # terms of entities.line_line_intersection that do not depend on the border
+        dx, dy, cross = x - x1, y - y1, x * y1 - y * x1
+        min_x, max_x, min_y, max_y = np.minimum(x, x1), np.maximum(x, x1), np.minimum(y, y1), np.maximum(y, y1)
+        dist = np.zeros(x1.shape)
+        pending = np.ones(x1.shape, dtype=np.bool_)
+        # intersection with every border in turn, the first one included in the ray wins
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for x3, y3, x4, y4 in self.segments:
+                d = dx * (y3 - y4) - dy * (x3 - x4)
+                px = (cross * (x3 - x4) - dx * (x3 * y4 - y3 * x4)) / d
+                py = (cross * (y3 - y4) - dy * (x3 * y4 - y3 * x4)) / d
+                hit = pending & (d != 0) & (min_x <= px) & (px <= max_x) & (min_y <= py) & (py <= max_y)
+                px -= x
+                py -= y
+                np.copyto(dist, np.sqrt(px * px + py * py), where=hit)
+                pending &= ~hit
+        return dist
+
+    def lattice(self, x, y):
+        """
+        Check whether origins are integer positions of the arena, whose border distances are cached
+
+        :param x: The X coordinates of the rays origin
+        :param y: The Y coordinates of the rays origin
+        :return: A tuple with the integer X and Y coordinates, or None if an origin is off the lattice
+        """
+        if self.table is None:
+            return None
+        ix, iy = np.asarray(x).astype(np.int64), np.asarray(y).astype(np.int64)
+        if ((ix == x) & (iy == y) & (0 <= ix) & (ix <= self.width) & (0 <= iy) & (iy <= self.height)).all():
+            return ix, iy
+        return None
+
+    def border_values(self, x, y):
+        """
+        Observed border distances (truncated to integers) along every ray, from the table on the lattice
+
+        :param x: The X coordinates of the rays origin, of shape (...)
+        :param y: The Y coordinates of the rays origin, of shape (...)
+        :return: The (..., n_rays) distances
+        """
+        cell = self.lattice(x, y)
+        if cell is None:
+            return self.borders(x, y).astype(np.int64)
+        ix, iy = cell
+        missing = ~self.known[ix, iy]
+        if missing.any():
+            ix_, iy_ = ix[missing], iy[missing]
+            self.table[ix_, iy_] = self.borders(ix_, iy_)
+            self.known[ix_, iy_] = True
+        return self.table[ix, iy]
+
+    def border_row(self, x, y):
+        """
+        Observed border distances along every ray of a single origin, from the table on the lattice
+
+        :param x: The X coordinate of the rays origin
+        :param y: The Y coordinate of the rays origin
+        :return: The (n_rays,) distances
+        """
+        ix, iy = int(x), int(y)
+        if self.table is None or ix != x or iy != y or not (0 <= ix <= self.width and 0 <= iy <= self.height):
+            return np.array([border_distance(x, y, alpha * self.dtheta, self.width, self.height)
+                             for alpha in range(self.n_rays)], dtype=np.int64)
+        if not self.known[ix, iy]:
+            # a single origin is faster in plain Python than with array expressions
+            self.table[ix, iy] = [border_distance(x, y, alpha * self.dtheta, self.width, self.height)
+                                  for alpha in range(self.n_rays)]
+            self.known[ix, iy] = True
+        return self.table[ix, iy]
+
+    def observe(self, x, y, enemy_x, enemy_y, enemy_alive=None, out=None):
+        """
+        Compute the (type, distance) pair of every ray: the last enemy (in spawn order) on the ray if any,
+        else the distance to the border
+
+        :param x: The X coordinates of the rays origin, of shape (...)
+        :param y: The Y coordinates of the rays origin, of shape (...)
+        :param enemy_x: The (..., n_enemies) X coordinates of the enemies, in spawn order
+        :param enemy_y: The (..., n_enemies) Y coordinates of the enemies, in spawn order
+        :param enemy_alive: Optional mask of the enemy slots in use
+        :param out: Optional (..., 2 * n_rays) buffer to write into
+        :return: A tuple with the observations and the (..., n_rays, n_enemies) intersection mask
+        """
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        enemy_x, enemy_y = np.asarray(enemy_x, dtype=np.float64), np.asarray(enemy_y, dtype=np.float64)
+        if out is None:
+            out = np.zeros(x.shape + (2 * self.n_rays,), dtype=np.int64)
+        seen = self.enemies(x, y, enemy_x, enemy_y, enemy_alive)
+        n_enemies = seen.shape[-1]
+        if not n_enemies or not seen.any():
+            out[..., 0::2] = BORDER_VALUE
+            out[..., 1::2] = self.border_values(x, y)
+            return out, seen
+        any_seen = seen.any(axis=-1)
+        last = n_enemies - 1 - np.argmax(seen[..., ::-1], axis=-1)
+        if x.ndim:
+            ex = np.take_along_axis(enemy_x, last, axis=-1)
+            ey = np.take_along_axis(enemy_y, last, axis=-1)
+        else:
+            ex, ey = enemy_x[last], enemy_y[last]
+        ex -= x[..., None]
+        ey -= y[..., None]
+        out[..., 0::2] = np.where(any_seen, ENTITIES.get('enemy').get('value'), BORDER_VALUE)
+        out[..., 1::2] = np.where(any_seen, np.sqrt(ex * ex + ey * ey), self.border_values(x, y))
+        return out, seen
+
+    def scan(self, x, y, enemy_x, enemy_y, out):
+        """
+        Version of observe() for a single origin and a few enemies, testing them one by one
+
+        :param x: The X coordinate of the rays origin
+        :param y: The Y coordinate of the rays origin
+        :param enemy_x: The X coordinates of the enemies, in spawn order
+        :param enemy_y: The Y coordinates of the enemies, in spawn order
+        :param out: The (2 * n_rays,) buffer to write into
+        :return: The list of the flags of the enemies seen by a ray
+        """
+        borders = self.border_row(x, y)
+        if not len(enemy_x):
+            out[0::2] = BORDER_VALUE
+            out[1::2] = borders
+            return []
+        r = RADII['enemy']
+        value = ENTITIES.get('enemy').get('value')
+        observations = []
+        seen = [False] * len(enemy_x)
+        for (dx, dy), border in zip(self.offsets, borders.tolist()):
+            x2, y2 = x + dx, y + dy
+            min_x, max_x = (x, x2) if x <= x2 else (x2, x)
+            min_y, max_y = (y, y2) if y <= y2 else (y2, y)
+            a, b, c1, c2 = y2 - y, x2 - x, x2 * y, y2 * x
+            norm = math.sqrt(math.pow(a, 2) + math.pow(b, 2))
+            last = -1
+            for i, (x0, y0) in enumerate(zip(enemy_x, enemy_y)):
+                if min_x <= x0 <= max_x and min_y <= y0 <= max_y and math.fabs(a * x0 - b * y0 + c1 - c2) / norm <= r:
+                    seen[i] = True
+                    last = i
+            if last < 0:
+                observations += (BORDER_VALUE, border)
+            else:
+                observations += (value, math.sqrt(math.pow(enemy_x[last] - x, 2) + math.pow(enemy_y[last] - y, 2)))
+        out[:] = observations
+        return seen
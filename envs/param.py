@@ -6,6 +6,16 @@ DIAG = math.sqrt(math.pow(SCREEN_WIDTH, 2) + math.pow(SCREEN_HEIGHT, 2))
 N_OBSERVATIONS = 8
 BORDER_VALUE = 0
 
+# -- Game rules --
+# movement for each action: left, up-left, up, up-right, right, bottom-right, bottom, bottom-left
+DIRECTIONS = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1)]
+BULLET_INTERVAL = 15  # frames between two bullets
+ENEMY_INTERVAL = 50  # frames between two enemy spawns
+ENEMY_LIMIT = 50
+ENEMY_SPAWN_POINTS = [(0, 0), (0, SCREEN_HEIGHT / 2), (0, SCREEN_HEIGHT), (SCREEN_WIDTH / 2, 0),
+                      (SCREEN_WIDTH / 2, SCREEN_HEIGHT), (SCREEN_WIDTH, 0), (SCREEN_WIDTH, SCREEN_HEIGHT / 2),
+                      (SCREEN_WIDTH, SCREEN_HEIGHT)]
+
 # -- Entities properties --
 ENTITIES = {
     'player': {
@@ -0,0 +1,108 @@
+import csv
+import time
+
+# phases of ShooterEnv.step, in order
+PHASES = ('player', 'bullet_spawn', 'bullets', 'enemy_spawn', 'enemies', 'collisions', 'observations')
+# events counted during a step
+EVENTS = ('bullet_spawns', 'enemy_spawns', 'bullet_removals', 'enemy_removals', 'collision_tests', 'ray_tests')
+# entity counts sampled at the end of a step
+GAUGES = ('enemies', 'bullets')
+
+
+class StepProfiler:
+    """
+    Wall time of each phase of the steps of an env, with counters of the work they do.
+
+    The env calls start() when a step begins, lap(phase) when a phase ends, count() on events, and end() when the
+    step returns. Phases run several times per step (frame skip) add up. Events outside a step, e.g. the ray
+    tests of the observations of reset(), are not counted.
+    """
+
+    def __init__(self, trace_path: str = None, trace_every: int = 100):
+        """
+        :param trace_path: Optional CSV file, where one step out of trace_every is written as it ends
+        :param trace_every: The sampling interval of the trace, in steps
+        """
+        self.steps = 0
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.events = dict.fromkeys(EVENTS, 0)
+        self.gauges = dict.fromkeys(GAUGES, 0)
+        self.step_time = None
+        self.step_events = None
+        self.mark = None
+        self.trace_every = trace_every
+        self.trace_file = None
+        if trace_path is not None:
+            self.trace_file = open(trace_path, 'w', newline='')
+            self.trace = csv.writer(self.trace_file)
+            self.trace.writerow(('step',) + tuple(phase + '_us' for phase in PHASES) + EVENTS + GAUGES)
+
+    def start(self):
+        self.step_time = dict.fromkeys(PHASES, 0.0)
+        self.step_events = dict.fromkeys(EVENTS, 0)
+        self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Add the time since the previous lap (or start) to a phase
+
+        :param phase: The phase that just ended
+        """
+        now = time.perf_counter()
+        self.step_time[phase] += now - self.mark
+        self.mark = now
+
+    def count(self, event, n=1):
+        if self.step_events is not None:
+            self.step_events[event] += n
+
+    def end(self, n_enemies, n_bullets):
+        """
+        Accumulate the current step
+
+        :param n_enemies: The number of live enemies
+        :param n_bullets: The number of live bullets
+        :return: The info of the step, with the time of each phase in seconds and the counters
+        """
+        self.steps += 1
+        for phase, elapsed in self.step_time.items():
+            self.totals[phase] += elapsed
+        for event, n in self.step_events.items():
+            self.events[event] += n
+        counts = dict(self.step_events, enemies=n_enemies, bullets=n_bullets)
+        # until the next start()
+        self.step_events = None
+        self.gauges['enemies'] += n_enemies
+        self.gauges['bullets'] += n_bullets
+        if self.trace_file is not None and self.steps % self.trace_every == 0:
+            self.trace.writerow([self.steps] + [round(self.step_time[phase] * 1e6, 3) for phase in PHASES]
+                                + [counts[name] for name in EVENTS + GAUGES])
+        return {'time': self.step_time, 'counts': counts}
+
+    def report(self):
+        """
+        :return: A dict with the number of steps, and per phase its total time in seconds, mean time per step in
+            microseconds and share of the step time, the total and mean per step of each event, and the mean
+            number of live entities
+        """
+        steps = max(self.steps, 1)
+        total = sum(self.totals.values()) or 1.0
+        return {'steps': self.steps,
+                'phases': {phase: {'total_s': elapsed, 'mean_us': elapsed / steps * 1e6, 'share': elapsed / total}
+                           for phase, elapsed in self.totals.items()},
+                'events': {event: {'total': n, 'per_step': n / steps} for event, n in self.events.items()},
+                'live': {name: n / steps for name, n in self.gauges.items()}}
+
+    def __str__(self):
+        report = self.report()
+        lines = ['%d steps' % report['steps']]
+        lines += ['%-14s %10.2f us/step %6.1f%%' % (phase, stats['mean_us'], stats['share'] * 100)
+                  for phase, stats in report['phases'].items()]
+        lines += ['%-16s %10.2f /step' % (event, stats['per_step']) for event, stats in report['events'].items()]
+        lines += ['live %-11s %10.2f' % (name, n) for name, n in report['live'].items()]
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
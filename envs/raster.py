@@ -0,0 +1,177 @@
+from envs.observations import RayCaster
+from envs.param import *
+
+import math
+import numpy as np
+
+# decoded sprites, per asset and size
+SPRITES = {}
+# color of the debug lines from the player to the enemies seen by its rays
+LINE_COLOR = (255, 0, 0)
+# number of canvas values rendered at once
+CANVAS_SIZE = 1 << 21
+
+
+def load_sprite(path, width, height):
+    """
+    Decode an image asset once per process and size
+
+    :param path: The path of the image
+    :param width: The width of the sprite, in pixels
+    :param height: The height of the sprite, in pixels
+    :return: A tuple with the (height, width, 3) premultiplied color and the (height, width, 1) opacity
+    """
+    key = (path, width, height)
+    sprite = SPRITES.get(key)
+    if sprite is None:
+        from PIL import Image
+
+        image = Image.open(path).convert('RGBA').resize((width, height), Image.BILINEAR)
+        pixels = np.asarray(image, dtype=np.float32)
+        alpha = pixels[..., 3:] / 255
+        sprite = SPRITES[key] = (pixels[..., :3] * alpha, alpha)
+    return sprite
+
+
+class Rasterizer:
+    """
+    Software renderer of the scene, drawing like ShooterEnv.render(mode='rgb_array') without OpenGL.
+
+    Sprites are alpha-blended onto a white background in the order player, bullets, enemies, then the debug
+    lines from the player to the enemies seen by its rays are drawn on top. Every blit draws one entity slot of
+    all the scenes of a batch at once, into a canvas padded so that no sprite needs clipping.
+    """
+
+    def __init__(self, width: int = SCREEN_WIDTH, height: int = SCREEN_HEIGHT, rays: bool = True,
+                 n_observations: int = N_OBSERVATIONS, arena_width: int = SCREEN_WIDTH,
+                 arena_height: int = SCREEN_HEIGHT):
+        """
+        Decode the sprites at the resolution of the frames
+
+        :param width: The width of the frames, in pixels
+        :param height: The height of the frames, in pixels
+        :param rays: Whether to draw the debug lines
+        :param n_observations: The number of rays of the player
+        :param arena_width: The width of the drawn arena, in scene units
+        :param arena_height: The height of the drawn arena, in scene units
+        """
+        self.width = width
+        self.height = height
+        self.arena_height = arena_height
+        self.scale_x = width / arena_width
+        self.scale_y = height / arena_height
+        self.sprites = {}
+        for type, entity in ENTITIES.items():
+            rect = entity.get('rect')
+            self.sprites[type] = load_sprite(entity.get('shape'), max(1, round(rect[0] * self.scale_x)),
+                                             max(1, round(rect[1] * self.scale_y)))
+        self.margin = max(max(alpha.shape[:2]) for _, alpha in self.sprites.values())
+        self.rays = RayCaster(n_observations, arena_width, arena_height) if rays else None
+
+    def pixels(self, x, y):
+        """
+        Convert scene coordinates to pixel coordinates in the padded canvas (Y axis pointing down)
+
+        :param x: The X scene coordinates
+        :param y: The Y scene coordinates
+        :return: A tuple with the column and row coordinates
+        """
+        return (np.asarray(x) * self.scale_x + self.margin,
+                (self.arena_height - np.asarray(y)) * self.scale_y + self.margin)
+
+    def blit(self, canvas, type, x, y, alive=None):
+        """
+        Draw one sprite centered on a position in every scene where it is alive
+
+        :param canvas: The (N, H, W, 3) padded canvas
+        :param type: The entity type
+        :param x: The (N,) X scene coordinates
+        :param y: The (N,) Y scene coordinates
+        :param alive: Optional (N,) mask of the scenes where the entity exists
+        """
+        if alive is not None:
+            scenes = np.flatnonzero(alive)
+            x, y = x[scenes], y[scenes]
+        else:
+            scenes = np.arange(len(canvas))
+        if not len(scenes):
+            return
+        color, alpha = self.sprites[type]
+        h, w = alpha.shape[:2]
+        cols, rows = self.pixels(x, y)
+        left = np.clip(np.rint(cols - w / 2).astype(np.int64), 0, canvas.shape[2] - w)
+        top = np.clip(np.rint(rows - h / 2).astype(np.int64), 0, canvas.shape[1] - h)
+        index = (scenes[:, None, None], (top[:, None] + np.arange(h))[:, :, None],
+                 (left[:, None] + np.arange(w))[:, None, :])
+        canvas[index] = canvas[index] * (1 - alpha) + color
+
+    def lines(self, canvas, player_x, player_y, enemy_x, enemy_y, enemy_alive=None):
+        """
+        Draw a line from the player to every enemy seen by its rays
+
+        :param canvas: The (N, H, W, 3) padded canvas
+        :param player_x: The (N,) X coordinates of the players
+        :param player_y: The (N,) Y coordinates of the players
+        :param enemy_x: The (N, n_enemies) X coordinates of the enemies
+        :param enemy_y: The (N, n_enemies) Y coordinates of the enemies
+        :param enemy_alive: Optional (N, n_enemies) mask of the enemy slots in use
+        """
+        seen = self.rays.enemies(player_x, player_y, enemy_x, enemy_y, enemy_alive).any(axis=-2)
+        scenes, enemies = np.nonzero(seen)
+        if not len(scenes):
+            return
+        x1, y1 = self.pixels(player_x[scenes], player_y[scenes])
+        x2, y2 = self.pixels(enemy_x[scenes, enemies], enemy_y[scenes, enemies])
+        # one point per pixel along the longest line
+        n_points = int(math.ceil(max(np.abs(x2 - x1).max(), np.abs(y2 - y1).max()))) + 1
+        t = np.linspace(0, 1, n_points)
+        cols = np.clip(np.rint(x1[:, None] + t * (x2 - x1)[:, None]).astype(np.int64), 0, canvas.shape[2] - 1)
+        rows = np.clip(np.rint(y1[:, None] + t * (y2 - y1)[:, None]).astype(np.int64), 0, canvas.shape[1] - 1)
+        canvas[scenes[:, None], rows, cols] = LINE_COLOR
+
+    def render(self, player_x, player_y, bullet_x, bullet_y, enemy_x, enemy_y, bullet_alive=None,
+               enemy_alive=None, player_alive=None):
+        """
+        Render a batch of scenes
+
+        :param player_x: The (N,) X coordinates of the players
+        :param player_y: The (N,) Y coordinates of the players
+        :param bullet_x: The (N, n_bullets) X coordinates of the bullets
+        :param bullet_y: The (N, n_bullets) Y coordinates of the bullets
+        :param enemy_x: The (N, n_enemies) X coordinates of the enemies, in spawn order
+        :param enemy_y: The (N, n_enemies) Y coordinates of the enemies, in spawn order
+        :param bullet_alive: Optional (N, n_bullets) mask of the bullet slots in use
+        :param enemy_alive: Optional (N, n_enemies) mask of the enemy slots in use
+        :param player_alive: Optional (N,) mask of the scenes whose player is drawn
+        :return: The (N, height, width, 3) uint8 frames
+        """
+        player_x, player_y = np.asarray(player_x, dtype=np.float64), np.asarray(player_y, dtype=np.float64)
+        bullet_x, bullet_y = np.asarray(bullet_x, dtype=np.float64), np.asarray(bullet_y, dtype=np.float64)
+        enemy_x, enemy_y = np.asarray(enemy_x, dtype=np.float64), np.asarray(enemy_y, dtype=np.float64)
+        m = self.margin
+        # keep the float canvas of a chunk of scenes in cache sized memory
+        chunk = max(1, CANVAS_SIZE // ((self.height + 2 * m) * (self.width + 2 * m) * 3))
+        if len(player_x) > chunk:
+            frames = np.empty((len(player_x), self.height, self.width, 3), dtype=np.uint8)
+            for i in range(0, len(player_x), chunk):
+                part = slice(i, i + chunk)
+                frames[part] = self.render(player_x[part], player_y[part], bullet_x[part], bullet_y[part],
+                                           enemy_x[part], enemy_y[part],
+                                           None if bullet_alive is None else np.asarray(bullet_alive)[part],
+                                           None if enemy_alive is None else np.asarray(enemy_alive)[part],
+                                           None if player_alive is None else np.asarray(player_alive)[part])
+            return frames
+        canvas = np.full((len(player_x), self.height + 2 * m, self.width + 2 * m, 3), 255, dtype=np.float32)
+
+        self.blit(canvas, 'player', player_x, player_y, player_alive)
+        for j in range(bullet_x.shape[1]):
+            self.blit(canvas, 'bullet', bullet_x[:, j], bullet_y[:, j],
+                      None if bullet_alive is None else bullet_alive[:, j])
+        for j in range(enemy_x.shape[1]):
+            self.blit(canvas, 'enemy', enemy_x[:, j], enemy_y[:, j],
+                      None if enemy_alive is None else enemy_alive[:, j])
+        if self.rays is not None and enemy_x.shape[1]:
+            self.lines(canvas, player_x, player_y, enemy_x, enemy_y, enemy_alive)
+
+        frames = canvas[:, m:m + self.height, m:m + self.width]
+        return np.rint(frames).astype(np.uint8)
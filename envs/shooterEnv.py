@@ -1,31 +1,109 @@
+from envs.collision import SCAN_PAIRS, bullet_enemy_collisions, scan_bullet_enemy_collisions, \
+    scan_player_enemy_collisions
 from envs.entities import *
+from envs.grid import GRID_THRESHOLD, grid_bullet_enemy_collisions
+from envs.observations import SCAN_RAYS, SCAN_TESTS, RayCaster
+from envs.profiler import StepProfiler
+from envs.raster import Rasterizer
 from envs.param import *
 
 import gym
 import numpy as np
-import random
+from itertools import compress
 from gym import spaces, logger
 from gym.utils import seeding
 
 
 def init_scene(env):
-    # clean existing scene
+    # clean existing scene, recycling the entities
     env.player = None 
+    env.pools['bullet'].release_all(env.bullets)
+    env.pools['enemy'].release_all(env.enemies)
     env.enemies = []
     env.bullets = []
+    # spawn timers, an episode must not depend on the previous one
+    env.bullet_time = None
+    env.enemy_time = None
 
     # initialize the scene
     # add the player
-    env.player = Player((SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2))
+    env.player = Player((env.width / 2, env.height / 2), env.width, env.height)
+
+
+def rng_state(rng):
+    """
+    Flatten the state of a NumPy generator into float64 values, 32 bits at most per value so that they are exact
+
+    :param rng: A Generator over PCG64 (gym >= 0.26) or a RandomState (older gym)
+    :return: The array of values, starting with the kind of generator
+    """
+    if isinstance(rng, np.random.RandomState):
+        state = rng.get_state(legacy=False)
+        return np.concatenate([[1, state['state']['pos'], state['has_gauss'], state['gauss']],
+                               state['state']['key']])
+    state = rng.bit_generator.state
+    assert state['bit_generator'] == 'PCG64', "%s generators are not supported" % state['bit_generator']
+    words = [(value >> (32 * i)) & 0xffffffff for value in (state['state']['state'], state['state']['inc'])
+             for i in range(4)]
+    return np.array([0, state['has_uint32'], state['uinteger']] + words, dtype=np.float64)
+
+
+def rng_state_size(kind):
+    return 628 if kind == 1 else 11
+
+
+def set_rng_state(rng, values):
+    """
+    Restore the state of a NumPy generator from rng_state()
+
+    :param rng: The generator, of the same kind as the saved one
+    :param values: The values returned by rng_state
+    """
+    if values[0] == 1:
+        rng.set_state({'bit_generator': 'MT19937',
+                       'state': {'key': values[4:].astype(np.uint32), 'pos': int(values[1])},
+                       'has_gauss': int(values[2]), 'gauss': float(values[3])})
+        return
+    words = [int(word) for word in values[3:]]
+    state, inc = (sum(word << (32 * i) for i, word in enumerate(words[j:j + 4])) for j in (0, 4))
+    rng.bit_generator.state = {'bit_generator': 'PCG64', 'state': {'state': state, 'inc': inc},
+                               'has_uint32': int(values[1]), 'uinteger': int(values[2])}
 
 
 class ShooterEnv(gym.Env):
     metadata = {'render.modes': ['human', 'rgb_array']}
 
-    def __init__(self):
+    def __init__(self, render_mode: str = 'human', n_observations: int = N_OBSERVATIONS, renderer: str = 'opengl',
+                 frame_skip: int = 1, profile: bool = False, profile_trace: str = None, trace_every: int = 100,
+                 width: int = SCREEN_WIDTH, height: int = SCREEN_HEIGHT, enemy_limit: int = ENEMY_LIMIT,
+                 grid_threshold: int = GRID_THRESHOLD):
         """
         Create the environment
+
+        :param render_mode: The default mode used by render(), or None for a headless simulation
+        :param n_observations: The number of rays observing the surroundings of the player
+        :param renderer: How 'rgb_array' frames are drawn, 'opengl' (pyglet viewer) or 'numpy' (no display needed)
+        :param frame_skip: The number of frames an action is repeated for, the observations are only computed
+            after the last one
+        :param profile: Whether to time the phases of every step and count their work, returned in the info dict
+            under 'profile' and aggregated by profile_report()
+        :param profile_trace: Optional CSV file the profile of one step out of trace_every is written to
+        :param trace_every: The sampling interval of the profile trace, in steps
+        :param width: The width of the arena, the enemy spawn points are scaled to it
+        :param height: The height of the arena
+        :param enemy_limit: The largest number of enemies in the scene
+        :param grid_threshold: From this many enemies and bullets on, bullet-enemy collisions only test the pairs
+            of neighbouring cells of a spatial grid, None to always test every pair
         """
+        assert render_mode is None or render_mode in self.metadata['render.modes'], \
+            "%r is not a valid render mode" % render_mode
+        assert renderer in ('opengl', 'numpy'), "%r is not a valid renderer" % renderer
+        assert frame_skip >= 1, "frame_skip must be at least 1, got %r" % frame_skip
+        self.frame_skip = frame_skip
+        self.width = width
+        self.height = height
+        self.spawn_points = [(x * width / SCREEN_WIDTH, y * height / SCREEN_HEIGHT) for x, y in ENEMY_SPAWN_POINTS]
+        self.grid_threshold = grid_threshold
 
         """
         possible action:
@@ -41,13 +119,16 @@ class ShooterEnv(gym.Env):
 
         self.action_space = spaces.Discrete(8)
         # observation space
-        self.observation_space = spaces.Box(np.zeros(3 + N_OBSERVATIONS * 2),
-                                            np.ones(3 + N_OBSERVATIONS * 2),
+        self.n_observations = n_observations
+        self.observation_space = spaces.Box(np.zeros(3 + n_observations * 2),
+                                            np.ones(3 + n_observations * 2),
                                             dtype=np.int64)
-        # current state
-        self.state = None
+        # current state, updated in place
+        self.state = np.zeros(3 + n_observations * 2, dtype=np.int64)
+        # observation rays
+        self.rays = RayCaster(n_observations, width, height)
         # incremental angle for observation 
-        self.dtheta = math.radians(360 / N_OBSERVATIONS)
+        self.dtheta = self.rays.dtheta
         # flag for end of episode
         self.done = False
         # flag for executions after end of episode
@@ -57,15 +138,23 @@ class ShooterEnv(gym.Env):
         self.player = None
         self.enemies = []
         self.bullets = []
+        # dead entities, recycled by the next spawns
+        self.pools = {'bullet': Pool(Bullet), 'enemy': Pool(Enemy)}
 
         self.bullet_time = None 
         self.enemy_time = None 
-        self.enemy_limit = 50
+        self.enemy_limit = enemy_limit
 
         self.reward = 0
 
-        # renderer
+        # renderer, only created on the first render() call
+        self.render_mode = render_mode
         self.viewer = None
+        self.renderer = renderer
+        self.rasterizer = None
+
+        # opt-in instrumentation of the steps
+        self.profiler = StepProfiler(profile_trace, trace_every) if profile or profile_trace else None
 
         # random seed fixing
         self.np_random = None
@@ -91,54 +180,104 @@ class ShooterEnv(gym.Env):
         err_msg = "%r (%s) invalid" % (action, type(action))
         assert self.action_space.contains(action), err_msg
 
-        # execute the action if possible
-        if not self.done:
-            if action is not None:
-                self.player.advance(action)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
 
-            # spawning the bullets 
-            if self.bullet_time is None:
-                self.bullet_time = 0
-                self.bullet_time = self.bullet_spawn(self.bullet_time, action)
-            else:
-                self.bullet_time = self.bullet_spawn(self.bullet_time, action)
+        # execute the action if possible, repeated for frame_skip ticks
+        if not self.done:
+            for _ in range(self.frame_skip):
+                self.tick(action)
+                if self.done:
+                    break
+            self.make_observations(action)
+            if profiler is not None:
+                profiler.lap('observations')
 
-            # updating the bullets 
-            for bullet in self.bullets:
-                bullet.advance()
-                self.check_bounds(bullet, self.bullets)
+        info = {}
+        if profiler is not None:
+            info['profile'] = profiler.end(len(self.enemies), len(self.bullets))
+        return self.state.copy(), self.reward, self.done, info
 
-            # spawning the enemies 
-            if self.enemy_time is None:
-                self.enemy_time = 0
-                self.enemy_time = self.enemy_spawn(self.enemy_time)
+    def tick(self, action: int):
+        """
+        Advance the simulation by one frame, without computing the observations
+        :param action: The action to apply
+        """
+        profiler = self.profiler
+        if action is not None:
+            self.player.advance(action)
+        if profiler is not None:
+            profiler.lap('player')
+
+        # spawning the bullets 
+        if self.bullet_time is None:
+            self.bullet_time = 0
+            self.bullet_time = self.bullet_spawn(self.bullet_time, action)
+        else:
+            self.bullet_time = self.bullet_spawn(self.bullet_time, action)
+        if profiler is not None:
+            profiler.lap('bullet_spawn')
+
+        # updating the bullets 
+        for bullet in list(self.bullets):
+            bullet.advance()
+            self.check_bounds(bullet, self.bullets)
+        if profiler is not None:
+            profiler.lap('bullets')
+
+        # spawning the enemies 
+        if self.enemy_time is None:
+            self.enemy_time = 0
+            self.enemy_time = self.enemy_spawn(self.enemy_time)
+        else:
+            self.enemy_time = self.enemy_spawn(self.enemy_time)
+        if profiler is not None:
+            profiler.lap('enemy_spawn')
+
+        for enemy in self.enemies:
+            enemy.advance(self.player.x, self.player.y)
+        if profiler is not None:
+            profiler.lap('enemies')
+
+        # remove enemies if hit by bullet, one by one in a typical scene, else with arrays, through a grid in a
+        # crowded one
+        if self.enemies and self.bullets:
+            pairs = len(self.enemies) * len(self.bullets)
+            if pairs <= SCAN_PAIRS:
+                dead, spent = scan_bullet_enemy_collisions(self.enemies, self.bullets)
             else:
-                self.enemy_time = self.enemy_spawn(self.enemy_time)
-
-            # remove enemies if hit by bullet
-            for enemy in self.enemies:
-                enemy.advance(self.player.x, self.player.y)
-                for bullet in self.bullets:
-                    if entity_intersection(enemy, bullet):
-                        self.bullets.remove(bullet)
-                        self.viewer.geoms.remove(bullet.shape)
-                        self.enemies.remove(enemy)
-                        self.viewer.geoms.remove(enemy.shape)
-                        # increment reward
-                        self.reward += KILLED_ENEMY
-                        break  # no need to check for other bullets hitting the same enemy
-
-            # remove the player if collided with enemy 
-            for enemy in self.enemies:
-                if entity_intersection(self.player, enemy):
-                    self.done = True  # terminate session
-                    self.viewer.geoms.remove(self.player.shape)
-                    # decrease reward
-                    self.reward += DIED
-                    break  # no need to check for other enemies hitting the spaceship
-
-            self.make_observations(action)
-        return self.state, self.reward, self.done, {}
+                if self.grid_threshold is not None and len(self.enemies) + len(self.bullets) >= self.grid_threshold:
+                    killed, used, pairs = grid_bullet_enemy_collisions(*positions(self.enemies),
+                                                                       *positions(self.bullets))
+                else:
+                    killed, used = bullet_enemy_collisions(*positions(self.enemies), *positions(self.bullets))
+                dead, spent = (list(compress(self.enemies, killed)), list(compress(self.bullets, used))) \
+                    if killed.any() else ((), ())
+            if profiler is not None:
+                profiler.count('collision_tests', pairs)
+                profiler.count('bullet_removals', len(spent))
+                profiler.count('enemy_removals', len(dead))
+            for bullet in spent:
+                self.bullets.remove(bullet)
+                self.remove_geom(bullet)
+                self.pools['bullet'].release(bullet)
+            for enemy in dead:
+                self.enemies.remove(enemy)
+                self.remove_geom(enemy)
+                self.pools['enemy'].release(enemy)
+            # increment reward
+            self.reward += KILLED_ENEMY * len(dead)
+
+        # remove the player if collided with enemy 
+        if self.enemies and scan_player_enemy_collisions(self.player, self.enemies):
+            self.done = True  # terminate session
+            self.remove_geom(self.player)
+            # decrease reward
+            self.reward += DIED
+        if profiler is not None:
+            profiler.count('collision_tests', len(self.enemies))
+            profiler.lap('collisions')
 
     def reset(self):
         """
@@ -153,17 +292,86 @@ class ShooterEnv(gym.Env):
         self.reset_geoms()
         # compute obs
         self.make_observations(0)
-        return self.state
+        return self.state.copy()
 
-    def render(self, mode='human'):
+    def get_state(self):
+        """
+        Capture the whole simulation, to branch the game with set_state()
+
+        The flat float64 layout is: player x, y, done, reward, bullet_time, enemy_time, steps_beyond_done
+        (NaN for None), the numbers of bullets and enemies, the observation, then x, y, dx, dy per bullet,
+        x, y, isleft per enemy (in spawn order), and the random generator state.
+        :return: The state array
+        """
+        as_float = lambda value: np.nan if value is None else value
+        header = [self.player.x, self.player.y, self.done, self.reward, as_float(self.bullet_time),
+                  as_float(self.enemy_time), as_float(self.steps_beyond_done), len(self.bullets), len(self.enemies)]
+        bullets = [value for bullet in self.bullets
+                   for value in (bullet.x, bullet.y, bullet.direction[0], bullet.direction[1])]
+        enemies = [value for enemy in self.enemies for value in (enemy.x, enemy.y, enemy.isleft)]
+        return np.concatenate([header, self.state, bullets, enemies, rng_state(self.np_random)])
+
+    def set_state(self, state):
+        """
+        Restore a simulation captured by get_state(), recycling the entities of the current scene
+        :param state: The state array
+        """
+        from_float = lambda value, cast: None if np.isnan(value) else cast(value)
+        self.player.x, self.player.y = float(state[0]), float(state[1])
+        self.done = bool(state[2])
+        self.reward = int(state[3])
+        self.bullet_time = from_float(state[4], float)
+        self.enemy_time = from_float(state[5], float)
+        self.steps_beyond_done = from_float(state[6], int)
+        n_bullets, n_enemies = int(state[7]), int(state[8])
+        offset = 9 + len(self.state)
+        self.state[:] = state[9:offset]
+
+        self.pools['bullet'].release_all(self.bullets)
+        self.bullets = []
+        for x, y, dx, dy in state[offset:offset + 4 * n_bullets].reshape(-1, 4).tolist():
+            self.bullets.append(self.pools['bullet'].acquire((x, y), (int(dx), int(dy))))
+        offset += 4 * n_bullets
+
+        self.pools['enemy'].release_all(self.enemies)
+        self.enemies = []
+        for x, y, isleft in state[offset:offset + 3 * n_enemies].reshape(-1, 3).tolist():
+            enemy = self.pools['enemy'].acquire((x, y))
+            enemy.isleft = int(isleft)
+            self.enemies.append(enemy)
+        offset += 3 * n_enemies
+
+        set_rng_state(self.np_random, state[offset:offset + rng_state_size(state[offset])])
+        self.reset_geoms()
+
+    def render(self, mode: str = None):
         """
         Render the current state of the scene
-        :param mode: The rendering mode to use
+        :param mode: The rendering mode to use, defaults to the env's render_mode (no-op when headless)
         """
+        if mode is None:
+            mode = self.render_mode
+        if mode is None:
+            return None
+
+        if mode == 'rgb_array' and self.renderer == 'numpy':
+            if self.rasterizer is None:
+                # one pixel per unit, like the viewer
+                self.rasterizer = Rasterizer(self.width, self.height, n_observations=self.n_observations,
+                                             arena_width=self.width, arena_height=self.height)
+            bullet_x, bullet_y = positions(self.bullets)
+            enemy_x, enemy_y = positions(self.enemies)
+            return self.rasterizer.render([self.player.x], [self.player.y], bullet_x[None], bullet_y[None],
+                                          enemy_x[None], enemy_y[None], player_alive=[not self.done])[0]
+
         if self.viewer is None:
-            self.viewer = rendering.Viewer(SCREEN_WIDTH, SCREEN_HEIGHT)
+            self.viewer = load_rendering().Viewer(self.width, self.height)
             self.reset_geoms()
 
+        # the simulation only tracks positions, move the sprites right before drawing
+        self.player.sync_shape()
+        for entity in self.bullets + self.enemies:
+            entity.sync_shape()
         return self.viewer.render(return_rgb_array=mode == 'rgb_array')
 
     def close(self):
@@ -173,6 +381,16 @@ class ShooterEnv(gym.Env):
         if self.viewer:
             self.viewer.close()
             self.viewer = None
+        if self.profiler is not None:
+            self.profiler.close()
+
+    def profile_report(self):
+        """
+        Aggregate the profile of the steps so far, the env must be created with profile=True
+        :return: The StepProfiler.report() dict, str(env.profiler) formats it as a table
+        """
+        assert self.profiler is not None, "the env is not profiled, create it with profile=True"
+        return self.profiler.report()
 
     # -- Sugar coding functions
 
@@ -182,11 +400,31 @@ class ShooterEnv(gym.Env):
         :param entity: The entity to check
         :param arr: The array of the entity type
         """
-        if entity.x >= SCREEN_WIDTH or entity.y >= SCREEN_HEIGHT or entity.x <= 0.0 or entity.y <= 0.0:
+        if entity.x >= self.width or entity.y >= self.height or entity.x <= 0.0 or entity.y <= 0.0:
             # remove it from the scene
             arr.remove(entity)
             # remove it from the renderer
-            self.viewer.geoms.remove(entity.shape)
+            self.remove_geom(entity)
+            self.pools[entity.type].release(entity)
+            if self.profiler is not None:
+                self.profiler.count(entity.type + '_removals')
+
+    def add_geom(self, entity):
+        """
+        Add the entity to the renderer, if one is attached
+        :param entity: The entity to draw
+        """
+        if self.viewer:
+            self.viewer.add_geom(entity.shape)
+
+    def remove_geom(self, entity):
+        """
+        Remove the entity from the renderer, if one is attached
+        :param entity: The entity to stop drawing
+        """
+        # an entity that was never drawn has no shape to remove, and building it here would be wasted
+        if self.viewer and entity._shape is not None and entity._shape in self.viewer.geoms:
+            self.viewer.geoms.remove(entity._shape)
 
     def reset_geoms(self):
         """
@@ -194,7 +432,10 @@ class ShooterEnv(gym.Env):
         """
         if self.viewer:
             self.viewer.geoms = []
-            self.viewer.add_geom(self.player.shape)
+            if not self.done:
+                self.add_geom(self.player)
+            for entity in self.bullets + self.enemies:
+                self.add_geom(entity)
 
     # -- Interacting with the environment --
 
@@ -202,56 +443,48 @@ class ShooterEnv(gym.Env):
         """
         Compute all observations, updating the state
         """
-        # reset state
-        self.state = np.zeros(3 + N_OBSERVATIONS * 2, dtype=np.int64)
-
         # player status: pos_x, pos_y, facing_direction 
         self.state[0] = self.player.x 
         self.state[1] = self.player.y 
         self.state[2] = action 
 
-        # make observations
-        alpha = 0
-        for i in range(3, 3 + 2 * N_OBSERVATIONS-1, 2):
-            x = self.player.x + (max(SCREEN_HEIGHT, SCREEN_WIDTH)) * math.cos(
-                alpha * self.dtheta)
-            y = self.player.y + (max(SCREEN_HEIGHT, SCREEN_WIDTH)) * math.sin(
-                alpha * self.dtheta)
-
-            # check for enemies
-            for enemy in self.enemies:
-                t, d = line_entity_intersection((self.player.x, self.player.y), (x, y), enemy)
-                if t != 0: # intersect with the enemies 
-                    self.state[i] = t
-                    self.state[i+1] = d 
-
-                    # debugging lines
-                    if self.viewer:
-                        line = self.viewer.draw_line((self.player.x, self.player.y), (enemy.x, enemy.y))
-                        line.set_color(1., 0., 0.)
-                        self.viewer.add_onetime(line)
-
-            # else, set border distance (as nothing exists in that angle)
-            if self.state[i] == 0:
-                self.state[i] = BORDER_VALUE
-                self.state[i + 1] = border_distance(self.player.x, self.player.y, alpha * self.dtheta)
-            alpha += 1
+        # make observations, ray by ray in a typical scene, else with arrays
+        if not self.enemies or (self.n_observations <= SCAN_RAYS and
+                                len(self.enemies) * self.n_observations <= SCAN_TESTS):
+            seen = self.rays.scan(self.player.x, self.player.y, [enemy.x for enemy in self.enemies],
+                                  [enemy.y for enemy in self.enemies], self.state[3:])
+        else:
+            _, seen = self.rays.observe(self.player.x, self.player.y, *positions(self.enemies), out=self.state[3:])
+            seen = seen.any(axis=0)
+        if self.profiler is not None:
+            self.profiler.count('ray_tests', self.n_observations * len(self.enemies))
+
+        # debugging lines
+        if self.viewer:
+            for enemy in compress(self.enemies, seen):
+                line = self.viewer.draw_line((self.player.x, self.player.y), (enemy.x, enemy.y))
+                line.set_color(1., 0., 0.)
+                self.viewer.add_onetime(line)
 
     def bullet_spawn(self, time_bullet, action):
-        time_bullet += 1 / 15
+        time_bullet += 1 / BULLET_INTERVAL
         if int(time_bullet) >= 1:
-            bul = self.player.shoot(action)
-            self.viewer.add_geom(bul.shape)
+            bul = self.player.shoot(action, self.pools['bullet'])
+            self.add_geom(bul)
             self.bullets.append(bul)
             time_bullet = 0
+            if self.profiler is not None:
+                self.profiler.count('bullet_spawns')
         return time_bullet
     
     def enemy_spawn(self, time_enemy):
-        time_enemy += 1 / 50
+        time_enemy += 1 / ENEMY_INTERVAL
         if int(time_enemy) >= 1 and len(self.enemies) < self.enemy_limit:
-            ene = Enemy(random.choice([(0, 0), (0, SCREEN_HEIGHT/2), (0, SCREEN_HEIGHT), (SCREEN_WIDTH/2, 0), (SCREEN_WIDTH/2, SCREEN_HEIGHT), 
-                                          (SCREEN_WIDTH, 0), (SCREEN_WIDTH, SCREEN_HEIGHT/2), (SCREEN_WIDTH, SCREEN_HEIGHT)]))
-            self.viewer.add_geom(ene.shape)
+            point = self.spawn_points[self.np_random.choice(len(self.spawn_points))]
+            ene = self.pools['enemy'].acquire(point)
+            self.add_geom(ene)
             self.enemies.append(ene)
             time_enemy = 0
+            if self.profiler is not None:
+                self.profiler.count('enemy_spawns')
         return time_enemy
@@ -0,0 +1,32 @@
+import pyglet
+from gym.envs.classic_control import rendering
+
+# decoded sprite images, shared by every entity and env of the process
+TEXTURES = {}
+
+
+def load_texture(path):
+    """
+    Decode an image asset once per process
+
+    :param path: The path of the image
+    :return: The pyglet image
+    """
+    texture = TEXTURES.get(path)
+    if texture is None:
+        texture = TEXTURES[path] = pyglet.image.load(path)
+    return texture
+
+
+class Sprite(rendering.Image):
+    """
+    rendering.Image drawing a cached texture instead of decoding its file again
+    """
+
+    def __init__(self, fname, width, height):
+        rendering.Geom.__init__(self)
+        self.set_color(1.0, 1.0, 1.0)
+        self.width = width
+        self.height = height
+        self.img = load_texture(fname)
+        self.flip = False
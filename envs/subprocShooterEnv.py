@@ -0,0 +1,215 @@
+from envs.param import *
+from envs.shooterEnv import ShooterEnv
+
+import multiprocessing as mp
+import numpy as np
+from multiprocessing import shared_memory
+from gym import spaces
+
+
+def buffer_layout(num_envs, obs_dim):
+    """
+    Describe the arrays exchanged through shared memory
+
+    :param num_envs: The number of environments
+    :param obs_dim: The size of one observation
+    :return: A list of (name, shape, dtype)
+    """
+    return [('actions', (num_envs,), np.int64),
+            ('observations', (num_envs, obs_dim), np.int64),
+            ('terminal_observations', (num_envs, obs_dim), np.int64),
+            ('rewards', (num_envs,), np.float64),
+            ('dones', (num_envs,), np.bool_)]
+
+
+def buffer_size(layout):
+    """
+    :param layout: The buffer layout, see buffer_layout
+    :return: The number of bytes needed by the layout
+    """
+    return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, shape, dtype in layout)
+
+
+def buffer_views(shm, layout):
+    """
+    Map the arrays of a layout onto a shared memory block, without copying
+
+    :param shm: The SharedMemory block
+    :param layout: The buffer layout, see buffer_layout
+    :return: A dict of NumPy arrays
+    """
+    views, offset = {}, 0
+    for name, shape, dtype in layout:
+        views[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return views
+
+
+def worker(remote, parent_remote, shm_name, num_envs, obs_dim, env_indices, env_kwargs, seed):
+    """
+    Worker process loop, stepping its environments on command
+
+    :param remote: The worker end of the command pipe
+    :param parent_remote: The parent end of the command pipe, closed here
+    :param shm_name: The name of the shared memory block
+    :param num_envs: The total number of environments
+    :param obs_dim: The size of one observation
+    :param env_indices: The indices of the environments owned by this worker
+    :param env_kwargs: Keyword arguments of ShooterEnv
+    :param seed: Base random seed, each environment uses seed + its index
+    """
+    parent_remote.close()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffers = buffer_views(shm, buffer_layout(num_envs, obs_dim))
+    envs = []
+    for i in env_indices:
+        env = ShooterEnv(render_mode=None, **env_kwargs)
+        env.seed(seed + i)
+        envs.append(env)
+
+    try:
+        while True:
+            command = remote.recv_bytes()
+            if command == b'step':
+                for i, env in zip(env_indices, envs):
+                    observation, reward, done, _ = env.step(int(buffers['actions'][i]))
+                    if done:
+                        buffers['terminal_observations'][i] = observation
+                        observation = env.reset()
+                    buffers['observations'][i] = observation
+                    buffers['rewards'][i] = reward
+                    buffers['dones'][i] = done
+            elif command == b'reset':
+                for i, env in zip(env_indices, envs):
+                    buffers['observations'][i] = env.reset()
+            elif command == b'close':
+                break
+            remote.send_bytes(b'ok')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for env in envs:
+            env.close()
+        del buffers
+        shm.close()
+        remote.close()
+
+
+class SubprocShooterEnv:
+    """
+    Run num_envs ShooterEnv instances in worker processes.
+
+    Observations, rewards and dones are written by the workers into a shared memory block and read by the
+    parent without any pickling, the pipes only carry a few bytes per command. Finished environments are reset
+    automatically, the observation they ended with is available in info['terminal_observation'].
+    step_async() returns immediately, so the caller can work (e.g. train) while the workers simulate.
+    """
+
+    def __init__(self, num_envs: int, num_workers: int = None, seed: int = 42, start_method: str = None,
+                 **env_kwargs):
+        """
+        Start the workers
+
+        :param num_envs: The number of environments
+        :param num_workers: The number of worker processes, one per CPU by default
+        :param seed: Base random seed, each environment uses seed + its index
+        :param start_method: The multiprocessing start method, the platform default if None
+        :param env_kwargs: Keyword arguments of ShooterEnv
+        """
+        self.num_envs = num_envs
+        self.num_workers = min(num_workers or mp.cpu_count(), num_envs)
+        obs_dim = 3 + env_kwargs.get('n_observations', N_OBSERVATIONS) * 2
+
+        self.single_action_space = spaces.Discrete(8)
+        self.single_observation_space = spaces.Box(np.zeros(obs_dim), np.ones(obs_dim), dtype=np.int64)
+        self.action_space = spaces.MultiDiscrete([8] * num_envs)
+        self.observation_space = spaces.Box(np.zeros((num_envs, obs_dim)), np.ones((num_envs, obs_dim)),
+                                            dtype=np.int64)
+
+        layout = buffer_layout(num_envs, obs_dim)
+        self.shm = shared_memory.SharedMemory(create=True, size=buffer_size(layout))
+        self.buffers = buffer_views(self.shm, layout)
+
+        ctx = mp.get_context(start_method)
+        self.remotes, self.processes = [], []
+        for env_indices in np.array_split(np.arange(num_envs), self.num_workers):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(target=worker, daemon=True,
+                                  args=(work_remote, remote, self.shm.name, num_envs, obs_dim,
+                                        env_indices.tolist(), env_kwargs, seed))
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.waiting = False
+        self.closed = False
+
+    def send(self, command):
+        for remote in self.remotes:
+            remote.send_bytes(command)
+        self.waiting = True
+
+    def wait(self):
+        for remote in self.remotes:
+            remote.recv_bytes()
+        self.waiting = False
+
+    def reset(self):
+        """
+        Reset every environment
+        :return: The (num_envs, 19) observations
+        """
+        self.send(b'reset')
+        self.wait()
+        return self.buffers['observations'].copy()
+
+    def step_async(self, actions):
+        """
+        Start stepping every environment, without waiting for the result
+        :param actions: The (num_envs,) actions to apply
+        """
+        assert not self.waiting, "step_wait() must be called before the next step_async()"
+        self.buffers['actions'][:] = actions
+        self.send(b'step')
+
+    def step_wait(self):
+        """
+        Wait for the step started by step_async()
+        :return: observations (num_envs, 19), rewards (num_envs,), dones (num_envs,), info
+        """
+        self.wait()
+        dones = self.buffers['dones'].copy()
+        info = {'terminal_observation': np.where(dones[:, None], self.buffers['terminal_observations'],
+                                                 self.buffers['observations'])}
+        return self.buffers['observations'].copy(), self.buffers['rewards'].copy(), dones, info
+
+    def step(self, actions):
+        """
+        Apply one step in every environment
+        :param actions: The (num_envs,) actions to apply
+        :return: observations (num_envs, 19), rewards (num_envs,), dones (num_envs,), info
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        """
+        Stop the workers and free the shared memory
+        """
+        if self.closed:
+            return
+        if self.waiting:
+            self.wait()
+        self.send(b'close')
+        for process in self.processes:
+            process.join()
+        for remote in self.remotes:
+            remote.close()
+        self.buffers = None
+        self.shm.close()
+        self.shm.unlink()
+        self.closed = True
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
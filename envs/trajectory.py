@@ -0,0 +1,169 @@
+"""
+Episodes are logged as their seed and actions only, the env being deterministic given its seed.
+
+A log file is MAGIC followed by one record per episode:
+    seed (int64) | number of steps (uint32) | actions (uint8 each) | cumulative rewards (int32 each)
+all little endian. Records are appended when an episode ends, a crash only loses the current episode.
+"""
+
+from envs.shooterEnv import ShooterEnv
+
+import struct
+import numpy as np
+
+MAGIC = b'SHOOTTRJ'
+RECORD_HEADER = struct.Struct('<qI')
+
+
+class TrajectoryLogger:
+    """
+    Wrap a ShooterEnv to log every episode it plays.
+
+    Each reset() seeds the env with the next episode seed, so that the episode can be re-simulated from its seed
+    and actions, see Replayer.
+    """
+
+    def __init__(self, env: ShooterEnv, path: str, seed: int = 0):
+        """
+        Open the log, appending to it if it exists
+
+        :param env: The env to wrap
+        :param path: The log file
+        :param seed: The seed of the first episode, the next ones use the following integers
+        """
+        self.env = env
+        self.next_seed = seed
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.seed = None
+        self.actions = []
+        self.rewards = []
+
+    def __getattr__(self, name):
+        # behave as the wrapped env for everything else (spaces, render, ...)
+        if name == 'env':
+            raise AttributeError(name)
+        return getattr(self.env, name)
+
+    def reset(self):
+        """
+        Start a new episode, logging the current one if it has steps
+        :return: The state observations
+        """
+        self.flush()
+        self.seed = self.next_seed
+        self.next_seed += 1
+        self.env.seed(self.seed)
+        return self.env.reset()
+
+    def step(self, action: int):
+        observation, reward, done, info = self.env.step(action)
+        self.actions.append(action)
+        self.rewards.append(reward)
+        if done:
+            self.flush()
+        return observation, reward, done, info
+
+    def flush(self):
+        """
+        Append the current episode to the log, if it has steps
+        """
+        if not self.actions:
+            return
+        self.file.write(RECORD_HEADER.pack(self.seed, len(self.actions)))
+        self.file.write(np.asarray(self.actions, dtype=np.uint8).tobytes())
+        self.file.write(np.asarray(self.rewards, dtype='<i4').tobytes())
+        self.file.flush()
+        self.actions = []
+        self.rewards = []
+
+    def close(self):
+        """
+        Log the current episode and close the log and the env
+        """
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+        self.env.close()
+
+
+def read_trajectories(path):
+    """
+    Read a log written by TrajectoryLogger
+
+    :param path: The log file
+    :return: A list of (seed, actions, rewards) tuples, the arrays being views of the file content
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("%s is not a trajectory log" % path)
+    episodes, offset = [], len(MAGIC)
+    while offset + RECORD_HEADER.size <= len(data):
+        seed, n = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + 5 * n > len(data):
+            # truncated by a crash while writing
+            break
+        actions = np.frombuffer(data, dtype=np.uint8, count=n, offset=offset)
+        rewards = np.frombuffer(data, dtype='<i4', count=n, offset=offset + n)
+        episodes.append((seed, actions, rewards))
+        offset += 5 * n
+    return episodes
+
+
+class Replayer:
+    """
+    Re-simulate logged episodes in a headless ShooterEnv, rendering them only on demand
+    """
+
+    def __init__(self, path: str, renderer: str = 'numpy', **env_kwargs):
+        """
+        Read the log
+
+        :param path: The log file
+        :param renderer: The renderer of the frames, see ShooterEnv
+        :param env_kwargs: Other keyword arguments of ShooterEnv, matching the logged env
+        """
+        self.episodes = read_trajectories(path)
+        self.env = ShooterEnv(render_mode=None, renderer=renderer, **env_kwargs)
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def replay(self, index, render=False):
+        """
+        Re-simulate an episode
+
+        :param index: The episode index in the log
+        :param render: Whether to yield the frame of every state
+        :return: A generator of (observation, reward, done, frame or None), starting with the reset state
+        """
+        seed, actions, _ = self.episodes[index]
+        self.env.seed(seed)
+        observation = self.env.reset()
+        yield observation, 0, False, self.env.render(mode='rgb_array') if render else None
+        for action in actions:
+            observation, reward, done, _ = self.env.step(int(action))
+            yield observation, reward, done, self.env.render(mode='rgb_array') if render else None
+
+    def verify(self, index):
+        """
+        Check that re-simulating an episode reproduces its logged rewards exactly
+
+        :param index: The episode index in the log
+        :return: Whether every reward matches
+        """
+        rewards = [reward for _, reward, _, _ in self.replay(index)][1:]
+        return np.array_equal(rewards, self.episodes[index][2])
+
+    def frames(self, index):
+        """
+        :param index: The episode index in the log
+        :return: The (n_steps + 1, H, W, 3) frames of an episode
+        """
+        return np.stack([frame for _, _, _, frame in self.replay(index, render=True)])
+
+    def close(self):
+        self.env.close()
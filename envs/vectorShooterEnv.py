@@ -0,0 +1,253 @@
+from envs.collision import bullet_enemy_collisions, player_enemy_collisions
+from envs.observations import RayCaster
+from envs.raster import Rasterizer
+from envs.param import *
+
+import math
+import numpy as np
+from gym import spaces
+from gym.utils import seeding
+
+
+def live_width(alive):
+    """
+    Number of leading slots holding every live entity of every arena
+
+    :param alive: Boolean mask of shape (num_envs, capacity)
+    :return: The index after the last slot alive in any arena
+    """
+    live = np.flatnonzero(alive.any(axis=0))
+    return int(live[-1]) + 1 if len(live) else 0
+
+
+class VectorShooterEnv:
+    """
+    Run num_envs independent ShooterEnv arenas in lockstep.
+
+    Every entity lives in padded struct-of-arrays buffers of shape (num_envs, capacity), where the live
+    entities of an arena always occupy the first slots in spawn order (the order of ShooterEnv's lists).
+    Finished arenas are reset automatically at the end of step(), the observation they ended with is
+    available in info['terminal_observation'].
+    """
+    metadata = {'render.modes': ['rgb_array']}
+
+    def __init__(self, num_envs: int, enemy_limit: int = ENEMY_LIMIT, max_bullets: int = None, seed: int = 42,
+                 n_observations: int = N_OBSERVATIONS):
+        """
+        Create the environments
+
+        :param num_envs: The number of arenas to simulate
+        :param enemy_limit: The maximum number of enemies per arena
+        :param max_bullets: The bullet capacity per arena, large enough by default to never drop a bullet
+        :param seed: Random seed
+        :param n_observations: The number of rays observing the surroundings of each player
+        """
+        self.num_envs = num_envs
+        self.enemy_limit = enemy_limit
+        if max_bullets is None:
+            # a bullet crosses the whole screen before the (n + 1)th is fired
+            bullet_velocity = ENTITIES.get('bullet').get('initial_velocity')
+            max_bullets = math.ceil(max(SCREEN_WIDTH, SCREEN_HEIGHT) / bullet_velocity / BULLET_INTERVAL) + 1
+        self.max_bullets = max_bullets
+
+        self.single_action_space = spaces.Discrete(8)
+        self.single_observation_space = spaces.Box(np.zeros(3 + n_observations * 2),
+                                                   np.ones(3 + n_observations * 2),
+                                                   dtype=np.int64)
+        self.action_space = spaces.MultiDiscrete([8] * num_envs)
+        self.observation_space = spaces.Box(np.zeros((num_envs, 3 + n_observations * 2)),
+                                            np.ones((num_envs, 3 + n_observations * 2)),
+                                            dtype=np.int64)
+
+        self.directions = np.array(DIRECTIONS, dtype=np.float64)
+        self.spawn_points = np.array(ENEMY_SPAWN_POINTS, dtype=np.float64)
+        self.rays = RayCaster(n_observations)
+        # software renderer, only created on the first render() call
+        self.rasterizer = None
+
+        n, b, e = num_envs, self.max_bullets, enemy_limit
+        self.player_x = np.zeros(n)
+        self.player_y = np.zeros(n)
+        self.bullet_x = np.zeros((n, b))
+        self.bullet_y = np.zeros((n, b))
+        self.bullet_dx = np.zeros((n, b))
+        self.bullet_dy = np.zeros((n, b))
+        self.bullet_alive = np.zeros((n, b), dtype=np.bool_)
+        self.enemy_x = np.zeros((n, e))
+        self.enemy_y = np.zeros((n, e))
+        self.enemy_alive = np.zeros((n, e), dtype=np.bool_)
+        self.bullet_time = np.zeros(n)
+        self.enemy_time = np.zeros(n)
+        self.reward = np.zeros(n)
+        self.state = np.zeros((n, 3 + n_observations * 2), dtype=np.int64)
+
+        self.np_random = None
+        self.seed(seed)
+        self.reset()
+
+    def seed(self, seed: int = None):
+        """
+        Fix the random seed for reproducibility
+        :param seed: Random seed
+        """
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def reset(self):
+        """
+        Reset every arena
+        :return: The (num_envs, 19) observations
+        """
+        self.reset_envs(np.ones(self.num_envs, dtype=np.bool_))
+        return self.state.copy()
+
+    def reset_envs(self, mask):
+        """
+        Reset the arenas selected by mask and recompute their observations
+        :param mask: Boolean mask of shape (num_envs,)
+        """
+        self.player_x[mask] = SCREEN_WIDTH / 2
+        self.player_y[mask] = SCREEN_HEIGHT / 2
+        self.bullet_alive[mask] = False
+        self.enemy_alive[mask] = False
+        self.bullet_time[mask] = 0
+        self.enemy_time[mask] = 0
+        self.reward[mask] = 0
+        self.make_observations(np.zeros(self.num_envs, dtype=np.int64), mask)
+
+    def step(self, actions):
+        """
+        Apply one step in every arena
+        :param actions: The (num_envs,) actions to apply
+        :return: observations (num_envs, 19), rewards (num_envs,), dones (num_envs,), info
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        assert actions.shape == (self.num_envs,), "expected %d actions, got %r" % (self.num_envs, actions.shape)
+        assert ((0 <= actions) & (actions < 8)).all(), "%r invalid" % actions
+        rows = np.arange(self.num_envs)
+
+        # move the players
+        player_velocity = ENTITIES.get('player').get('initial_velocity')
+        self.player_x = np.clip(self.player_x + self.directions[actions, 0] * player_velocity, 0, SCREEN_WIDTH)
+        self.player_y = np.clip(self.player_y + self.directions[actions, 1] * player_velocity, 0, SCREEN_HEIGHT)
+
+        # spawning the bullets
+        self.bullet_time += 1 / BULLET_INTERVAL
+        shoot = self.bullet_time >= 1
+        self.bullet_time[shoot] = 0
+        slot = self.bullet_alive.sum(axis=1)
+        shoot &= slot < self.max_bullets
+        env, slot = rows[shoot], slot[shoot]
+        self.bullet_x[env, slot] = self.player_x[env]
+        self.bullet_y[env, slot] = self.player_y[env]
+        self.bullet_dx[env, slot] = self.directions[actions[env], 0]
+        self.bullet_dy[env, slot] = self.directions[actions[env], 1]
+        self.bullet_alive[env, slot] = True
+
+        # updating the bullets, dropping the ones out of the screen
+        bullet_velocity = ENTITIES.get('bullet').get('initial_velocity')
+        self.bullet_x += self.bullet_dx * bullet_velocity
+        self.bullet_y += self.bullet_dy * bullet_velocity
+        self.bullet_alive &= (self.bullet_x < SCREEN_WIDTH) & (self.bullet_y < SCREEN_HEIGHT) & \
+                             (self.bullet_x > 0.0) & (self.bullet_y > 0.0)
+
+        # spawning the enemies
+        self.enemy_time += 1 / ENEMY_INTERVAL
+        slot = self.enemy_alive.sum(axis=1)
+        spawn = (self.enemy_time >= 1) & (slot < self.enemy_limit)
+        self.enemy_time[spawn] = 0
+        env, slot = rows[spawn], slot[spawn]
+        point = self.np_random.choice(len(self.spawn_points), size=len(env))
+        self.enemy_x[env, slot] = self.spawn_points[point, 0]
+        self.enemy_y[env, slot] = self.spawn_points[point, 1]
+        self.enemy_alive[env, slot] = True
+
+        # only the slots up to the last live entity of any arena need to be simulated
+        ne, nb = live_width(self.enemy_alive), live_width(self.bullet_alive)
+        enemy_x, enemy_y, enemy_alive = self.enemy_x[:, :ne], self.enemy_y[:, :ne], self.enemy_alive[:, :ne]
+        bullet_x, bullet_y, bullet_alive = self.bullet_x[:, :nb], self.bullet_y[:, :nb], self.bullet_alive[:, :nb]
+
+        # moving the enemies towards the player
+        enemy_velocity = ENTITIES.get('enemy').get('initial_velocity')
+        dx = self.player_x[:, None] - enemy_x
+        dy = self.player_y[:, None] - enemy_y
+        dist = np.hypot(dx, dy)
+        moving = dist > 0
+        safe_dist = np.where(moving, dist, 1)
+        enemy_x[:] = np.where(moving, enemy_x + dx / safe_dist * enemy_velocity, enemy_x)
+        enemy_y[:] = np.where(moving, enemy_y + dy / safe_dist * enemy_velocity, enemy_y)
+
+        # remove enemies hit by a bullet
+        killed, used = bullet_enemy_collisions(enemy_x, enemy_y, bullet_x, bullet_y, enemy_alive, bullet_alive)
+        enemy_alive &= ~killed
+        bullet_alive &= ~used
+        self.reward += KILLED_ENEMY * killed.sum(axis=1)
+
+        # the player dies when touching an enemy
+        dones = player_enemy_collisions(self.player_x, self.player_y, enemy_x, enemy_y, enemy_alive).any(axis=1)
+        self.reward[dones] += DIED
+
+        self.compact()
+        self.make_observations(actions)
+        rewards = self.reward.copy()
+        info = {'terminal_observation': self.state.copy()}
+        if dones.any():
+            self.reset_envs(dones)
+        return self.state.copy(), rewards, dones, info
+
+    def render(self, mode: str = 'rgb_array', width: int = SCREEN_WIDTH, height: int = SCREEN_HEIGHT,
+               indices=None):
+        """
+        Render every arena with the software rasterizer
+        :param mode: The rendering mode, only 'rgb_array' is supported
+        :param width: The width of the frames, in pixels
+        :param height: The height of the frames, in pixels
+        :param indices: Optional indices of the arenas to render, all of them by default
+        :return: The (num_envs, height, width, 3) frames, or one per index
+        """
+        assert mode in self.metadata['render.modes'], "%r is not a valid render mode" % mode
+        if self.rasterizer is None or (self.rasterizer.width, self.rasterizer.height) != (width, height):
+            self.rasterizer = Rasterizer(width, height, n_observations=self.rays.n_rays)
+        rows = slice(None) if indices is None else np.asarray(indices)
+        nb, ne = live_width(self.bullet_alive[rows]), live_width(self.enemy_alive[rows])
+        return self.rasterizer.render(self.player_x[rows], self.player_y[rows],
+                                      self.bullet_x[rows, :nb], self.bullet_y[rows, :nb],
+                                      self.enemy_x[rows, :ne], self.enemy_y[rows, :ne],
+                                      self.bullet_alive[rows, :nb], self.enemy_alive[rows, :ne])
+
+    def close(self):
+        pass
+
+    # -- Sugar coding functions
+
+    def compact(self):
+        """
+        Move the live entities back to the first slots, keeping their spawn order
+        """
+        order = np.argsort(~self.bullet_alive, axis=1, kind='stable')
+        for name in ('bullet_x', 'bullet_y', 'bullet_dx', 'bullet_dy', 'bullet_alive'):
+            setattr(self, name, np.take_along_axis(getattr(self, name), order, axis=1))
+        order = np.argsort(~self.enemy_alive, axis=1, kind='stable')
+        for name in ('enemy_x', 'enemy_y', 'enemy_alive'):
+            setattr(self, name, np.take_along_axis(getattr(self, name), order, axis=1))
+
+    def make_observations(self, actions, mask=None):
+        """
+        Compute the observations of the arenas selected by mask, updating the state
+        :param actions: The (num_envs,) last actions, reported as facing direction
+        :param mask: Boolean mask of shape (num_envs,), every arena by default
+        """
+        ne = live_width(self.enemy_alive)
+        if mask is None:
+            self.state[:, 0] = self.player_x
+            self.state[:, 1] = self.player_y
+            self.state[:, 2] = actions
+            self.rays.observe(self.player_x, self.player_y, self.enemy_x[:, :ne], self.enemy_y[:, :ne],
+                              self.enemy_alive[:, :ne], out=self.state[:, 3:])
+        else:
+            self.state[mask, 0] = self.player_x[mask]
+            self.state[mask, 1] = self.player_y[mask]
+            self.state[mask, 2] = actions[mask]
+            self.state[mask, 3:], _ = self.rays.observe(self.player_x[mask], self.player_y[mask],
+                                                        self.enemy_x[mask, :ne], self.enemy_y[mask, :ne],
+                                                        self.enemy_alive[mask, :ne])
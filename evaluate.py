@@ -0,0 +1,179 @@
+"""
+Greedy evaluation of a saved agent over many seeds, in parallel worker processes.
+
+Every seed plays one headless episode. The scores and survival times (steps) are summarized by their mean, a
+bootstrap confidence interval of the mean and percentiles:
+    python3 evaluate.py pretrained_model/dqn_agent.pth --episodes 1000
+    python3 evaluate.py q_agent.csv --gate 500
+With --gate, the exit status is 1 unless the lower bound of the score interval reaches the gate.
+"""
+
+import argparse
+import json
+import os
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def load_policy(path):
+    """
+    Load the greedy policy of a saved agent, converted to NumPy so that workers do not need torch
+
+    :param path: A Q-table (.csv), a checkpoint (.bin), a NumPy policy (.npz) or a DQN state dict (.pth)
+    :return: A picklable callable mapping a batch of observations to actions
+    """
+    if path.endswith('.csv'):
+        from tabular import TabularPolicy
+
+        return TabularPolicy(np.loadtxt(path, delimiter=','))
+    if path.endswith('.bin'):
+        from checkpoint import load_policy as load_checkpoint_policy
+
+        policy = load_checkpoint_policy(path)
+        if hasattr(policy, 'q_table'):
+            # a copy rather than a map of the file, for the workers
+            policy.q_table = np.array(policy.q_table)
+        return policy
+
+    from policy import NumpyPolicy, load_state_dict
+
+    if path.endswith('.npz'):
+        return NumpyPolicy.load(path)
+    return NumpyPolicy.from_state_dict(load_state_dict(path))
+
+
+def play(policy, seeds, max_steps=10000, env_kwargs=None):
+    """
+    Play one greedy episode per seed, stepping the episodes together so that the policy acts on batches
+
+    :param policy: A callable mapping a batch of observations to actions
+    :param seeds: The seeds of the episodes
+    :param max_steps: The largest number of steps of an episode, in case the policy survives forever
+    :param env_kwargs: Keyword arguments of ShooterEnv
+    :return: A tuple with the (N,) scores, the (N,) numbers of steps and the (N,) truncation flags
+    """
+    from envs.shooterEnv import ShooterEnv
+
+    envs = []
+    for seed in seeds:
+        env = ShooterEnv(render_mode=None, **(env_kwargs or {}))
+        env.seed(int(seed))
+        envs.append(env)
+    observations = np.stack([env.reset() for env in envs])
+    scores = np.zeros(len(envs), dtype=np.int64)
+    lengths = np.zeros(len(envs), dtype=np.int64)
+    dones = np.zeros(len(envs), dtype=bool)
+    for _ in range(max_steps):
+        alive = np.flatnonzero(~dones)
+        if not len(alive):
+            break
+        for i, action in zip(alive.tolist(), np.asarray(policy(observations[alive])).tolist()):
+            observations[i], scores[i], dones[i], _ = envs[i].step(action)
+            lengths[i] += 1
+    for env in envs:
+        env.close()
+    return scores, lengths, ~dones
+
+
+def bootstrap_ci(values, confidence=0.95, n_resamples=10000, seed=0):
+    """
+    Percentile bootstrap confidence interval of the mean
+
+    :param values: The (N,) samples
+    :param confidence: The confidence level
+    :param n_resamples: The number of bootstrap resamples
+    :param seed: The random seed of the resampling
+    :return: A tuple with the lower and upper bounds
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    # resampled in blocks, to bound the memory of the indices
+    block = max(1, 10 ** 7 // max(len(values), 1))
+    means = np.concatenate([values[rng.integers(len(values), size=(min(block, n_resamples - i), len(values)))]
+                           .mean(axis=1) for i in range(0, n_resamples, block)])
+    low, high = np.quantile(means, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return float(low), float(high)
+
+
+def summarize(values, confidence=0.95, seed=0):
+    """
+    :param values: The (N,) samples
+    :param confidence: The confidence level of the interval of the mean
+    :param seed: The random seed of the bootstrap
+    :return: A dict with the mean, standard deviation, confidence interval of the mean, min, max and percentiles
+    """
+    values = np.asarray(values, dtype=np.float64)
+    low, high = bootstrap_ci(values, confidence, seed=seed)
+    summary = {'mean': values.mean(), 'std': values.std(ddof=1) if len(values) > 1 else 0.0,
+               'ci_low': low, 'ci_high': high, 'min': values.min(), 'max': values.max()}
+    summary.update(('p%d' % p, q) for p, q in zip(PERCENTILES, np.percentile(values, PERCENTILES)))
+    return {name: float(value) for name, value in summary.items()}
+
+
+def evaluate(path, num_episodes=1000, seed=0, num_workers=None, chunk_size=32, max_steps=10000, confidence=0.95,
+             start_method='spawn', **env_kwargs):
+    """
+    Evaluate the greedy policy of a saved agent on the seeds seed, seed + 1, ..., seed + num_episodes - 1
+
+    :param path: The saved agent, see load_policy
+    :param num_episodes: The number of episodes, one per seed
+    :param seed: The first seed
+    :param num_workers: The number of worker processes, one per core by default
+    :param chunk_size: The number of episodes a worker plays together
+    :param max_steps: The largest number of steps of an episode
+    :param confidence: The confidence level of the intervals
+    :param start_method: The multiprocessing start method
+    :param env_kwargs: Keyword arguments of ShooterEnv, e.g. the frame_skip the agent was trained with
+    :return: The report, a dict with the raw results and the summaries of the scores and episode lengths
+    """
+    policy = load_policy(path)
+    seeds = np.arange(seed, seed + num_episodes)
+    chunks = [seeds[i:i + chunk_size] for i in range(0, num_episodes, chunk_size)]
+    with ProcessPoolExecutor(num_workers or os.cpu_count(), mp_context=mp.get_context(start_method)) as pool:
+        results = list(pool.map(play, [policy] * len(chunks), chunks, [max_steps] * len(chunks),
+                                [env_kwargs] * len(chunks)))
+    scores, lengths, truncated = (np.concatenate(arrays) for arrays in zip(*results))
+    return {'policy': path, 'episodes': num_episodes, 'seed': seed, 'confidence': confidence,
+            'truncated': int(truncated.sum()), 'score': summarize(scores, confidence, seed),
+            'length': summarize(lengths, confidence, seed), 'scores': scores.tolist(), 'lengths': lengths.tolist()}
+
+
+def format_report(report):
+    lines = ['%s: %d episodes (seeds %d-%d), %d truncated'
+             % (report['policy'], report['episodes'], report['seed'], report['seed'] + report['episodes'] - 1,
+                report['truncated'])]
+    header = ['mean', 'std', 'ci_low', 'ci_high', 'min'] + ['p%d' % p for p in PERCENTILES] + ['max']
+    lines.append('%-7s' % '' + ''.join('%10s' % name for name in header))
+    for metric in ('score', 'length'):
+        lines.append('%-7s' % metric + ''.join('%10.1f' % report[metric][name] for name in header))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate the greedy policy of a saved agent over many seeds')
+    parser.add_argument('path', help='a Q-table (.csv), a checkpoint (.bin), a NumPy policy (.npz) or a DQN '
+                                     'state dict (.pth)')
+    parser.add_argument('--episodes', type=int, default=1000, help='number of episodes, one per seed')
+    parser.add_argument('--seed', type=int, default=0, help='first seed')
+    parser.add_argument('--workers', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--max-steps', type=int, default=10000, help='steps after which an episode is truncated')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    parser.add_argument('--frame-skip', type=int, default=1, help='frame_skip the agent was trained with')
+    parser.add_argument('--output', help='JSON file the report is written to')
+    parser.add_argument('--gate', type=float, help='least lower bound of the score interval for the exit status 0')
+    args = parser.parse_args()
+
+    report = evaluate(args.path, args.episodes, args.seed, args.workers, max_steps=args.max_steps,
+                      confidence=args.confidence, frame_skip=args.frame_skip)
+    print(format_report(report))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.gate is not None and report['score']['ci_low'] < args.gate:
+        print('score interval %.1f-%.1f below the gate %.1f'
+              % (report['score']['ci_low'], report['score']['ci_high'], args.gate))
+        raise SystemExit(1)
@@ -0,0 +1,211 @@
+from policy import NumpyPolicy
+
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+
+def buffer_views(shm, num_clients, obs_dim):
+    """
+    Map the request and reply arrays onto a shared memory block, without copying
+
+    :param shm: The SharedMemory block
+    :param num_clients: The number of clients
+    :param obs_dim: The size of one observation
+    :return: The (num_clients, obs_dim) observations and the (num_clients,) actions
+    """
+    # actions first, so that both arrays are aligned
+    actions = np.ndarray((num_clients,), dtype=np.int64, buffer=shm.buf)
+    observations = np.ndarray((num_clients, obs_dim), dtype=np.float32, buffer=shm.buf, offset=actions.nbytes)
+    return observations, actions
+
+
+def serve(remotes, shm_name, num_clients, obs_dim, policy_path, max_batch, max_wait, reload_interval):
+    """
+    Server process loop, answering the action requests of the clients in micro-batches
+
+    :param remotes: The server end of the pipe of every client
+    :param shm_name: The name of the shared memory block
+    :param num_clients: The number of clients
+    :param obs_dim: The size of one observation
+    :param policy_path: The NumpyPolicy file, reloaded when it changes
+    :param max_batch: The largest number of requests answered by one forward pass
+    :param max_wait: The longest time, in seconds, the first request of a batch waits for more requests
+    :param reload_interval: The number of seconds between two checks of the policy file
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    observations, actions = buffer_views(shm, num_clients, obs_dim)
+    clients = {remote: index for index, remote in enumerate(remotes)}
+    policy, mtime = NumpyPolicy.load(policy_path), os.stat(policy_path).st_mtime_ns
+    checked = time.monotonic()
+
+    try:
+        while clients:
+            ready = wait(list(clients), timeout=reload_interval)
+            if ready:
+                # keep collecting requests until the batch is full or the first request waited long enough
+                deadline = time.monotonic() + max_wait
+                batch = set(ready)
+                while len(batch) < max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    more = wait([remote for remote in clients if remote not in batch], timeout=remaining)
+                    if not more:
+                        break
+                    batch.update(more)
+
+                requests = []
+                for remote in batch:
+                    try:
+                        command = remote.recv_bytes()
+                    except EOFError:
+                        command = b'close'
+                    if command == b'close':
+                        del clients[remote]
+                    else:
+                        requests.append(remote)
+                if requests:
+                    indices = np.array([clients[remote] for remote in requests])
+                    actions[indices] = policy(observations[indices])
+                    for remote in requests:
+                        remote.send_bytes(b'')
+
+            now = time.monotonic()
+            if now - checked >= reload_interval:
+                checked = now
+                try:
+                    new_mtime = os.stat(policy_path).st_mtime_ns
+                    if new_mtime != mtime:
+                        policy, mtime = NumpyPolicy.load(policy_path), new_mtime
+                except OSError:
+                    # the policy file is being replaced, keep the current one
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        del observations, actions
+        shm.close()
+        for remote in remotes:
+            remote.close()
+
+
+class PolicyClient:
+    """
+    Handle of one client of an InferenceServer, which can be sent to another process.
+    A client has one request in flight at most.
+    """
+
+    def __init__(self, remote, shm_name, index, num_clients, obs_dim):
+        self.remote = remote
+        self.shm_name = shm_name
+        self.index = index
+        self.num_clients = num_clients
+        self.obs_dim = obs_dim
+        self.shm = None
+
+    def __getstate__(self):
+        # the shared memory is attached again by the receiving process
+        state = self.__dict__.copy()
+        state.update(shm=None, observations=None, actions=None)
+        return state
+
+    def act(self, observation):
+        """
+        Get the greedy action of an observation
+
+        :param observation: The (obs_dim,) observation
+        :return: The action
+        """
+        if self.shm is None:
+            self.shm = shared_memory.SharedMemory(name=self.shm_name)
+            self.observations, self.actions = buffer_views(self.shm, self.num_clients, self.obs_dim)
+        self.observations[self.index] = observation
+        self.remote.send_bytes(b'act')
+        self.remote.recv_bytes()
+        return int(self.actions[self.index])
+
+    def close(self):
+        """
+        Tell the server this client is done
+        """
+        if self.remote.closed:
+            return
+        try:
+            self.remote.send_bytes(b'close')
+        except OSError:
+            pass
+        self.remote.close()
+        if self.shm is not None:
+            self.observations = self.actions = None
+            self.shm.close()
+            self.shm = None
+
+
+class InferenceServer:
+    """
+    Serve the greedy actions of a NumpyPolicy to many env workers from a single process.
+
+    Every client writes its observation into a shared memory block and notifies the server through its pipe.
+    The server gathers the pending requests into a micro-batch, until max_batch requests are pending or the
+    first one waited max_wait seconds, answers them with one forward pass and writes the actions back into
+    shared memory. The policy file is reloaded whenever the learner publishes new weights to it, see
+    NumpyPolicy.save.
+    """
+
+    def __init__(self, policy_path: str, num_clients: int, obs_dim: int = 19, max_batch: int = None,
+                 max_wait: float = 1e-3, reload_interval: float = 1.0, start_method: str = None):
+        """
+        Start the server
+
+        :param policy_path: The NumpyPolicy file, see policy.export_numpy
+        :param num_clients: The number of clients
+        :param obs_dim: The size of one observation
+        :param max_batch: The largest number of requests answered by one forward pass, every client by default
+        :param max_wait: The longest time, in seconds, the first request of a batch waits for more requests
+        :param reload_interval: The number of seconds between two checks of the policy file
+        :param start_method: The multiprocessing start method, the platform default if None
+        """
+        self.num_clients = num_clients
+        self.obs_dim = obs_dim
+        self.shm = shared_memory.SharedMemory(create=True, size=num_clients * (obs_dim * 4 + 8))
+
+        ctx = mp.get_context(start_method)
+        pipes = [ctx.Pipe() for _ in range(num_clients)]
+        self.remotes = [remote for remote, _ in pipes]
+        self.clients = [PolicyClient(client, self.shm.name, i, num_clients, obs_dim)
+                        for i, (_, client) in enumerate(pipes)]
+        self.process = ctx.Process(target=serve, daemon=True,
+                                   args=(self.remotes, self.shm.name, num_clients, obs_dim, policy_path,
+                                         max_batch or num_clients, max_wait, reload_interval))
+        self.process.start()
+        for remote in self.remotes:
+            remote.close()
+        self.closed = False
+
+    def client(self, index):
+        """
+        :param index: The client index, in [0, num_clients)
+        :return: The PolicyClient, to send to the process that uses it
+        """
+        return self.clients[index]
+
+    def close(self):
+        """
+        Stop the server and free the shared memory
+        """
+        if self.closed:
+            return
+        for client in self.clients:
+            client.close()
+        self.process.join()
+        self.shm.close()
+        self.shm.unlink()
+        self.closed = True
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
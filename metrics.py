@@ -0,0 +1,328 @@
+"""
+Streaming training metrics.
+
+Every logged value updates O(1) statistics (running mean and deviation, exponential moving average and
+quantile sketch), and is queued for a background thread that appends it to a CSV file. The file can be tailed
+while training runs, e.g. by the live viewer of this module:
+    python3 metrics.py metrics/dqn_agent.csv
+"""
+
+import argparse
+import bisect
+import csv
+import io
+import math
+import os
+import threading
+import time
+import numpy as np
+
+# metrics of the training scripts
+METRICS = ('score', 'length', 'epsilon', 'loss', 'steps_per_sec')
+
+
+class RunningStats:
+    """
+    Count, mean, variance (Welford's algorithm), minimum and maximum of a stream
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class EMA:
+    """
+    Exponential moving average, starting at the first value
+    """
+
+    __slots__ = ('alpha', 'value')
+
+    def __init__(self, alpha: float = 0.01):
+        """
+        :param alpha: The weight of a new value, about 2 / (window + 1) for a window of values
+        """
+        self.alpha = alpha
+        self.value = math.nan
+
+    def update(self, x):
+        self.value = x if math.isnan(self.value) else self.value + self.alpha * (x - self.value)
+
+
+class P2Quantile:
+    """
+    Estimate of a quantile of a stream in constant memory, with the P-square algorithm (Jain and Chlamtac, 1985).
+
+    Five markers track the minimum, the quantile, the maximum and two intermediate quantiles. Their heights are
+    adjusted with a piecewise parabolic interpolation as the values arrive.
+    """
+
+    __slots__ = ('p', 'heights', 'positions', 'desired', 'increments')
+
+    def __init__(self, p: float):
+        """
+        :param p: The quantile, in [0, 1]
+        """
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        q, n = self.heights, self.positions
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+        # cell of the new value, moving the extreme markers if it is outside
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # linear when the parabola leaves the neighbour markers
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    @property
+    def value(self):
+        if len(self.heights) < 5:
+            # exact on the first values
+            return self.heights[round(self.p * (len(self.heights) - 1))] if self.heights else math.nan
+        return self.heights[2]
+
+
+class Metric:
+    """
+    Streaming statistics of one metric
+    """
+
+    def __init__(self, ema_alpha: float = 0.01, quantiles=(0.5, 0.9, 0.99)):
+        """
+        :param ema_alpha: The weight of a new value in the moving average
+        :param quantiles: The quantiles to estimate
+        """
+        self.last = math.nan
+        self.stats = RunningStats()
+        self.ema = EMA(ema_alpha)
+        self.quantiles = [P2Quantile(p) for p in quantiles]
+
+    def update(self, x):
+        self.last = x
+        self.stats.update(x)
+        self.ema.update(x)
+        for quantile in self.quantiles:
+            quantile.update(x)
+
+    def summary(self):
+        """
+        :return: A dict with the last value, count, mean, std, min, max, EMA and quantiles (as p50, p90, ...)
+        """
+        summary = {'last': self.last, 'count': self.stats.count, 'mean': self.stats.mean, 'std': self.stats.std,
+                   'min': self.stats.min, 'max': self.stats.max, 'ema': self.ema.value}
+        summary.update(('p%g' % (quantile.p * 100), quantile.value) for quantile in self.quantiles)
+        return summary
+
+
+class MetricsLogger:
+    """
+    Log training metrics once per episode, keeping streaming statistics of each and appending them to a CSV file.
+
+    log() only updates the statistics and queues the row, a background thread writes the queued rows every
+    flush_interval seconds, so a viewer can tail the file while training runs.
+    """
+
+    def __init__(self, path: str, metrics=METRICS, flush_interval: float = 1.0, ema_alpha: float = 0.01,
+                 quantiles=(0.5, 0.9, 0.99), start_episode: int = None):
+        """
+        Open the log, appending to it if it exists, and start the writer thread
+
+        :param path: The CSV file, with columns episode, time, then the value and EMA of every metric
+        :param metrics: The names of the metrics
+        :param flush_interval: The number of seconds between two writes
+        :param ema_alpha: The weight of a new value in the moving averages
+        :param quantiles: The quantiles estimated for every metric
+        :param start_episode: The number of the first episode logged, by default the one after the last episode
+            of the existing log, so that a resumed training continues its numbering
+        """
+        self.metrics = {name: Metric(ema_alpha, quantiles) for name in metrics}
+        drop_partial_line(path)
+        if start_episode is None:
+            episodes = read_metrics(path)['episode'] if os.path.exists(path) and os.path.getsize(path) else []
+            start_episode = int(episodes[-1]) + 1 if len(episodes) else 0
+        self.episodes = start_episode
+        self.start = time.time()
+        self.pending = []
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(['episode', 'time'] + [column for name in metrics for column in (name, name + '_ema')])
+
+        self.flush_interval = flush_interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def log(self, **values):
+        """
+        Record the metrics of an episode, the missing ones (or None) are left empty
+
+        :param values: The value of each metric, numbers or 0-dim tensors
+        """
+        row = [self.episodes, round(time.time() - self.start, 3)]
+        for name, metric in self.metrics.items():
+            value = values.get(name)
+            if value is None:
+                row += ['', '']
+                continue
+            value = float(value)
+            metric.update(value)
+            row += ['%.6g' % value, '%.6g' % metric.ema.value]
+        self.episodes += 1
+        with self.lock:
+            self.pending.append(row)
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Write the queued rows
+        """
+        with self.lock:
+            rows, self.pending = self.pending, []
+        if rows and not self.file.closed:
+            self.writer.writerows(rows)
+            self.file.flush()
+
+    def summary(self, names=None):
+        """
+        :param names: The metrics to describe, all the logged ones by default
+        :return: A one-line description of the last value, EMA and median of the metrics
+        """
+        parts = ['episode %d' % self.episodes]
+        for name in names or self.metrics:
+            metric = self.metrics[name]
+            if metric.stats.count:
+                parts.append('%s %.4g (ema %.4g, p50 %.4g)' % (name, metric.last, metric.ema.value,
+                                                               metric.quantiles[0].value))
+        return '  '.join(parts)
+
+    def stats(self):
+        """
+        :return: A dict with the Metric.summary() of every metric
+        """
+        return {name: metric.summary() for name, metric in self.metrics.items()}
+
+    def close(self):
+        """
+        Write the queued rows, stop the writer thread and close the file
+        """
+        if self.file.closed:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+
+def drop_partial_line(path, block_size=4096):
+    """
+    Truncate a log after its last complete line, removing a row left partially written by an interrupted run
+
+    :param path: The CSV file, nothing is done if it does not exist
+    :param block_size: The number of bytes read at once, from the end of the file
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+
+def read_metrics(path):
+    """
+    Read a log written by MetricsLogger, skipping a last line that is still being written (or was cut by a crash)
+
+    :param path: The CSV file
+    :return: A dict of float arrays per column, NaN for the missing values
+    """
+    with open(path, newline='') as f:
+        text = f.read()
+    # only lines ended by a newline are complete, a row cut inside its last field would have the full field count
+    rows = list(csv.reader(io.StringIO(text[:text.rfind('\n') + 1])))
+    header, rows = rows[0], [row for row in rows[1:] if len(row) == len(rows[0])]
+    return {name: np.array([float(row[j]) if row[j] else math.nan for row in rows])
+            for j, name in enumerate(header)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot a metrics log, refreshed while it is written')
+    parser.add_argument('path', help='the CSV file written by MetricsLogger')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between two refreshes')
+    args = parser.parse_args()
+
+    import matplotlib.pyplot as plt
+
+    names = [name for name in read_metrics(args.path) if name not in ('episode', 'time')
+             and not name.endswith('_ema')]
+    fig, axes = plt.subplots(len(names), 1, sharex=True, squeeze=False)
+    while plt.fignum_exists(fig.number):
+        columns = read_metrics(args.path)
+        for ax, name in zip(axes[:, 0], names):
+            ax.clear()
+            ax.plot(columns['episode'], columns[name], color='C0', alpha=0.3)
+            ax.plot(columns['episode'], columns[name + '_ema'], color='C1')
+            ax.set_ylabel(name)
+        axes[-1, 0].set_xlabel('Episodes')
+        plt.pause(args.interval)
@@ -0,0 +1,126 @@
+import argparse
+import os
+import numpy as np
+
+PRETRAINED = 'pretrained_model/dqn_agent.pth'
+
+
+class NumpyPolicy:
+    """
+    Greedy policy of a trained DeepQNetwork, evaluated with NumPy only.
+
+    The fully connected layers are applied in order, with a ReLU between them, so acting does not need torch.
+    """
+
+    def __init__(self, weights, biases):
+        """
+        :param weights: The (out, in) weight matrix of every layer, in order
+        :param biases: The (out,) bias of every layer, in order
+        """
+        # transposed once, so that a batch is multiplied on the left
+        self.weights = [np.ascontiguousarray(np.asarray(w, dtype=np.float32).T) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        """
+        :param state_dict: The state dict of a DeepQNetwork, tensors or arrays
+        :return: The policy
+        """
+        layers = sorted({name.rsplit('.', 1)[0] for name in state_dict})
+        as_array = lambda value: value.cpu().numpy() if hasattr(value, 'cpu') else np.asarray(value)
+        return cls([as_array(state_dict[layer + '.weight']) for layer in layers],
+                   [as_array(state_dict[layer + '.bias']) for layer in layers])
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: A .npz file written by export_numpy
+        :return: The policy
+        """
+        with np.load(path) as data:
+            n_layers = len(data.files) // 2
+            return cls([data['weight_%d' % i] for i in range(n_layers)],
+                       [data['bias_%d' % i] for i in range(n_layers)])
+
+    def save(self, path):
+        """
+        Write the policy for NumpyPolicy.load, replacing the file atomically so that a reader never sees a
+        partial policy
+
+        :param path: The .npz file to write
+        """
+        arrays = {}
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            arrays['weight_%d' % i] = weight.T
+            arrays['bias_%d' % i] = bias
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(path + '.tmp', path)
+
+    def q_values(self, observations):
+        """
+        :param observations: The (N, input_dims) or (input_dims,) observations
+        :return: The Q value of every action
+        """
+        x = np.asarray(observations, dtype=np.float32)
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = x @ weight + bias
+            if i < len(self.weights) - 1:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def __call__(self, observations):
+        """
+        :param observations: The (N, input_dims) or (input_dims,) observations
+        :return: The greedy actions
+        """
+        return np.argmax(self.q_values(observations), axis=-1)
+
+
+def load_state_dict(path):
+    import torch as T
+
+    return T.load(path, map_location='cpu', weights_only=True)
+
+
+def export_numpy(path=PRETRAINED, output='pretrained_model/dqn_policy.npz'):
+    """
+    Export the weights of a saved DeepQNetwork for NumpyPolicy
+
+    :param path: The state dict saved by Agent.save_model
+    :param output: The .npz file to write
+    """
+    NumpyPolicy.from_state_dict(load_state_dict(path)).save(output)
+
+
+def export_torchscript(path=PRETRAINED, output='pretrained_model/dqn_policy.pt'):
+    """
+    Export a saved DeepQNetwork as a frozen TorchScript module, loadable with torch.jit.load without this code
+
+    :param path: The state dict saved by Agent.save_model
+    :param output: The TorchScript file to write
+    """
+    import torch as T
+    from dqn_agent import DeepQNetwork
+
+    state_dict = load_state_dict(path)
+    input_dims, n_actions = state_dict['fc1.weight'].shape[1], state_dict['fc3.weight'].shape[0]
+    network = DeepQNetwork(0, input_dims, n_actions).to('cpu')
+    network.load_state_dict(state_dict)
+    network.eval()
+    with T.inference_mode():
+        module = T.jit.freeze(T.jit.trace(network, T.zeros(1, input_dims)))
+    T.jit.save(module, output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a trained DeepQNetwork for inference')
+    parser.add_argument('output', help='.npz for a NumPy policy, else a TorchScript module')
+    parser.add_argument('--model', default=PRETRAINED, help='the state dict saved by Agent.save_model')
+    args = parser.parse_args()
+
+    if args.output.endswith('.npz'):
+        export_numpy(args.model, args.output)
+    else:
+        export_torchscript(args.model, args.output)
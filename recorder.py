@@ -0,0 +1,135 @@
+from utils import label_with_episode
+
+import os
+import queue
+import threading
+import numpy as np
+
+
+class EpisodeRecorder:
+    """
+    Record episodes to one video file each, encoded by a background thread.
+
+    Frames go through a bounded queue, so the training thread only pays for rendering, and waits when the
+    writer falls behind instead of piling frames up in memory. Every episode file is complete once the writer
+    moves on to the next one, a crash only loses the episode being written.
+    """
+
+    def __init__(self, prefix: str, fmt: str = 'gif', fps: int = 60, frame_skip: int = 1, downscale: int = 1,
+                 label: bool = True, queue_size: int = 256):
+        """
+        Prepare the recorder, the writer thread starts with the first recorded episode
+
+        :param prefix: The path prefix of the files, written as <prefix>_<episode>.<fmt>
+        :param fmt: The video format, 'gif', or 'mp4' (requires imageio-ffmpeg)
+        :param fps: The frame rate of the videos
+        :param frame_skip: Record one frame out of frame_skip
+        :param downscale: Integer factor by which the frames are shrunk
+        :param label: Whether to print the episode number on the frames
+        :param queue_size: The number of frames the queue can hold
+        """
+        self.prefix = prefix
+        self.fmt = fmt
+        self.fps = fps
+        self.frame_skip = frame_skip
+        self.downscale = downscale
+        self.label = label
+        os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+
+        self.episode = None
+        self.frame_count = 0
+        self.error = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+
+    def write(self):
+        """
+        Writer thread loop, the queue holds ('start', episode), ('frame', frame), ('end', None) or ('close', None)
+        """
+        writer, episode = None, None
+        while True:
+            command, value = self.queue.get()
+            try:
+                if command == 'start':
+                    # imported here, off the training thread, and only by the runs that record
+                    import imageio
+
+                    episode = value
+                    writer = imageio.get_writer('%s_%05d.%s' % (self.prefix, episode, self.fmt), fps=self.fps)
+                elif command == 'frame' and writer is not None:
+                    frame = value[::self.downscale, ::self.downscale]
+                    if self.label:
+                        frame = np.asarray(label_with_episode(np.ascontiguousarray(frame), episode))
+                    writer.append_data(frame)
+                elif command in ('end', 'close') and writer is not None:
+                    writer.close()
+                    writer = None
+            except Exception as e:
+                # reported to the training thread, the next episodes are still attempted
+                self.error = e
+                writer = None
+            if command == 'close':
+                break
+
+    def put(self, command, value=None):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        self.queue.put((command, value))
+
+    @property
+    def recording(self):
+        return self.episode is not None
+
+    def start_episode(self, episode):
+        """
+        Start recording an episode, ending the one being recorded if any
+
+        :param episode: The episode number, used in the file name
+        """
+        self.end_episode()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.write, daemon=True)
+            self.thread.start()
+        self.episode = episode
+        self.frame_count = 0
+        self.put('start', episode)
+
+    def wants_frame(self):
+        """
+        Count a step of the current episode, to be called once per step
+
+        :return: Whether the frame of this step is recorded, so that skipped frames do not need to be rendered
+        """
+        if not self.recording:
+            return False
+        self.frame_count += 1
+        return (self.frame_count - 1) % self.frame_skip == 0
+
+    def add_frame(self, frame):
+        """
+        Record a frame of the current episode
+
+        :param frame: The (H, W, 3) frame
+        """
+        self.put('frame', frame)
+
+    def end_episode(self):
+        """
+        End the episode being recorded, if any
+        """
+        if self.recording:
+            self.put('end')
+            self.episode = None
+
+    def close(self):
+        """
+        Finish writing every queued frame and stop the writer thread
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.end_episode()
+        self.queue.put(('close', None))
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
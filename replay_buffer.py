@@ -0,0 +1,355 @@
+import os
+import torch as T
+import numpy as np
+
+
+def sample_indices(n, k, replace=True, rng=np.random):
+    """
+    Draw k indices in [0, n) in O(k), instead of the O(n) permutation of np.random.choice(n, k, replace=False)
+
+    :param n: The number of items to sample from
+    :param k: The number of indices to draw
+    :param replace: Whether an index can be drawn twice
+    :param rng: The random generator (np.random or a RandomState)
+    :return: The (k,) array of indices
+    """
+    if replace:
+        return rng.randint(0, n, size=k)
+    if 2 * k > n:
+        # rejections would be frequent, the permutation is cheap anyway
+        return rng.choice(n, k, replace=False)
+    indices = np.unique(rng.randint(0, n, size=k))
+    while len(indices) < k:
+        indices = np.unique(np.concatenate([indices, rng.randint(0, n, size=k - len(indices))]))
+    rng.shuffle(indices)
+    return indices
+
+
+class ReplayBuffer:
+    """
+    Uniform experience replay stored as one contiguous float32 record per transition:
+    [state, new_state, action, reward, terminal]
+
+    A sampled batch is gathered with a single copy, then split into tensors without further copies.
+    """
+
+    def __init__(self, max_size, input_dims, replace=True):
+        """
+        Preallocate the memory
+
+        :param max_size: The number of transitions kept
+        :param input_dims: The size of an observation
+        :param replace: Whether a batch may contain the same transition twice
+        """
+        self.mem_size = max_size
+        self.input_dims = input_dims
+        self.replace = replace
+        self.mem_cntr = 0
+        self.memory = np.zeros((max_size, 2 * input_dims + 3), dtype=np.float32)
+
+    def __len__(self):
+        return min(self.mem_cntr, self.mem_size)
+
+    def store_transition(self, state, action, reward, state_, terminal):
+        index = self.mem_cntr % self.mem_size
+        record = self.memory[index]
+        record[:self.input_dims] = state
+        record[self.input_dims:2 * self.input_dims] = state_
+        record[-3:] = action, reward, terminal
+
+        self.mem_cntr += 1
+        return index
+
+    def split(self, batch, device):
+        """
+        Turn a block of records into the training tensors
+
+        :param batch: The (batch_size, record size) records
+        :param device: The torch device of the network
+        :return: states, actions, rewards, new states, terminal flags
+        """
+        batch = T.from_numpy(batch).to(device)
+        d = self.input_dims
+        return batch[:, :d], batch[:, -3].long(), batch[:, -2], batch[:, d:2 * d], batch[:, -1].bool()
+
+    def sample_buffer(self, batch_size, device='cpu'):
+        """
+        Sample a batch of transitions
+
+        :param batch_size: The number of transitions
+        :param device: The torch device of the network
+        :return: states, actions, rewards, new states, terminal flags, None (no importance weights), indices
+        """
+        indices = sample_indices(len(self), batch_size, self.replace)
+        return self.split(self.memory[indices], device) + (None, indices)
+
+    def update_priorities(self, indices, errors):
+        """
+        Uniform replay ignores the TD errors
+        """
+        pass
+
+    def state_dict(self):
+        """
+        :return: Everything needed to restore the buffer
+        """
+        return {'mem_cntr': self.mem_cntr, 'memory': self.memory[:len(self)].copy()}
+
+    def load_state_dict(self, state):
+        """
+        Restore the buffer from state_dict()
+        :param state: The saved state
+        """
+        self.mem_cntr = state['mem_cntr']
+        self.memory[:len(state['memory'])] = state['memory']
+
+
+class SumTree:
+    """
+    Binary tree whose nodes hold the sum of their children, stored as a flat array.
+    Updating a leaf and sampling a leaf proportionally to its value are both O(log n).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # smallest power of two fitting every leaf, so that every level is complete
+        self.n_leaves = 1
+        while self.n_leaves < capacity:
+            self.n_leaves *= 2
+        self.tree = np.zeros(2 * self.n_leaves - 1, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[0]
+
+    def update(self, indices, values):
+        """
+        Set the value of some leaves
+
+        :param indices: The leaf indices, in [0, capacity)
+        :param values: The new values
+        """
+        nodes = np.asarray(indices) + self.n_leaves - 1
+        self.tree[nodes] = values
+        nodes = np.unique((nodes - 1) // 2)
+        while True:
+            self.tree[nodes] = self.tree[2 * nodes + 1] + self.tree[2 * nodes + 2]
+            if nodes[0] == 0:
+                break
+            nodes = np.unique((nodes - 1) // 2)
+
+    def find(self, values):
+        """
+        Find the leaves where the cumulative sum reaches each value
+
+        :param values: Values in [0, total)
+        :return: The leaf indices
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.zeros(len(values), dtype=np.int64)
+        while nodes[0] < self.n_leaves - 1:
+            left = 2 * nodes + 1
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        return np.minimum(nodes - (self.n_leaves - 1), self.capacity - 1)
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.n_leaves - 1]
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Proportional prioritized experience replay (Schaul et al. 2016) over a SumTree
+    """
+
+    def __init__(self, max_size, input_dims, alpha=0.6, beta=0.4, beta_inc=1e-5, eps=1e-3):
+        """
+        Preallocate the memory
+
+        :param max_size: The number of transitions kept
+        :param input_dims: The size of an observation
+        :param alpha: How much the priorities shape the sampling, 0 being uniform
+        :param beta: Initial strength of the importance sampling correction, annealed to 1
+        :param beta_inc: Increment of beta per sampled batch
+        :param eps: Priority added to every TD error, so that every transition can be sampled
+        """
+        super().__init__(max_size, input_dims)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_inc = beta_inc
+        self.eps = eps
+        self.max_priority = 1.0
+        self.tree = SumTree(max_size)
+
+    def store_transition(self, state, action, reward, state_, terminal):
+        index = super().store_transition(state, action, reward, state_, terminal)
+        # new transitions get the highest priority so they are replayed at least once
+        self.tree.update([index], [self.max_priority])
+        return index
+
+    def sample_buffer(self, batch_size, device='cpu'):
+        """
+        Sample a batch of transitions proportionally to their priority, one per equal slice of the total
+
+        :param batch_size: The number of transitions
+        :param device: The torch device of the network
+        :return: states, actions, rewards, new states, terminal flags, importance weights, indices
+        """
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        values = np.minimum(values, np.nextafter(self.tree.total, 0))
+        indices = np.minimum(self.tree.find(values), len(self) - 1)
+
+        probs = self.tree.get(indices) / self.tree.total
+        weights = np.power(len(self) * probs, -self.beta)
+        weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_inc)
+        return self.split(self.memory[indices], device) + (T.from_numpy(weights).to(device), indices)
+
+    def update_priorities(self, indices, errors):
+        """
+        Set the priorities of sampled transitions from their new TD errors
+
+        :param indices: The indices returned by sample_buffer
+        :param errors: The absolute TD errors
+        """
+        priorities = np.power(np.abs(errors) + self.eps, self.alpha)
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def state_dict(self):
+        state = super().state_dict()
+        state.update(tree=self.tree.tree.copy(), beta=self.beta, max_priority=self.max_priority)
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.tree.tree[:] = state['tree']
+        self.beta = state['beta']
+        self.max_priority = state['max_priority']
+
+
+class MemmapReplayBuffer:
+    """
+    Uniform experience replay kept in memory-mapped files, so its capacity is bounded by the disk rather than
+    the RAM and its content survives the process.
+
+    Observations are stored as a stream: the new state of the transition in slot i is the observation of
+    slot i + 1. A transition is stored with its new state only, when its state is the new state of the previous
+    (non terminal) transition. Slots holding the last observation of an episode have no transition.
+    Each observation is thus stored once only for a single sequential stream of transitions, e.g. one env
+    played step by step. Interleaved streams (several envs or actors) store both observations of almost every
+    transition, doubling the disk used and halving the capacity, see actor_learner.check_memory.
+    """
+
+    def __init__(self, max_size, input_dims, directory, replace=True):
+        """
+        Open the memory files, creating them if needed
+
+        :param max_size: The number of observations kept
+        :param input_dims: The size of an observation
+        :param directory: The directory of the memory files
+        :param replace: Whether a batch may contain the same transition twice
+        """
+        self.mem_size = max_size
+        self.input_dims = input_dims
+        self.directory = directory
+        self.replace = replace
+        os.makedirs(directory, exist_ok=True)
+        self.observations = self.open_file('observations.npy', (max_size, input_dims))
+        # action, reward, terminal, and whether the slot holds a transition
+        self.transitions = self.open_file('transitions.npy', (max_size, 4))
+
+        # the counters are saved with the agent checkpoint, files found without them hold no usable data
+        self.mem_cntr = 0
+        self.head = 0
+        self.filled = 0
+        self.continuing = False
+
+    def open_file(self, name, shape):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            array = np.load(path, mmap_mode='r+')
+            if array.shape == shape and array.dtype == np.float32:
+                return array
+            del array
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+
+    def __len__(self):
+        return self.filled
+
+    def write_observation(self, observation):
+        slot = self.head
+        self.observations[slot] = observation
+        self.transitions[slot, 3] = 0
+        self.head = (self.head + 1) % self.mem_size
+        self.filled = min(self.filled + 1, self.mem_size)
+        return slot
+
+    def store_transition(self, state, action, reward, state_, terminal):
+        last = (self.head - 1) % self.mem_size
+        if self.continuing and np.array_equal(self.observations[last], state):
+            slot = last
+        else:
+            slot = self.write_observation(state)
+        self.transitions[slot] = action, reward, terminal, 0
+        self.write_observation(state_)
+        # only valid once the new state is written
+        self.transitions[slot, 3] = 1
+        self.continuing = not terminal
+
+        self.mem_cntr += 1
+        return slot
+
+    def sample_buffer(self, batch_size, device='cpu'):
+        """
+        Sample a batch of transitions
+
+        :param batch_size: The number of transitions
+        :param device: The torch device of the network
+        :return: states, actions, rewards, new states, terminal flags, None (no importance weights), indices
+        """
+        indices = sample_indices(self.filled, batch_size, self.replace)
+        # redraw the few slots without a transition
+        invalid = self.transitions[indices, 3] == 0
+        while invalid.any():
+            indices[invalid] = sample_indices(self.filled, int(invalid.sum()), True)
+            invalid = self.transitions[indices, 3] == 0
+        scalars = T.from_numpy(self.transitions[indices]).to(device)
+        states = T.from_numpy(self.observations[indices]).to(device)
+        new_states = T.from_numpy(self.observations[(indices + 1) % self.mem_size]).to(device)
+        return states, scalars[:, 0].long(), scalars[:, 1], new_states, scalars[:, 2].bool(), None, indices
+
+    def update_priorities(self, indices, errors):
+        """
+        Uniform replay ignores the TD errors
+        """
+        pass
+
+    def flush(self):
+        """
+        Write the memory to disk
+        """
+        self.observations.flush()
+        self.transitions.flush()
+
+    def state_dict(self):
+        """
+        :return: The counters needed to reopen the memory files, which are flushed
+        """
+        self.flush()
+        return {'mem_cntr': self.mem_cntr, 'head': self.head, 'filled': self.filled,
+                'continuing': self.continuing, 'directory': self.directory}
+
+    def load_state_dict(self, state):
+        """
+        Restore the counters saved with the memory files
+        :param state: The saved state
+        """
+        assert os.path.abspath(state['directory']) == os.path.abspath(self.directory), \
+            "the checkpoint memory lives in %s, not %s" % (state['directory'], self.directory)
+        self.mem_cntr = state['mem_cntr']
+        self.head = state['head']
+        self.filled = state['filled']
+        self.continuing = state['continuing']
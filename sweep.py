@@ -0,0 +1,287 @@
+"""
+Parallel hyperparameter sweep of the tabular and DQN agents, with asynchronous successive halving (ASHA).
+
+Trials train in rungs of min_episodes, min_episodes * eta, min_episodes * eta ** 2, ... up to max_episodes.
+When a worker is free, the best trial of a rung that is in the top 1 / eta of its rung and not promoted yet
+resumes training up to the next rung, else a new configuration starts at the first rung. Under-performing trials
+thus stop early, without waiting for a whole rung to complete. Trials resume from their checkpoint, in any
+worker process. Every result updates one summary table:
+    python3 sweep.py tabular --samples 27
+    python3 sweep.py dqn --samples 16 --min-episodes 50 --max-episodes 450
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import time
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# values tried for each hyperparameter
+SPACES = {
+    'tabular': {
+        'alpha': [0.03, 0.1, 0.3],
+        'gamma': [0.9, 0.95, 0.99],
+        'eps_decay': [0.99, 0.995, 0.999],
+    },
+    'dqn': {
+        'gamma': [0.95, 0.99],
+        'lr': [3e-4, 1e-3, 3e-3],
+        'batch_size': [32, 64, 128],
+        'eps_dec': [5e-5, 5e-4, 5e-3],
+    },
+}
+
+
+def sample_configs(space, num_samples=None, seed=0):
+    """
+    :param space: A dict of the values of each hyperparameter
+    :param num_samples: The number of distinct random configurations, the whole grid in random order if None
+    :param seed: The random seed
+    :return: A list of configurations, dicts of hyperparameter values
+    """
+    rng = np.random.default_rng(seed)
+    names = list(space)
+    grid = list(itertools.product(*(space[name] for name in names)))
+    return [dict(zip(names, grid[i])) for i in rng.permutation(len(grid))[:num_samples]]
+
+
+def train_tabular(config, num_episodes, checkpoint_path, seed, num_envs=64):
+    """
+    Train a Q-table for num_episodes more episodes, resuming from its checkpoint if it exists
+
+    :return: The scores of the episodes
+    """
+    from checkpoint import load_agent, save_agent
+    from tabular import QLearner
+
+    if os.path.exists(checkpoint_path):
+        learner = load_agent(checkpoint_path)
+        learner.rng = np.random.default_rng(seed)
+    else:
+        learner = QLearner(seed=seed, **config)
+    scores = learner.train(num_episodes, num_envs=num_envs, seed=seed)
+    save_agent(learner, checkpoint_path)
+    return scores
+
+
+def train_dqn(config, num_episodes, checkpoint_path, seed, max_mem_size=100000):
+    """
+    Train a DQN agent for num_episodes more episodes, as dqn_train.py does headless, resuming from its checkpoint
+    if it exists
+
+    :return: The scores of the episodes
+    """
+    import torch as T
+    from dqn_agent import Agent
+    from envs.shooterEnv import ShooterEnv
+
+    # one thread per worker process, the pool already uses every core
+    T.set_num_threads(1)
+    T.manual_seed(seed)
+    np.random.seed(seed)
+    agent = Agent(gamma=config['gamma'], epsilon=1.0, lr=config['lr'], input_dims=19,
+                  batch_size=config['batch_size'], n_actions=8, max_mem_size=max_mem_size, eps_end=0.01,
+                  eps_dec=config['eps_dec'])
+    if os.path.exists(checkpoint_path):
+        agent.load_models(checkpoint_path)
+
+    env = ShooterEnv(render_mode=None)
+    env.seed(seed)
+    scores = []
+    for _ in range(num_episodes):
+        observation = env.reset().astype(np.float32)
+        done = False
+        while not done:
+            action = agent.choose_action(observation)
+            observation_, reward, done, _ = env.step(action)
+            observation_ = observation_.astype(np.float32)
+            agent.store_transition(observation, action, reward, observation_, int(done))
+            agent.learn()
+            observation = observation_
+        scores.append(reward)
+    env.close()
+    agent.save_models(checkpoint_path)
+    return scores
+
+
+TRAINERS = {'tabular': train_tabular, 'dqn': train_dqn}
+
+
+def run_segment(kind, config, num_episodes, checkpoint_path, seed, score_window):
+    """
+    Worker task: train a trial up to its next rung
+
+    :return: A tuple with the running score (mean of the last score_window episodes) and the elapsed seconds
+    """
+    start = time.time()
+    scores = TRAINERS[kind](config, num_episodes, checkpoint_path, seed)
+    return float(np.mean(scores[-score_window:])), time.time() - start
+
+
+class ASHA:
+    """
+    Asynchronous successive halving scheduler, deciding which trial runs next
+    """
+
+    def __init__(self, configs, min_episodes=100, max_episodes=2700, eta=3):
+        """
+        :param configs: The configurations to try, in order
+        :param min_episodes: The number of episodes of the first rung
+        :param max_episodes: The largest number of episodes of a trial
+        :param eta: The reduction factor, 1 / eta of the trials of a rung are promoted to the next one
+        """
+        self.configs = list(configs)
+        self.eta = eta
+        self.rungs = [min_episodes]
+        while self.rungs[-1] * eta <= max_episodes:
+            self.rungs.append(self.rungs[-1] * eta)
+        # score of the trials that completed each rung, and the trials promoted from it
+        self.results = [{} for _ in self.rungs]
+        self.promoted = [set() for _ in self.rungs]
+        self.started = 0
+
+    def next_job(self):
+        """
+        :return: A tuple with the trial index and the rung to train it to, or None if no trial can run now
+        """
+        for rung in reversed(range(len(self.rungs) - 1)):
+            results = self.results[rung]
+            top = sorted(results, key=results.get, reverse=True)[:len(results) // self.eta]
+            for trial in top:
+                if trial not in self.promoted[rung]:
+                    self.promoted[rung].add(trial)
+                    return trial, rung + 1
+        if self.started < len(self.configs):
+            self.started += 1
+            return self.started - 1, 0
+        return None
+
+    def report(self, trial, rung, score):
+        self.results[rung][trial] = score
+
+
+def ranking(trials):
+    """
+    :param trials: A dict of the state of each trial
+    :return: The (trial, state) items, the trials that went furthest first, then by score
+    """
+    return sorted(trials.items(), key=lambda item: (-item[1]['episodes'], -(item[1]['score'] or 0)))
+
+
+def write_summary(path, configs, trials):
+    """
+    Write the summary table, one row per trial started, in ranking order
+
+    :param path: The CSV file
+    :param configs: The configurations
+    :param trials: A dict of the state of each trial started
+    """
+    names = list(configs[0]) if configs else []
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['trial'] + names + ['episodes', 'score', 'rung_scores', 'status', 'seconds', 'error'])
+        for trial, state in ranking(trials):
+            writer.writerow([trial] + [configs[trial][name] for name in names]
+                            + [state['episodes'], '' if state['score'] is None else '%.1f' % state['score'],
+                               ';'.join('%.1f' % score for score in state['rung_scores']), state['status'],
+                               '%.1f' % state['seconds'], state['error']])
+    os.replace(path + '.tmp', path)
+
+
+def sweep(kind, configs, min_episodes=100, max_episodes=2700, eta=3, num_workers=None, score_window=100,
+          directory='sweeps', seed=0, start_method='spawn'):
+    """
+    Run a sweep over a process pool
+
+    :param kind: The agent kind, 'tabular' or 'dqn'
+    :param configs: The configurations to try, dicts of keyword arguments of the agent
+    :param min_episodes: The number of episodes of the first rung
+    :param max_episodes: The largest number of episodes of a trial
+    :param eta: The reduction factor of the rungs
+    :param num_workers: The number of worker processes, one per core by default
+    :param score_window: The number of last episodes the running score of a rung is averaged over
+    :param directory: Where the checkpoints of the trials and the summary table (summary.csv) are written
+    :param seed: Base random seed, a trial segment uses seed + trial * len(rungs) + rung
+    :param start_method: The multiprocessing start method, spawn as torch thread pools are not fork safe
+    :return: The dict of the state of each trial: episodes, score, rung scores, status, seconds and error
+    """
+    scheduler = ASHA(configs, min_episodes, max_episodes, eta)
+    rungs = scheduler.rungs
+    num_workers = num_workers or os.cpu_count()
+    summary_path = os.path.join(directory, 'summary.csv')
+    os.makedirs(directory, exist_ok=True)
+    trials = {}
+    running = {}
+    with ProcessPoolExecutor(num_workers, mp_context=mp.get_context(start_method)) as pool:
+        while True:
+            while len(running) < num_workers:
+                job = scheduler.next_job()
+                if job is None:
+                    break
+                trial, rung = job
+                state = trials.setdefault(trial, {'episodes': 0, 'score': None, 'rung_scores': [],
+                                                  'status': 'running', 'seconds': 0.0, 'error': ''})
+                state['status'] = 'running'
+                checkpoint_path = os.path.join(directory, 'trial_%03d.%s' % (trial, 'bin' if kind == 'tabular'
+                                                                               else 'ckpt'))
+                future = pool.submit(run_segment, kind, configs[trial], rungs[rung] - state['episodes'],
+                                     checkpoint_path, seed + trial * len(rungs) + rung, score_window)
+                running[future] = trial, rung
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial, rung = running.pop(future)
+                state = trials[trial]
+                try:
+                    score, seconds = future.result()
+                except Exception as e:
+                    # the trial is not reported to the scheduler, so it is never promoted, the others go on
+                    state.update(status='failed', error='%s: %s' % (type(e).__name__, e))
+                    print('trial %d rung %d failed: %s  %s' % (trial, rung, state['error'], configs[trial]))
+                    continue
+                scheduler.report(trial, rung, score)
+                state.update(episodes=rungs[rung], score=score, seconds=state['seconds'] + seconds,
+                             status='completed' if rung == len(rungs) - 1 else 'paused')
+                state['rung_scores'].append(score)
+                print('trial %d rung %d (%d episodes): score %.1f  %s'
+                      % (trial, rung, rungs[rung], score, configs[trial]))
+            write_summary(summary_path, configs, trials)
+
+    # the trials left behind a rung were stopped early
+    for state in trials.values():
+        if state['status'] == 'paused':
+            state['status'] = 'stopped'
+    write_summary(summary_path, configs, trials)
+    return trials
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep with asynchronous successive halving')
+    parser.add_argument('kind', choices=list(SPACES), help='the agent to tune')
+    parser.add_argument('--samples', type=int, help='number of random configurations, the whole grid by default')
+    parser.add_argument('--min-episodes', type=int, default=100, help='episodes of the first rung')
+    parser.add_argument('--max-episodes', type=int, default=2700, help='episodes of a complete trial')
+    parser.add_argument('--eta', type=int, default=3, help='1 / eta of the trials of a rung are promoted')
+    parser.add_argument('--workers', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--score-window', type=int, default=100, help='episodes the running score averages')
+    parser.add_argument('--directory', default='sweeps', help='where the checkpoints and summary.csv go')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    configs = sample_configs(SPACES[args.kind], args.samples, args.seed)
+    directory = os.path.join(args.directory, args.kind)
+    trials = sweep(args.kind, configs, args.min_episodes, args.max_episodes, args.eta, args.workers,
+                   args.score_window, directory, args.seed)
+
+    print('\n%-6s %-60s %9s %10s %s' % ('trial', 'config', 'episodes', 'score', 'status'))
+    for trial, state in ranking(trials):
+        print('%-6d %-60s %9d %10s %s' % (trial, configs[trial], state['episodes'],
+                                          '-' if state['score'] is None else '%.1f' % state['score'],
+                                          state['status']))
+    print('summary written to %s' % os.path.join(directory, 'summary.csv'))
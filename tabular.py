@@ -0,0 +1,189 @@
+from envs.param import *
+
+import time
+import numpy as np
+
+# weight of the enemy flag of each ray in the state number
+STATE_WEIGHTS = 2 ** np.arange(N_OBSERVATIONS)
+
+
+def encode_states(states):
+    """
+    Pack the enemy flags of the rays into state numbers, with a single dot product
+
+    :param states: The (..., 19) observations
+    :return: The (...) integer state numbers, in [0, 2 ** N_OBSERVATIONS), also for float observations
+    """
+    return (np.asarray(states)[..., 3::2] @ STATE_WEIGHTS).astype(np.int64, copy=False)
+
+
+class TabularPolicy:
+    """
+    Greedy policy of a Q-table
+    """
+
+    def __init__(self, q_table):
+        """
+        :param q_table: The (n_states, n_actions) Q-table
+        """
+        self.q_table = q_table
+
+    def __call__(self, observations):
+        """
+        :param observations: The (N, 19) or (19,) observations
+        :return: The greedy actions
+        """
+        return np.argmax(self.q_table[encode_states(observations)], axis=-1)
+
+
+class QLearner:
+    """
+    Tabular Q-learning over batches of transitions, e.g. one step of many environments.
+
+    Actions are chosen and the Q-table is updated for the whole batch with array operations. Duplicate
+    (state, action) pairs of a batch add up their updates, computed from the Q values before the batch.
+    """
+
+    def __init__(self, n_states: int = 2 ** N_OBSERVATIONS, n_actions: int = 8, alpha: float = 0.1,
+                 gamma: float = 0.99, epsilon: float = 1.0, eps_decay: float = 0.995, min_epsilon: float = 0.01,
+                 seed: int = None):
+        """
+        Create an empty Q-table
+
+        :param n_states: The number of states
+        :param n_actions: The number of actions
+        :param alpha: The learning rate
+        :param gamma: The discount factor
+        :param epsilon: The initial exploration rate
+        :param eps_decay: The factor applied to epsilon after every transition
+        :param min_epsilon: The lowest exploration rate
+        :param seed: Random seed of the exploration
+        """
+        self.q_table = np.zeros((n_states, n_actions))
+        self.n_actions = n_actions
+        self.alpha = alpha
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.eps_decay = eps_decay
+        self.min_epsilon = min_epsilon
+        self.rng = np.random.default_rng(seed)
+
+    def greedy_actions(self, state_nums):
+        """
+        :param state_nums: The (N,) state numbers
+        :return: The (N,) actions of highest Q value
+        """
+        return np.argmax(self.q_table[state_nums], axis=-1)
+
+    def choose_actions(self, state_nums):
+        """
+        Epsilon-greedy actions of a batch of states, decaying epsilon once per transition as if they were taken
+        one after the other, like the single environment of train.py
+
+        :param state_nums: The (N,) state numbers
+        :return: The (N,) actions
+        """
+        if not len(state_nums):
+            return np.zeros(0, dtype=np.int64)
+        epsilons = np.maximum(self.min_epsilon, self.epsilon * self.eps_decay ** np.arange(1, len(state_nums) + 1))
+        self.epsilon = float(epsilons[-1])
+        explore = self.rng.random(len(state_nums)) < epsilons
+        return np.where(explore, self.rng.integers(self.n_actions, size=len(state_nums)),
+                        self.greedy_actions(state_nums))
+
+    def update(self, state_nums, actions, rewards, new_state_nums):
+        """
+        Apply the Q-learning update of a batch of transitions, as train.py does for one
+
+        :param state_nums: The (N,) state numbers
+        :param actions: The (N,) actions
+        :param rewards: The (N,) rewards
+        :param new_state_nums: The (N,) state numbers after the actions
+        """
+        targets = rewards + self.gamma * self.q_table[new_state_nums].max(axis=-1)
+        np.add.at(self.q_table, (state_nums, actions), self.alpha * (targets - self.q_table[state_nums, actions]))
+
+    def train(self, num_episodes, num_envs=64, seed=42, metrics=None, recorder=None, record_interval=1000,
+              num_recorded=6):
+        """
+        Train on num_envs environments stepped together
+
+        :param num_episodes: The number of episodes to play, over all the environments
+        :param num_envs: The number of environments
+        :param seed: Random seed of the environments
+        :param metrics: Optional metrics.MetricsLogger, logging the score, length and epsilon of every episode,
+            with the steps per second of all the environments
+        :param recorder: Optional recorder.EpisodeRecorder. The environment starting episode k * record_interval
+            (episodes are numbered in the order they start) records it and its next num_recorded - 1 episodes
+        :param record_interval: The number of episodes between two recordings
+        :param num_recorded: The number of episodes of a recording
+        :return: The episode scores, in the order they ended
+        """
+        from envs.vectorShooterEnv import VectorShooterEnv
+
+        env = VectorShooterEnv(num_envs, seed=seed)
+        states = encode_states(env.reset())
+        scores = []
+        lengths = np.zeros(num_envs, dtype=np.int64)
+        last = time.perf_counter()
+        # the environment being recorded, the number of episodes it has left to record, the episodes started
+        recorded, to_record, started = None, 0, 0
+        starting = np.arange(num_envs)
+        while len(scores) < num_episodes:
+            if recorder is not None:
+                for i in starting.tolist():
+                    if to_record == 0 and started % record_interval == 0:
+                        recorded, to_record = i, num_recorded
+                    if i == recorded:
+                        recorder.start_episode(started)
+                        to_record -= 1
+                    started += 1
+                if recorder.wants_frame():
+                    recorder.add_frame(env.render(indices=[recorded])[0])
+            actions = self.choose_actions(states)
+            observations, rewards, dones, info = env.step(actions)
+            new_states = encode_states(info['terminal_observation'])
+            self.update(states, actions, rewards, new_states)
+            scores.extend(rewards[dones].tolist())
+            states = encode_states(observations)
+            starting = np.flatnonzero(dones)
+            if recorded is not None and dones[recorded]:
+                recorder.end_episode()
+                if to_record == 0:
+                    recorded = None
+            if metrics is not None:
+                lengths += 1
+                now = time.perf_counter()
+                for score, length in zip(rewards[dones].tolist(), lengths[dones].tolist()):
+                    metrics.log(score=score, length=length, epsilon=self.epsilon,
+                                steps_per_sec=num_envs / (now - last))
+                lengths[dones] = 0
+                last = now
+        env.close()
+        return scores[:num_episodes]
+
+
+def evaluate(q_table, num_episodes, num_envs=64, seed=0, max_steps=100000):
+    """
+    Play the greedy policy of a Q-table on num_envs environments stepped together
+
+    :param q_table: The (n_states, n_actions) Q-table
+    :param num_episodes: The number of episodes to play, over all the environments
+    :param num_envs: The number of environments
+    :param seed: Random seed of the environments
+    :param max_steps: The largest number of steps, in case the policy survives forever
+    :return: The scores of the finished episodes, in the order they ended
+    """
+    from envs.vectorShooterEnv import VectorShooterEnv
+
+    env = VectorShooterEnv(num_envs, seed=seed)
+    policy = TabularPolicy(np.asarray(q_table))
+    observations = env.reset()
+    scores = []
+    for _ in range(max_steps):
+        observations, rewards, dones, _ = env.step(policy(observations))
+        scores.extend(rewards[dones].tolist())
+        if len(scores) >= num_episodes:
+            break
+    env.close()
+    return scores[:num_episodes]
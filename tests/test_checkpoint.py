@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from checkpoint import ALIGNMENT, MAGIC, load, load_agent, load_policy, save, save_agent
+from tabular import QLearner, encode_states
+
+
+def test_round_trip_keeps_arrays_and_meta(tmp_path):
+    path = str(tmp_path / 'a.bin')
+    arrays = {'w': np.arange(12, dtype=np.float32).reshape(3, 4), 'b': np.array([1, 2, 3], dtype=np.int64),
+              'flag': np.array([True, False])}
+    meta = {'gamma': 0.99, 'iter_cntr': 7}
+    save(path, 'dqn', arrays, meta)
+    for mmap in (True, False):
+        kind, loaded, loaded_meta = load(path, mmap)
+        assert kind == 'dqn'
+        assert loaded_meta == meta
+        assert list(loaded) == list(arrays)
+        for name, array in arrays.items():
+            assert loaded[name].dtype == array.dtype
+            assert np.array_equal(loaded[name], array)
+
+
+def test_arrays_are_aligned_and_mapped(tmp_path):
+    path = str(tmp_path / 'a.bin')
+    save(path, 'tabular', {'a': np.ones(3), 'b': np.zeros((5, 7), dtype=np.float32)}, {})
+    _, arrays, _ = load(path)
+    for array in arrays.values():
+        # read-only views of the mapped file, starting on aligned addresses
+        assert not array.flags.writeable
+        assert array.ctypes.data % ALIGNMENT == 0
+    with open(path, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'not a checkpoint')
+    with pytest.raises(ValueError):
+        load(str(path))
+
+
+def test_tabular_agent_round_trip_resumes_training(tmp_path):
+    path = str(tmp_path / 'q.bin')
+    learner = QLearner(seed=0, alpha=0.3, eps_decay=0.99)
+    learner.q_table[:] = np.random.default_rng(0).random(learner.q_table.shape)
+    learner.epsilon = 0.25
+    save_agent(learner, path)
+
+    loaded = load_agent(path)
+    assert np.array_equal(loaded.q_table, learner.q_table)
+    assert (loaded.alpha, loaded.gamma, loaded.epsilon, loaded.eps_decay, loaded.min_epsilon) == \
+        (learner.alpha, learner.gamma, learner.epsilon, learner.eps_decay, learner.min_epsilon)
+    # the loaded Q-table is updated in place
+    loaded.update(np.array([1, 1]), np.array([2, 2]), np.array([1.0, 1.0]), np.array([3, 4]))
+    assert loaded.q_table[1, 2] != learner.q_table[1, 2]
+
+    observations = np.random.default_rng(1).integers(0, 2, size=(50, 19))
+    assert np.array_equal(load_policy(path)(observations), learner.greedy_actions(encode_states(observations)))
+
+
+def test_dqn_agent_round_trip(tmp_path):
+    T = pytest.importorskip('torch')
+    from dqn_agent import Agent
+
+    path = str(tmp_path / 'dqn.bin')
+    T.manual_seed(0)
+    agent = Agent(0.9, 0.0, 1e-3, 19, 64, 8, max_mem_size=1000, eps_end=0.02, eps_dec=1e-4)
+    agent.iter_cntr = 12
+    save_agent(agent, path)
+
+    loaded = load_agent(path)
+    assert (loaded.gamma, loaded.epsilon, loaded.lr, loaded.batch_size, loaded.iter_cntr) == (0.9, 0.0, 1e-3, 64, 12)
+    for name, value in agent.Q_eval.state_dict().items():
+        assert T.equal(loaded.Q_eval.state_dict()[name], value)
+    observations = np.random.default_rng(0).random((100, 19)).astype(np.float32) * 600
+    actions = agent.choose_actions(observations)
+    assert np.array_equal(loaded.choose_actions(observations), actions)
+    assert np.array_equal(load_policy(path)(observations), actions)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from envs.shooterEnv import ShooterEnv
+
+
+def counting(env, name):
+    # wrap a method of the env, counting its calls
+    calls = []
+    method = getattr(env, name)
+
+    def wrapper(*args):
+        calls.append(args)
+        return method(*args)
+    setattr(env, name, wrapper)
+    return calls
+
+
+@pytest.mark.parametrize('frame_skip', [2, 4])
+def test_frame_skip_equals_repeated_steps(frame_skip):
+    skipping = ShooterEnv(render_mode=None, frame_skip=frame_skip)
+    single = ShooterEnv(render_mode=None)
+    for env in (skipping, single):
+        env.seed(11)
+    assert np.array_equal(skipping.reset(), single.reset())
+    ticks = counting(skipping, 'tick')
+    observations = counting(skipping, 'make_observations')
+
+    rng = np.random.default_rng(11)
+    steps = kills = 0
+    done = False
+    while not done:
+        action = int(rng.integers(8))
+        previous = skipping.reward
+        observation, reward, done, _ = skipping.step(action)
+        for _ in range(frame_skip):
+            expected = single.step(action)
+        steps += 1
+        kills += reward > previous
+        # the rewards of the skipped frames add up, the observations are the ones after the last frame
+        assert np.array_equal(observation, expected[0])
+        assert (reward, done) == expected[1:3]
+        assert np.array_equal(skipping.get_state(), single.get_state(), equal_nan=True)
+        assert len(observations) == steps
+        assert len(ticks) == steps * frame_skip or done
+    assert kills > 0
+
+
+def test_observations_are_made_once_per_step():
+    env = ShooterEnv(render_mode=None, frame_skip=3)
+    env.reset()
+    ticks = counting(env, 'tick')
+    observations = counting(env, 'make_observations')
+    for step in range(1, 51):
+        env.step(step % 8)
+        assert (len(ticks), len(observations)) == (3 * step, step)
+
+
+def test_frame_skip_stops_when_the_player_dies():
+    env = ShooterEnv(render_mode=None, frame_skip=5)
+    env.reset()
+    # an enemy on the player
+    env.enemies.append(env.pools['enemy'].acquire((env.player.x + 10, env.player.y)))
+    ticks = counting(env, 'tick')
+    _, reward, done, _ = env.step(0)
+    assert done
+    assert len(ticks) == 1
+    assert reward < 0
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from envs.collision import bullet_enemy_collisions
+from envs.entities import border_distance
+from envs.grid import grid_bullet_enemy_collisions
+from envs.observations import RayCaster
+from envs.shooterEnv import ShooterEnv
+
+
+@pytest.mark.parametrize('arena, enemies, bullets', [(600, 40, 30), (600, 400, 300), (2400, 1000, 1000), (300, 5, 0)])
+def test_grid_collisions_match_every_pair(arena, enemies, bullets):
+    rng = np.random.default_rng(arena + enemies)
+    enemy_x, enemy_y = rng.uniform(0, arena, size=(2, enemies))
+    bullet_x, bullet_y = rng.uniform(0, arena, size=(2, bullets))
+    killed, used = bullet_enemy_collisions(enemy_x, enemy_y, bullet_x, bullet_y)
+    grid_killed, grid_used, tested = grid_bullet_enemy_collisions(enemy_x, enemy_y, bullet_x, bullet_y)
+    assert np.array_equal(killed, grid_killed)
+    assert np.array_equal(used, grid_used)
+    assert tested <= enemies * bullets
+
+
+def test_grid_does_not_change_trajectories():
+    grid = ShooterEnv(render_mode=None, width=1800, height=1200, enemy_limit=400, profile=True)
+    pairs = ShooterEnv(render_mode=None, width=1800, height=1200, enemy_limit=400, profile=True,
+                       grid_threshold=None)
+    grid.seed(5)
+    grid.reset()
+    # a crowded scene away from the player, then the same one in both envs
+    rng = np.random.default_rng(5)
+    for x, y in rng.uniform((0, 0), (600, 1200), size=(300, 2)).tolist():
+        grid.enemies.append(grid.pools['enemy'].acquire((x, y)))
+    for x, y in rng.uniform((0, 0), (600, 1200), size=(300, 2)).tolist():
+        grid.bullets.append(grid.pools['bullet'].acquire((x, y), (1, 0)))
+    pairs.reset()
+    pairs.set_state(grid.get_state())
+    for _ in range(100):
+        action = int(rng.integers(8))
+        observation, reward, done, info = grid.step(action)
+        expected = pairs.step(action)
+        assert np.array_equal(observation, expected[0])
+        assert (reward, done) == expected[1:3]
+        if done:
+            break
+    # the grid tested fewer pairs
+    tests = [env.profile_report()['events']['collision_tests']['total'] for env in (grid, pairs)]
+    assert tests[0] < tests[1]
+    assert reward > 0
+
+
+def test_player_stays_in_a_larger_arena():
+    env = ShooterEnv(render_mode=None, width=900, height=700)
+    env.reset()
+    assert (env.player.x, env.player.y) == (450, 350)
+    for _ in range(400):
+        env.player.advance(3)
+    assert (env.player.x, env.player.y) == (900, 0)
+    assert max(x for x, _ in env.spawn_points) == 900
+    assert max(y for _, y in env.spawn_points) == 700
+
+
+def test_border_distances_of_an_arena_without_table():
+    rays = RayCaster(8, 5000, 3000)
+    assert rays.table is None
+    x, y = 1234.0, 567.0
+    expected = [int(border_distance(x, y, alpha * rays.dtheta, 5000, 3000)) for alpha in range(8)]
+    assert rays.border_row(x, y).tolist() == expected
+    assert rays.border_values(x, y).tolist() == expected
@@ -0,0 +1,45 @@
+import numpy as np
+
+from metrics import MetricsLogger, read_metrics
+
+
+def log_episodes(path, n, **kwargs):
+    logger = MetricsLogger(str(path), flush_interval=60, **kwargs)
+    for i in range(n):
+        logger.log(score=i, length=10 + i, epsilon=0.5, loss=None, steps_per_sec=100)
+    logger.close()
+    return logger
+
+
+def test_log_round_trip(tmp_path):
+    path = tmp_path / 'metrics.csv'
+    log_episodes(path, 5)
+    columns = read_metrics(str(path))
+    assert columns['episode'].tolist() == [0, 1, 2, 3, 4]
+    assert columns['length'].tolist() == [10, 11, 12, 13, 14]
+    assert np.isnan(columns['loss']).all()
+
+
+def test_resume_an_interrupted_log(tmp_path):
+    path = tmp_path / 'metrics.csv'
+    log_episodes(path, 3)
+    complete = path.read_bytes()
+    # a row cut inside its last field by a crash still has the full field count
+    header = complete.split(b'\r\n')[0].split(b',')
+    partial = b','.join([b'3', b'1.5'] + [b'7'] * (len(header) - 3) + [b'0.5'])
+    path.write_bytes(complete + partial)
+    assert read_metrics(str(path))['episode'].tolist() == [0, 1, 2]
+
+    logger = log_episodes(path, 2)
+    assert logger.episodes == 5
+    assert path.read_bytes().startswith(complete)
+    columns = read_metrics(str(path))
+    assert columns['episode'].tolist() == [0, 1, 2, 3, 4]
+    assert columns['score'].tolist() == [0, 1, 2, 0, 1]
+
+
+def test_resume_a_log_cut_in_its_header(tmp_path):
+    path = tmp_path / 'metrics.csv'
+    path.write_bytes(b'episode,ti')
+    log_episodes(path, 2)
+    assert read_metrics(str(path))['episode'].tolist() == [0, 1]
@@ -0,0 +1,48 @@
+import numpy as np
+
+import envs.shooterEnv as shooter
+from envs.observations import RayCaster
+from envs.shooterEnv import ShooterEnv
+
+
+def test_profile_counts_the_tests_of_each_step(monkeypatch):
+    # count the ray and collision tests actually run, next to the profiler
+    tests = {'ray_tests': 0, 'collision_tests': 0}
+
+    def counted(function, event, cost):
+        def wrapper(*args, **kwargs):
+            tests[event] += cost(*args)
+            return function(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(RayCaster, 'scan', counted(RayCaster.scan, 'ray_tests',
+                                                   lambda rays, x, y, enemy_x, *_: rays.n_rays * len(enemy_x)))
+    monkeypatch.setattr(RayCaster, 'observe', counted(RayCaster.observe, 'ray_tests',
+                                                      lambda rays, x, y, enemy_x, *_: rays.n_rays * len(enemy_x)))
+    monkeypatch.setattr(shooter, 'scan_bullet_enemy_collisions',
+                        counted(shooter.scan_bullet_enemy_collisions, 'collision_tests',
+                                lambda enemies, bullets: len(enemies) * len(bullets)))
+    monkeypatch.setattr(shooter, 'bullet_enemy_collisions',
+                        counted(shooter.bullet_enemy_collisions, 'collision_tests',
+                                lambda enemy_x, enemy_y, bullet_x, *_: len(enemy_x) * len(bullet_x)))
+    monkeypatch.setattr(shooter, 'scan_player_enemy_collisions',
+                        counted(shooter.scan_player_enemy_collisions, 'collision_tests',
+                                lambda player, enemies: len(enemies)))
+
+    env = ShooterEnv(render_mode=None, profile=True, frame_skip=2)
+    env.seed(7)
+    rng = np.random.default_rng(7)
+    totals = {event: 0 for event in tests}
+    for _ in range(2):
+        env.reset()
+        done = False
+        while not done:
+            before = dict(tests)
+            _, _, done, info = env.step(int(rng.integers(8)))
+            for event in tests:
+                assert info['profile']['counts'][event] == tests[event] - before[event]
+                totals[event] += tests[event] - before[event]
+    # the tests of reset() are not counted, nor added to a step
+    report = env.profile_report()
+    for event in tests:
+        assert report['events'][event]['total'] == totals[event] > 0
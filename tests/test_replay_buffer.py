@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+
+from replay_buffer import MemmapReplayBuffer, PrioritizedReplayBuffer, ReplayBuffer, SumTree, sample_indices
+
+
+def test_sum_tree_totals_and_sampling():
+    tree = SumTree(10)
+    tree.update(np.arange(10), np.arange(10) + 1.0)
+    assert tree.total == 55
+    assert np.array_equal(tree.get([0, 9]), [1.0, 10.0])
+
+    # the leaf of cumulative sum c holds the values in [c - value, c)
+    bounds = np.cumsum(np.arange(10) + 1.0)
+    assert np.array_equal(tree.find(bounds - 0.5), np.arange(10))
+    assert np.array_equal(tree.find(np.concatenate([[0.0], bounds[:-1]])), np.arange(10))
+
+    tree.update([3], [0.0])
+    assert tree.total == 51
+    counts = np.bincount(tree.find(np.random.default_rng(0).random(100000) * tree.total), minlength=10)
+    assert counts[3] == 0
+    assert np.allclose(counts / counts.sum(), tree.get(np.arange(10)) / tree.total, atol=0.01)
+
+
+def test_sample_indices_without_replacement():
+    rng = np.random.RandomState(0)
+    for n, k in ((1000, 64), (100, 80)):
+        indices = sample_indices(n, k, replace=False, rng=rng)
+        assert len(indices) == k
+        assert len(np.unique(indices)) == k
+        assert ((0 <= indices) & (indices < n)).all()
+
+
+def store(buffer, n, input_dims=3):
+    """
+    Store n transitions whose states encode their number
+    """
+    for t in range(n):
+        state = np.full(input_dims, t, dtype=np.float32)
+        buffer.store_transition(state, t % 8, float(t), state + 0.5, t % 5 == 4)
+
+
+@pytest.mark.parametrize('buffer_class', [ReplayBuffer, PrioritizedReplayBuffer])
+def test_sampled_transitions_are_stored_ones(buffer_class):
+    buffer = buffer_class(16, 3)
+    store(buffer, 40)
+    assert len(buffer) == 16
+    states, actions, rewards, new_states, terminals, weights, indices = buffer.sample_buffer(64)
+    t = rewards.numpy()
+    # only the last 16 transitions are kept
+    assert (t >= 24).all()
+    assert np.array_equal(states.numpy()[:, 0], t)
+    assert np.array_equal(new_states.numpy()[:, 0], t + 0.5)
+    assert np.array_equal(actions.numpy(), t.astype(np.int64) % 8)
+    assert np.array_equal(terminals.numpy(), t % 5 == 4)
+    assert (weights is None) == (buffer_class is ReplayBuffer)
+
+
+def test_prioritized_sampling_follows_priorities():
+    np.random.seed(0)
+    buffer = PrioritizedReplayBuffer(8, 3, alpha=1.0, eps=0.0)
+    store(buffer, 8)
+    buffer.update_priorities(np.arange(8), np.array([1, 1, 1, 1, 1, 1, 1, 9], dtype=np.float64))
+    _, _, rewards, _, _, weights, indices = buffer.sample_buffer(1600)
+    assert abs(np.mean(indices == 7) - 9 / 16) < 0.01
+    assert np.array_equal(rewards.numpy(), indices)
+    # importance weights undo the sampling bias, the most sampled transition weighs the least
+    weights = weights.numpy()
+    assert weights.max() == 1.0
+    assert (weights[indices == 7] < weights[indices != 7].min()).all()
+
+
+def test_prioritized_state_dict_round_trip():
+    buffer = PrioritizedReplayBuffer(8, 3)
+    store(buffer, 6)
+    buffer.update_priorities([1, 2], [0.5, 3.0])
+    restored = PrioritizedReplayBuffer(8, 3)
+    restored.load_state_dict(buffer.state_dict())
+    assert restored.mem_cntr == 6
+    assert np.array_equal(restored.tree.tree, buffer.tree.tree)
+    assert restored.max_priority == buffer.max_priority
+    assert np.array_equal(restored.memory, buffer.memory)
+
+
+def play(buffer, n, seed=0):
+    """
+    Store n transitions of episodes of 4 steps, as an agent does
+
+    :return: The stored transitions by action, actions being unique
+    """
+    rng = np.random.default_rng(seed)
+    transitions = {}
+    state = rng.random(3).astype(np.float32)
+    for t in range(n):
+        state_ = rng.random(3).astype(np.float32)
+        done = t % 4 == 3
+        buffer.store_transition(state, t, float(t), state_, done)
+        transitions[t] = state, state_, done
+        state = rng.random(3).astype(np.float32) if done else state_
+    return transitions
+
+
+def check_samples(buffer, transitions, batch_size=200):
+    states, actions, rewards, new_states, terminals, weights, indices = buffer.sample_buffer(batch_size)
+    assert weights is None
+    for i, action in enumerate(actions.tolist()):
+        state, state_, done = transitions[action]
+        assert np.array_equal(states[i].numpy(), state)
+        # the new state is the observation of the next slot
+        assert np.array_equal(new_states[i].numpy(), state_)
+        assert bool(terminals[i]) == done
+        assert rewards[i] == action
+    return set(actions.tolist())
+
+
+def test_memmap_buffer_next_state_is_next_slot(tmp_path):
+    buffer = MemmapReplayBuffer(10, 3, str(tmp_path))
+    transitions = play(buffer, 23)
+    assert len(buffer) == 10
+    sampled = check_samples(buffer, transitions)
+    # the last observations kept hold the transitions since the oldest slot, wrapping around the files
+    assert sampled == set(range(16, 23))
+
+
+def test_memmap_buffer_survives_the_process(tmp_path):
+    buffer = MemmapReplayBuffer(10, 3, str(tmp_path))
+    transitions = play(buffer, 9)
+    state = buffer.state_dict()
+    buffer.flush()
+    del buffer
+
+    reopened = MemmapReplayBuffer(10, 3, str(tmp_path))
+    reopened.load_state_dict(state)
+    assert reopened.mem_cntr == 9
+    check_samples(reopened, transitions)
+
+
+def test_memmap_buffer_is_refused_by_interleaved_training(tmp_path):
+    from actor_learner import train, train_vectorized
+    from dqn_agent import Agent
+
+    agent = Agent(gamma=0.99, epsilon=1.0, lr=1e-3, input_dims=19, n_actions=8, batch_size=4, max_mem_size=16,
+                  memory_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        train(agent, 1, num_actors=2)
+    with pytest.raises(ValueError):
+        train_vectorized(agent, 1, num_envs=2)
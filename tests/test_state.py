@@ -0,0 +1,56 @@
+import numpy as np
+
+from envs.shooterEnv import ShooterEnv
+
+
+def play(env, actions):
+    """
+    :return: The observations, rewards and dones until the episode ends
+    """
+    transitions = []
+    for action in actions:
+        observation, reward, done, _ = env.step(int(action))
+        transitions.append((observation.copy(), reward, done))
+        if done:
+            break
+    return transitions
+
+
+def same(a, b):
+    return len(a) == len(b) and all(np.array_equal(x[0], y[0]) and x[1:] == y[1:] for x, y in zip(a, b))
+
+
+def test_set_state_replays_the_same_future():
+    env = ShooterEnv(render_mode=None)
+    env.seed(3)
+    env.reset()
+    rng = np.random.default_rng(1)
+    for _ in range(150):
+        env.step(int(rng.integers(8)))
+    state = env.get_state()
+    assert len(env.enemies) and len(env.bullets)
+    actions = rng.integers(8, size=600)
+    future = play(env, actions)
+
+    # in the same env, then in another one with a different seed and scene
+    env.set_state(state)
+    assert same(play(env, actions), future)
+    other = ShooterEnv(render_mode=None)
+    other.seed(99)
+    other.reset()
+    for _ in range(30):
+        other.step(1)
+    other.set_state(state)
+    assert np.array_equal(other.get_state(), state, equal_nan=True)
+    assert same(play(other, actions), future)
+
+
+def test_state_restores_legacy_random_generator():
+    env = ShooterEnv(render_mode=None)
+    env.reset()
+    env.np_random = np.random.RandomState(5)
+    env.np_random.random()
+    state = env.get_state()
+    draws = env.np_random.random(3)
+    env.set_state(state)
+    assert np.array_equal(env.np_random.random(3), draws)
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+import sweep
+from sweep import ASHA
+
+
+def test_asha_promotes_the_top_of_each_rung():
+    rng = np.random.default_rng(0)
+    scores = rng.permutation(27).tolist()
+    scheduler = ASHA([{}] * 27, min_episodes=10, max_episodes=100, eta=3)
+    # budgets grow by eta without exceeding max_episodes
+    assert scheduler.rungs == [10, 30, 90]
+
+    started, promotions = [], []
+    while True:
+        job = scheduler.next_job()
+        if job is None:
+            break
+        trial, rung = job
+        if rung == 0:
+            started.append(trial)
+        else:
+            results = scheduler.results[rung - 1]
+            # in the top 1 / eta of its rung when promoted, and promoted once
+            assert trial in sorted(results, key=results.get, reverse=True)[:len(results) // 3]
+            assert (trial, rung) not in promotions
+            promotions.append((trial, rung))
+        scheduler.report(trial, rung, scores[trial] + rung)
+    assert started == list(range(27))
+    # the best trial goes all the way
+    assert (scores.index(26), 2) in promotions
+    for rung in (1, 2):
+        assert len(scheduler.results[rung]) == len([1 for _, r in promotions if r == rung])
+
+
+def stub_trainer(config, num_episodes, checkpoint_path, seed):
+    """
+    Trainer whose score is the quality of its configuration, counting its episodes in its checkpoint
+    """
+    episodes = 0
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            episodes = int(f.read())
+    with open(config['log'], 'a') as f:
+        f.write('%d %d %d\n' % (config['quality'], episodes, num_episodes))
+    with open(checkpoint_path, 'w') as f:
+        f.write(str(episodes + num_episodes))
+    return [config['quality']] * num_episodes
+
+
+def test_sweep_resumes_trials_from_their_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setitem(sweep.TRAINERS, 'stub', stub_trainer)
+    log = str(tmp_path / 'segments.log')
+    qualities = [4, 7, 1, 8, 0, 5, 2, 6, 3]
+    configs = [{'quality': quality, 'log': log} for quality in qualities]
+    trials = sweep.sweep('stub', configs, min_episodes=2, max_episodes=20, eta=3, num_workers=1,
+                         directory=str(tmp_path), start_method='fork')
+
+    # every segment starts where the checkpoint of its trial stopped, and trains up to the next rung
+    next_rung = {0: 2, 2: 6, 6: 18}
+    with open(log) as f:
+        segments = [tuple(map(int, line.split())) for line in f]
+    for quality, episodes, num_episodes in segments:
+        assert episodes + num_episodes == next_rung[episodes]
+    assert sum(episodes > 0 for _, episodes, _ in segments) == sum(len(state['rung_scores']) - 1
+                                                                    for state in trials.values())
+    for trial, state in trials.items():
+        with open(os.path.join(str(tmp_path), 'trial_%03d.ckpt' % trial)) as f:
+            assert int(f.read()) == state['episodes']
+        assert state['rung_scores'] == [qualities[trial]] * len(state['rung_scores'])
+
+    best = qualities.index(max(qualities))
+    assert trials[best]['status'] == 'completed'
+    assert trials[best]['episodes'] == 18
+    assert {state['status'] for state in trials.values()} == {'completed', 'stopped'}
+    assert os.path.exists(os.path.join(str(tmp_path), 'summary.csv'))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from envs.shooterEnv import ShooterEnv
+from envs.trajectory import MAGIC, Replayer, TrajectoryLogger, read_trajectories
+
+
+def play(path, episodes, seed=100, last_steps=None):
+    """
+    Log seeded episodes with random actions
+
+    :return: The observations and rewards of every episode, starting with the reset state
+    """
+    env = TrajectoryLogger(ShooterEnv(render_mode=None), str(path), seed=seed)
+    rng = np.random.default_rng(seed)
+    played = []
+    for episode in range(episodes):
+        observations, rewards = [env.reset()], []
+        done = False
+        while not done and (episode < episodes - 1 or last_steps is None or len(rewards) < last_steps):
+            observation, reward, done, _ = env.step(int(rng.integers(8)))
+            observations.append(observation)
+            rewards.append(reward)
+        played.append((np.array(observations), rewards))
+    env.close()
+    return played
+
+
+def test_logged_episodes_replay_exactly(tmp_path):
+    path = tmp_path / 'episodes.log'
+    played = play(path, 3)
+
+    episodes = read_trajectories(str(path))
+    assert [seed for seed, _, _ in episodes] == [100, 101, 102]
+    replayer = Replayer(str(path))
+    assert len(replayer) == 3
+    for index, (observations, rewards) in enumerate(played):
+        assert replayer.verify(index)
+        replayed = list(replayer.replay(index))
+        assert np.array_equal(np.array([observation for observation, _, _, _ in replayed]), observations)
+        assert [reward for _, reward, _, _ in replayed][1:] == rewards
+        assert replayed[-1][2]
+    replayer.close()
+
+
+def test_unfinished_episode_is_logged_on_close(tmp_path):
+    path = tmp_path / 'episodes.log'
+    played = play(path, 2, last_steps=20)
+    replayer = Replayer(str(path))
+    assert [len(actions) for _, actions, _ in replayer.episodes] == [len(played[0][1]), 20]
+    assert replayer.verify(1)
+    frames = replayer.frames(1)
+    assert frames.shape == (21, 600, 600, 3)
+
+
+def test_log_truncated_mid_episode(tmp_path):
+    path = tmp_path / 'episodes.log'
+    played = play(path, 3)
+    data = path.read_bytes()
+    # cut the last record in the middle of its rewards, as a crash while writing would
+    last = len(played[2][1])
+    path.write_bytes(data[:len(data) - 2 * last])
+
+    replayer = Replayer(str(path))
+    assert len(replayer) == 2
+    for index in range(2):
+        assert replayer.verify(index)
+    # a new logger appends after the complete records
+    path.write_bytes(data[:len(data) - 5 * last - 12])
+    play(path, 1, seed=102)
+    assert read_trajectories(str(path))[-1][0] == 102
+    assert Replayer(str(path)).verify(2)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'episodes.log'
+    path.write_bytes(b'not a log' + MAGIC)
+    with pytest.raises(ValueError):
+        read_trajectories(str(path))
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from envs.entities import Enemy
+from envs.shooterEnv import ShooterEnv
+from envs.vectorShooterEnv import VectorShooterEnv
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_single_arena_matches_scalar_env(seed):
+    # one arena draws its spawn points from the same generator as ShooterEnv, so whole trajectories agree
+    vector = VectorShooterEnv(1, seed=seed)
+    scalar = ShooterEnv(render_mode=None)
+    scalar.seed(seed)
+    assert np.array_equal(vector.reset()[0], scalar.reset())
+
+    rng = np.random.default_rng(seed)
+    episodes = 0
+    for _ in range(2000):
+        action = int(rng.integers(8))
+        observations, rewards, dones, info = vector.step([action])
+        observation, reward, done, _ = scalar.step(action)
+        assert np.array_equal(info['terminal_observation'][0], observation)
+        assert rewards[0] == reward
+        assert dones[0] == done
+        if done:
+            episodes += 1
+            assert np.array_equal(observations[0], scalar.reset())
+    assert episodes > 0
+
+
+def test_arenas_observe_like_scalar_env():
+    vector = VectorShooterEnv(8, seed=3)
+    scalar = ShooterEnv(render_mode=None)
+    scalar.reset()
+    rng = np.random.default_rng(3)
+    for _ in range(500):
+        actions = rng.integers(8, size=8)
+        observations, _, dones, _ = vector.step(actions)
+        for k in np.flatnonzero(~dones).tolist():
+            # the same scene in the scalar env
+            scalar.player.x, scalar.player.y = vector.player_x[k], vector.player_y[k]
+            alive = vector.enemy_alive[k]
+            scalar.enemies = [Enemy((x, y)) for x, y in zip(vector.enemy_x[k, alive], vector.enemy_y[k, alive])]
+            scalar.make_observations(int(actions[k]))
+            assert np.array_equal(scalar.state, observations[k])
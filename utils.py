@@ -1,18 +1,16 @@
 from envs.param import *
 
-from PIL import Image
-from PIL import ImageDraw
-import matplotlib.pyplot as plt 
 import numpy as np
 
-def translate_state(state): # translating the state of the game 
-    state_num = 0
-    for i in range(3, 3+2*N_OBSERVATIONS-1, 2):
-        state_num += pow(2, (i-3)//2) * state[i]
+# PIL and matplotlib are imported by the functions using them, so that importing utils stays cheap
 
-    return state_num
+def translate_state(state): # translating the state of the game 
+    # the enemy flag of ray k is bit k
+    return int(np.dot(state[3:3+2*N_OBSERVATIONS:2], 2 ** np.arange(N_OBSERVATIONS)))
 
 def label_with_episode(frame, episode): # plotting the image 
+    from PIL import Image, ImageDraw
+
     im = Image.fromarray(frame)
     
     drawer = ImageDraw.Draw(im)
@@ -20,13 +18,16 @@ def label_with_episode(frame, episode): # plotting the image
     return im
 
 def plotLearning(x, scores, filename, lines=None):
+    import matplotlib.pyplot as plt
+
     fig=plt.figure()
     ax=fig.add_subplot(111, label="1")
 
+    # mean of the last 21 scores, from prefix sums
     N = len(scores)
-    running_avg = np.empty(N)
-    for t in range(N):
-        running_avg[t] = np.mean(scores[max(0, t-20):(t+1)])
+    sums = np.concatenate([[0.], np.cumsum(scores, dtype=np.float64)])
+    start = np.maximum(0, np.arange(N) - 20)
+    running_avg = (sums[1:] - sums[start]) / (np.arange(1, N + 1) - start)
 
     ax.plot(x, running_avg, color="C1")
     ax.set_xlabel('Epochs')